@@ -0,0 +1,44 @@
+"""Production serving: gunicorn with uvicorn workers (run from app/).
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master (preload) and read-only data is loaded
+there before the workers are forked, so all workers share it copy-on-write;
+the warm query embeddings are additionally memory-mapped from disk.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5051')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+# Restart each worker after this many requests (with jitter, so they do not all restart at once)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+# The playlist cache is per process unless it is shared through Redis; with
+# several workers a write would only invalidate the worker that handled it
+if workers > 1 and not os.getenv("PLAYLIST_CACHE_REDIS_URL"):
+    os.environ.setdefault("PLAYLIST_CACHE_SIZE", "0")
+    print("[Gunicorn] PLAYLIST_CACHE_REDIS_URL not set; playlist caching disabled for multiple workers")
+
+# /search/page cursors are per process without Redis, and gunicorn cannot route a
+# client back to the same worker: a next-page request on another worker gets a 410
+if workers > 1 and not (os.getenv("SEARCH_CURSOR_REDIS_URL") or os.getenv("PLAYLIST_CACHE_REDIS_URL")):
+    print("[Gunicorn] WARNING: search cursors are per worker; set SEARCH_CURSOR_REDIS_URL "
+          "(or PLAYLIST_CACHE_REDIS_URL) or /search/page will fail with 410 across workers")
+
+
+def when_ready(server):
+    """Runs in the master after the preload, before any worker is forked."""
+    import main
+    main.load_shared_data()
+    # Move everything loaded so far out of the garbage collector's reach, so GC
+    # passes in the workers do not write to (and thereby copy) the shared pages
+    gc.freeze()
@@ -2,94 +2,55 @@
 import sys
 import sys
 import os
+import json
 import time
+import threading
+from contextlib import asynccontextmanager
 from typing import List, Optional
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import uvicorn
 import requests
 import mysql.connector
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch, ConnectionError as ESConnectionError
-from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi import FastAPI, HTTPException, Request, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from fastapi.responses import RedirectResponse
 load_dotenv()
 
-from services.search import search as hybrid_search
+from services.search import search as hybrid_search, search_many, search_page, CursorExpired, check_index_manifest, load_warm_cache
+from services.songs import get_song_enrichment
+from services.song_store import song_store
+from services.db import get_db_connection
+from services import playlists as playlist_store
+from services import metrics
+from services.clients import get_es, close_clients
+from services.resilience import CircuitBreaker, CircuitOpenError, degrade, request_degradations
+from services.search import embed, cursor_store as search_cursors, EMBED_BREAKER, KEYWORD_BREAKER, ES_BREAKER
 # ──────────────────────────────────────────── env & clients
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-ES_HOST = os.getenv("ELASTICSEARCH_HOST")
 ES_INDEX = os.getenv("ELASTICSEARCH_INDEX", "songs")  # Default value retained
 
-# MySQL database configuration
-DB_HOST = os.getenv("DB_HOST", "localhost")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME", "musicoset")
-
 # Spotify credentials
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 SPOTIFY_REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI")
 
-def init_es(host: str, retries: int = 5, wait: int = 5) -> Optional[Elasticsearch]:
-    """Initialize Elasticsearch connection with retries."""
-    for attempt in range(retries):
-        try:
-            es = Elasticsearch(host)
-            if es.ping():
-                print(f"[ES] Connected on attempt {attempt + 1}")
-                return es
-        except ESConnectionError:
-            pass
-        print(f"[ES] Retry {attempt + 1}/{retries} to connect to {host}…")
-        time.sleep(wait)
-    print("[ES] Failed to connect to Elasticsearch; health ping will be unavailable.")
-    return None
-
-es_client: Optional[Elasticsearch] = init_es(ES_HOST)
-
-def get_db_connection():
-    """Get MySQL database connection."""
-    try:
-        return mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME
-        )
-    except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        return None
-
-def create_tables_if_not_exists():
+def create_tables_if_not_exists() -> bool:
     """Create playlist tables if they don't exist."""
     try:
         conn = get_db_connection()
         if not conn:
-            return
+            return False
         
         cursor = conn.cursor()
         
-        # Create user_playlists table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_playlists (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_id VARCHAR(255) NOT NULL,
-                playlist_name VARCHAR(255) NOT NULL,
-                song_data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                INDEX idx_user_id (user_id),
-                INDEX idx_playlist_name (playlist_name),
-                INDEX idx_user_playlist (user_id, playlist_name)
-            )
-        """)
+        # Create playlists / playlist_items tables
+        playlist_store.create_playlist_tables(cursor)
         
         # Create users table
         cursor.execute("""
@@ -109,17 +70,131 @@ def create_tables_if_not_exists():
         conn.close()
         
         print("✅ Database tables created successfully!")
+        return True
         
     except mysql.connector.Error as e:
         print(f"❌ Error creating tables: {e}")
     except Exception as e:
         print(f"❌ Error: {e}")
+    return False
+
+# ──────────────────────────────────────────── startup
+# Slow startup work (network round trips, retries, file loads) runs in a
+# background thread started by the lifespan, so a worker accepts connections
+# immediately; GET /ready reports when it has finished.
+STARTUP_ES_RETRIES = int(os.getenv("STARTUP_ES_RETRIES", "5"))
+STARTUP_ES_RETRY_WAIT = float(os.getenv("STARTUP_ES_RETRY_WAIT", "5"))
+
+startup_checks = {"elasticsearch": False, "index_manifest": False, "mysql_tables": False,
+                  "warm_cache": False, "song_store": False}
+startup_errors: List[str] = []
+startup_done = threading.Event()
+
+def wait_for_es(retries: int = STARTUP_ES_RETRIES, wait: float = STARTUP_ES_RETRY_WAIT) -> bool:
+    """Ping Elasticsearch until it answers, up to `retries` times."""
+    for attempt in range(retries):
+        try:
+            if get_es().ping():
+                print(f"[ES] Connected on attempt {attempt + 1}")
+                return True
+        except Exception:
+            pass
+        print(f"[ES] Retry {attempt + 1}/{retries} to connect…")
+        time.sleep(wait)
+    print("[ES] Failed to connect to Elasticsearch; /ready will report it.")
+    return False
+
+def record_startup_error(message: str) -> None:
+    print(f"❌ {message}")
+    if message not in startup_errors:  # checks are repeated by /ready
+        startup_errors.append(message)
+
+def check_search_index():
+    """Not ready if the index was built with a different embedding model/dims
+    (or could not be read; /ready checks again)."""
+    try:
+        check_index_manifest(ES_INDEX)
+        startup_checks["index_manifest"] = True
+    except RuntimeError as e:
+        record_startup_error(str(e))
+    except Exception as e:
+        record_startup_error(f"Index manifest check failed: {type(e).__name__} - {e}")
+
+shared_data_loaded = False
+
+def load_shared_data():
+    """Read-only data used by every request. The gunicorn master calls this before
+    forking (gunicorn.conf.py) so workers share one copy; otherwise it runs with
+    the startup checks."""
+    global shared_data_loaded
+    # Precomputed embeddings / keywords for frequent prompts (scripts/warm_query_cache.py)
+    load_warm_cache()
+    startup_checks["warm_cache"] = True
+    # Enrichment fields of every song; until this succeeds they come from MySQL per search
+    startup_checks["song_store"] = reload_song_store()
+    shared_data_loaded = True
+
+# Seconds between checks for changed enrichment data (0 = only reload via the endpoint)
+SONG_STORE_POLL_SECONDS = float(os.getenv("SONG_STORE_POLL_SECONDS", "300"))
+stop_polling = threading.Event()
+
+def reload_song_store(only_if_changed: bool = False) -> bool:
+    """Load the song store from MySQL; False if the database is unavailable."""
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        if only_if_changed:
+            song_store.refresh_if_changed(conn)
+        else:
+            song_store.load(conn)
+        return True
+    except mysql.connector.Error as e:
+        print(f"[SongStore] Reload failed: {e}")
+        return False
+    finally:
+        conn.close()
+
+def poll_song_store():
+    while not stop_polling.wait(SONG_STORE_POLL_SECONDS):
+        reload_song_store(only_if_changed=True)
+
+def run_startup_checks():
+    """Each check runs on its own, so one failing does not skip the others."""
+    def es_checks():
+        startup_checks["elasticsearch"] = wait_for_es()
+        if startup_checks["elasticsearch"]:
+            check_search_index()
+
+    def mysql_tables():
+        startup_checks["mysql_tables"] = create_tables_if_not_exists()
+
+    def shared_data():
+        if not shared_data_loaded:
+            load_shared_data()
+
+    for check in (es_checks, mysql_tables, shared_data):
+        try:
+            check()
+        except Exception as e:
+            record_startup_error(f"Startup check {check.__name__} failed: {type(e).__name__} - {e}")
+    startup_done.set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=run_startup_checks, name="startup-checks", daemon=True).start()
+    if SONG_STORE_POLL_SECONDS > 0:
+        threading.Thread(target=poll_song_store, name="song-store-poll", daemon=True).start()
+    yield
+    stop_polling.set()
+    close_clients()
 
 # ──────────────────────────────────────────── FastAPI app
 app = FastAPI(
     title="MelodyMind API",
     description="Hybrid vector/BM25 music search powered by OpenAI + Elasticsearch.",
     version="2.0.0",
+    lifespan=lifespan,
 )
 
 origins = [origin.strip() for origin in os.getenv("CORS_ORIGINS", "").split(",") if origin.strip()]
@@ -129,12 +204,35 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-Degraded"],
 )
 
-# Initialize database tables
-create_tables_if_not_exists()
+# Per-stage breakdown of each request as a Server-Timing header (off by default)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    timings, degradations = {}, []
+    token = metrics.request_timings.set(timings)
+    degraded_token = request_degradations.set(degradations)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.request_timings.reset(token)
+        request_degradations.reset(degraded_token)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.REQUEST_SECONDS.observe(elapsed, request.method, getattr(route, "path", "unmatched"),
+                                    str(response.status_code))
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.server_timing_header({**timings, "total": elapsed})
+    if degradations:
+        # Optional stages that were skipped, e.g. "no_keywords, no_enrichment"
+        response.headers["X-Degraded"] = ", ".join(degradations)
+    return response
 
 # ──────────────────────────────────────────── pydantic models
 class SearchRequest(BaseModel):
@@ -146,7 +244,17 @@ class SearchRequest(BaseModel):
     popularity_min: Optional[int] = None
     popularity_max: Optional[int] = None
 
+MAX_BATCH_SEARCHES = int(os.getenv("MAX_BATCH_SEARCHES", "50"))
+
+class SearchPageRequest(SearchRequest):
+    prompt: Optional[str] = None  # required on the first page
+    cursor: Optional[str] = None  # next_cursor of the previous page (prompt / filters are then ignored)
+
+class BatchSearchRequest(BaseModel):
+    requests: List[SearchRequest]
+
 class SongResult(BaseModel):
+    song_id: Optional[str] = None
     title: str
     artist: str
     score: float
@@ -159,10 +267,27 @@ class SongResult(BaseModel):
     lyrics: Optional[str] = None
     reason: Optional[str] = None
 
+class SearchPage(BaseModel):
+    results: List[SongResult]
+    next_cursor: Optional[str] = None
+
 class PlaylistRequest(BaseModel):
     user_id: str
     playlist_name: str
     songs: List[dict] = []
+    version: Optional[int] = None  # expected version (alternative to If-Match)
+
+class PlaylistOperation(BaseModel):
+    op: str                            # "add" | "remove" | "move"
+    index: Optional[int] = None        # add: insert before this index (default: append); remove: first index
+    songs: List[dict] = []             # add
+    count: int = Field(1, ge=1)        # remove
+    from_index: Optional[int] = None   # move
+    to_index: Optional[int] = None     # move
+
+class PlaylistPatchRequest(BaseModel):
+    operations: List[PlaylistOperation]
+    version: Optional[int] = None  # expected version (alternative to If-Match)
 
 class PlaylistResponse(BaseModel):
     message: str
@@ -171,119 +296,206 @@ class PlaylistResponse(BaseModel):
 # ──────────────────────────────────────────── endpoints
 @app.get("/", summary="Health check")
 def health():
+    try:
+        es_connected = get_es().ping()
+    except Exception:
+        es_connected = False
     return {
         "status": "ok",
-        "elasticsearch_connected": es_client.ping() if es_client else False,
+        "elasticsearch_connected": es_connected,
         "openai_key_loaded": bool(OPENAI_API_KEY),
     }
 
-@app.post("/search", response_model=List[SongResult], summary="Hybrid search")
-def api_search(req: SearchRequest):
-    try:
-        # Build filter conditions for Elasticsearch
-        filters = []
-        
-        # Energy filter
-        if req.energy_min is not None or req.energy_max is not None:
-            energy_range = {}
-            if req.energy_min is not None:
-                energy_range["gte"] = req.energy_min
-            if req.energy_max is not None:
-                energy_range["lte"] = req.energy_max
-            filters.append({"range": {"energy": energy_range}})
-        
-        # Artist filter
-        if req.artist:
-            filters.append({"match": {"name_artists": req.artist}})
-        
-        # Popularity filter
-        if req.popularity_min is not None or req.popularity_max is not None:
-            popularity_range = {}
-            if req.popularity_min is not None:
-                popularity_range["gte"] = req.popularity_min
-            if req.popularity_max is not None:
-                popularity_range["lte"] = req.popularity_max
-            filters.append({"range": {"popularity": popularity_range}})
-        
-        hits = hybrid_search(req.prompt, req.size, filters)
-    except Exception as e:
-        print(f"Unhandled exception in hybrid_search: {type(e).__name__} - {e}")
-        raise HTTPException(status_code=500, detail=f"Search backend error: {str(e)}")
+@app.get("/live", summary="Liveness probe")
+def live():
+    """The process is up and serving requests (no dependency checks)."""
+    return {"status": "ok"}
+
+@app.get("/ready", summary="Readiness probe")
+def ready():
+    """200 once startup checks have passed (Elasticsearch reachable, index matches
+    the embedding model); 503 while they are still running or if they failed."""
+    if startup_done.is_set() and not startup_checks["elasticsearch"] and wait_for_es(retries=1, wait=0):
+        # Elasticsearch came up after the startup retries ran out
+        startup_checks["elasticsearch"] = True
+    if startup_done.is_set() and startup_checks["elasticsearch"] and not startup_checks["index_manifest"]:
+        # Not checked yet, failed to read, or mismatched (and maybe reindexed since)
+        check_search_index()
+    is_ready = startup_done.is_set() and startup_checks["elasticsearch"] and startup_checks["index_manifest"]
+    body = {
+        "status": "ready" if is_ready else ("failed" if startup_done.is_set() else "starting"),
+        "checks": startup_checks,
+        "errors": startup_errors,
+    }
+    return JSONResponse(status_code=200 if is_ready else 503, content=body)
 
-    # Get additional data from MySQL
-    db_conn = get_db_connection()
-    song_data = {}
+def build_filters(req: SearchRequest) -> list:
+    """Build filter conditions for Elasticsearch"""
+    filters = []
+    
+    # Energy filter
+    if req.energy_min is not None or req.energy_max is not None:
+        energy_range = {}
+        if req.energy_min is not None:
+            energy_range["gte"] = req.energy_min
+        if req.energy_max is not None:
+            energy_range["lte"] = req.energy_max
+        filters.append({"range": {"energy": energy_range}})
+    
+    # Artist filter
+    if req.artist:
+        filters.append({"match": {"name_artists": req.artist}})
     
-    if db_conn:
+    # Popularity filter
+    if req.popularity_min is not None or req.popularity_max is not None:
+        popularity_range = {}
+        if req.popularity_min is not None:
+            popularity_range["gte"] = req.popularity_min
+        if req.popularity_max is not None:
+            popularity_range["lte"] = req.popularity_max
+        filters.append({"range": {"popularity": popularity_range}})
+    return filters
+
+def hit_song_ids(hits: list) -> List[str]:
+    return [h.get("_source", {}).get("song_id") for h in hits if h.get("_source", {}).get("song_id")]
+
+# Enrichment is optional: results fall back to the Elasticsearch fields when MySQL is slow or down
+MYSQL_QUERY_TIMEOUT_MS = int(os.getenv("MYSQL_QUERY_TIMEOUT_MS", "1000"))
+MYSQL_BREAKER = CircuitBreaker("mysql")
+
+def get_song_data(song_ids: List[str]) -> dict:
+    """Get additional data (release_date, youtube_music_url, energy) from the
+    in-memory song store, or from MySQL while the store is not loaded."""
+    if not song_ids:
+        return {}
+    if song_store.loaded:
+        with metrics.timed("song_store_lookup"):
+            return song_store.lookup(song_ids)
+
+    def query():
+        db_conn = get_db_connection()
+        if not db_conn:
+            raise ConnectionError("MySQL connection failed")
         try:
-            cursor = db_conn.cursor(dictionary=True)
-            song_ids = [h.get("_source", {}).get("song_id") for h in hits if h.get("_source", {}).get("song_id")]
-            
-            if song_ids:
-                # Get release dates from tracks table
-                placeholders = ",".join(["%s"] * len(song_ids))
-                release_query = f"""
-                SELECT song_id, release_date 
-                FROM tracks 
-                WHERE song_id IN ({placeholders})
-                """
-                cursor.execute(release_query, song_ids)
-                release_data = {row["song_id"]: row["release_date"] for row in cursor.fetchall()}
-                
-                # Get YouTube Music URLs from melodymind_song_links table
-                youtube_query = f"""
-                SELECT song_id, youtube_music_url 
-                FROM melodymind_song_links 
-                WHERE song_id IN ({placeholders})
-                """
-                cursor.execute(youtube_query, song_ids)
-                youtube_data = {row["song_id"]: row["youtube_music_url"] for row in cursor.fetchall()}
-                
-                # Get energy from acoustic_features table
-                energy_query = f"""
-                SELECT song_id, energy 
-                FROM acoustic_features 
-                WHERE song_id IN ({placeholders})
-                """
-                cursor.execute(energy_query, song_ids)
-                energy_data = {row["song_id"]: float(row["energy"]) if row["energy"] else None for row in cursor.fetchall()}
-                
-                # Combine all data
-                for song_id in song_ids:
-                    song_data[song_id] = {
-                        "release_date": release_data.get(song_id),
-                        "youtube_music_url": youtube_data.get(song_id),
-                        "energy": energy_data.get(song_id)
-                    }
-            
-            cursor.close()
-        except mysql.connector.Error as e:
-            print(f"Error querying MySQL: {e}")
+            with metrics.timed("mysql_enrichment"):
+                return get_song_enrichment(db_conn, song_ids, timeout_ms=MYSQL_QUERY_TIMEOUT_MS)
         finally:
             db_conn.close()
 
-    results: List[SongResult] = []
-    for h in hits:
-        source = h.get("_source", {})
-        song_id = source.get("song_id")
-        additional_data = song_data.get(song_id, {})
-
-        results.append(
-            SongResult(
-                title=source.get("song_name", "Unknown Title"),
-                artist=source.get("name_artists", "Unknown Artist"),
-                score=h.get("_score", 0.0),
-                matched_queries=h.get("matched_queries", []),
-                spotify_url=source.get("spotify_url"),
-                youtube_music_url=additional_data.get("youtube_music_url") or source.get("youtube_music_url"),
-                popularity=source.get("popularity"),
-                release_date=additional_data.get("release_date") or source.get("release_date"),
-                energy=additional_data.get("energy") or source.get("energy"),
-                lyrics=source.get("lyrics"),
-                reason=source.get("reason"),
-            )
-        )
-    return results
+    try:
+        # Any error (not only mysql.connector.Error) counts as a failure, so a
+        # half-open trial is always recorded
+        return MYSQL_BREAKER.call(query)
+    except Exception as e:
+        degrade("no_enrichment", e)
+        return {}
+
+def search_backend_error(e: Exception, operation: str) -> HTTPException:
+    """503 while the Elasticsearch circuit is open (clients should retry later), 500 otherwise."""
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=f"Search temporarily unavailable: {e}",
+                             headers={"Retry-After": str(int(ES_BREAKER.reset_timeout))})
+    print(f"Unhandled exception in {operation}: {type(e).__name__} - {e}")
+    return HTTPException(status_code=500, detail=f"Search backend error: {str(e)}")
+
+def to_song_result(h: dict, song_data: dict) -> SongResult:
+    source = h.get("_source", {})
+    song_id = source.get("song_id")
+    additional_data = song_data.get(song_id, {})
+    return SongResult(
+        song_id=song_id,
+        title=source.get("song_name", "Unknown Title"),
+        artist=source.get("name_artists", "Unknown Artist"),
+        score=h.get("_score", 0.0),
+        matched_queries=h.get("matched_queries", []),
+        spotify_url=source.get("spotify_url"),
+        youtube_music_url=additional_data.get("youtube_music_url") or source.get("youtube_music_url"),
+        popularity=source.get("popularity"),
+        release_date=additional_data.get("release_date") or source.get("release_date"),
+        energy=additional_data.get("energy") or source.get("energy"),
+        lyrics=source.get("lyrics"),
+        reason=source.get("reason"),
+    )
+
+@app.post("/search", response_model=List[SongResult], summary="Hybrid search")
+def api_search(req: SearchRequest):
+    try:
+        hits = hybrid_search(req.prompt, req.size, build_filters(req))
+    except Exception as e:
+        raise search_backend_error(e, "hybrid_search")
+
+    song_data = get_song_data(hit_song_ids(hits))
+    with metrics.timed("serialize"):
+        return [to_song_result(h, song_data) for h in hits]
+
+@app.post("/search/page", response_model=SearchPage, summary="Hybrid search, one page at a time")
+def api_search_page(req: SearchPageRequest):
+    """Paginated search: send `next_cursor` back to get the following page.
+
+    Embedding, keyword expansion and the kNN search run once, on the first page;
+    later pages only run the lexical query from an Elasticsearch point-in-time,
+    so deep pages cost about the same as the first. Cursors expire after
+    SEARCH_CURSOR_TTL_SECONDS of inactivity.
+    """
+    if not req.cursor and not req.prompt:
+        raise HTTPException(status_code=400, detail="Either prompt or cursor is required")
+    try:
+        hits, next_cursor = search_page(req.prompt, req.size, build_filters(req), cursor=req.cursor)
+    except CursorExpired:
+        raise HTTPException(status_code=410, detail="Search cursor expired; start again without a cursor")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise search_backend_error(e, "search_page")
+
+    song_data = get_song_data(hit_song_ids(hits))
+    with metrics.timed("serialize"):
+        return SearchPage(results=[to_song_result(h, song_data) for h in hits], next_cursor=next_cursor)
+
+def search_events(hits: list):
+    """Events of a streamed search: every hit with its ES fields first, then one
+    patch per song with the fields MySQL adds, then "done"."""
+    for i, h in enumerate(hits):
+        yield {"type": "result", "index": i, "result": to_song_result(h, {}).model_dump()}
+    song_data = get_song_data(hit_song_ids(hits))
+    for i, h in enumerate(hits):
+        fields = {k: v for k, v in song_data.get(h.get("_source", {}).get("song_id"), {}).items() if v}
+        if fields:
+            yield {"type": "patch", "index": i, "fields": fields}
+    yield {"type": "done", "count": len(hits)}
+
+@app.post("/search/stream", summary="Hybrid search, streamed")
+def api_search_stream(req: SearchRequest, format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    """Stream results as NDJSON lines (default) or Server-Sent Events (`format=sse`).
+
+    Results are sent as soon as Elasticsearch answers; release_date /
+    youtube_music_url / energy follow as `patch` events keyed by result index.
+    """
+    try:
+        hits = hybrid_search(req.prompt, req.size, build_filters(req))
+    except Exception as e:
+        raise search_backend_error(e, "hybrid_search")
+
+    if format == "sse":
+        body = (f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n" for event in search_events(hits))
+        return StreamingResponse(body, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    body = (json.dumps(event, default=str) + "\n" for event in search_events(hits))
+    return StreamingResponse(body, media_type="application/x-ndjson")
+
+@app.post("/search/batch", response_model=List[List[SongResult]], summary="Hybrid search for several prompts")
+def api_search_batch(batch: BatchSearchRequest):
+    """Run several searches at once: one embeddings call, one ES _msearch and one
+    MySQL enrichment query over all hits. Results are in request order."""
+    if len(batch.requests) > MAX_BATCH_SEARCHES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SEARCHES} searches per batch")
+    try:
+        hits_per_request = search_many([(req.prompt, req.size, build_filters(req)) for req in batch.requests])
+    except Exception as e:
+        raise search_backend_error(e, "search_many")
+
+    song_data = get_song_data([song_id for hits in hits_per_request for song_id in hit_song_ids(hits)])
+    with metrics.timed("serialize"):
+        return [[to_song_result(h, song_data) for h in hits] for hits in hits_per_request]
 
 @app.get("/search", response_model=List[SongResult], summary="Hybrid search via GET")
 def api_search_get(
@@ -349,72 +561,166 @@ def spotify_callback(request: Request):
 
 # ──────────────────────────────────────────── Playlist Management APIs
 
-@app.get("/playlists/{user_id}", summary="Get user playlists")
-async def get_user_playlists(user_id: str):
-    """Get all playlists for a specific user."""
+def expected_playlist_version(if_match: Optional[str], body_version: Optional[int]) -> Optional[int]:
+    """Version the client expects, from an If-Match ETag ("3" / W/"3") or the request body."""
+    if if_match and if_match.strip() != "*":
+        try:
+            return int(if_match.strip().removeprefix("W/").strip('"'))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid If-Match header: {if_match}")
+    return body_version
+
+def playlist_conflict(e: playlist_store.VersionConflict) -> HTTPException:
+    return HTTPException(
+        status_code=412,
+        detail={"error": str(e), "version": e.current_version},
+        headers={"ETag": f'"{e.current_version}"'},
+    )
+
+def with_db_connection(fn, *args, **kwargs):
+    """Run fn(conn, *args, **kwargs) on a fresh connection (used as a cache loader)."""
+    conn = get_db_connection()
+    if not conn:
+        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
-        conn = get_db_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Database connection failed")
-        
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM user_playlists WHERE user_id = %s", (user_id,))
-        playlists = cursor.fetchall()
-        
-        cursor.close()
+        return fn(conn, *args, **kwargs)
+    finally:
         conn.close()
-        
-        # Format the response
-        user_playlists = {}
-        for playlist in playlists:
-            playlist_name = playlist['playlist_name']
-            if playlist_name not in user_playlists:
-                user_playlists[playlist_name] = []
-            
-            if playlist['song_data']:
-                import json
-                song_data = json.loads(playlist['song_data'])
-                user_playlists[playlist_name].append(song_data)
-        
-        return {"playlists": user_playlists}
+
+@app.get("/playlists/{user_id}", summary="Get user playlists")
+async def get_user_playlists(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    full: bool = Query(False, description="Return every playlist with all songs (legacy response)"),
+):
+    """List a user's playlists as summaries (name, song_count, version, updated_at).
+
+    Songs are fetched per playlist from /playlists/{user_id}/{playlist_name}/songs.
+    """
+    cache = playlist_store.playlist_cache
+    try:
+        if full:
+            return {"playlists": cache.get_or_load(
+                user_id, ("full",), lambda: with_db_connection(playlist_store.get_user_playlists, user_id)
+            )}
+        summaries = cache.get_or_load(
+            user_id, ("summaries",), lambda: with_db_connection(playlist_store.get_playlist_summaries, user_id)
+        )
+
+        if cursor is not None:
+            after = playlist_store.name_sort_key(cursor)
+            summaries = [summary for summary in summaries if playlist_store.name_sort_key(summary["name"]) > after]
+        page = summaries[:limit]
+        return {
+            "playlists": page,
+            "next_cursor": page[-1]["name"] if len(summaries) > limit else None,
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting playlists: {e}")
         raise HTTPException(status_code=500, detail="Failed to get playlists")
 
+@app.get("/playlists/{user_id}/{playlist_name}/songs", summary="Get one page of a playlist")
+async def get_playlist_songs(
+    user_id: str,
+    playlist_name: str,
+    response: Response,
+    limit: int = Query(playlist_store.DEFAULT_PAGE_SIZE, ge=1, le=playlist_store.MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated song fields, e.g. title,artist"),
+):
+    """Songs of a playlist in order, `limit` at a time; only the returned page is hydrated."""
+    try:
+        after = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    try:
+        page = playlist_store.playlist_cache.get_or_load(
+            user_id,
+            ("songs", playlist_name, after, limit, tuple(field_list or ())),
+            lambda: with_db_connection(playlist_store.get_playlist_items, user_id, playlist_name,
+                                       after=after, limit=limit, fields=field_list),
+        )
+
+        response.headers["ETag"] = f'"{page["version"]}"'
+        return page
+    except playlist_store.PlaylistNotFound:
+        raise HTTPException(status_code=404, detail=f"Playlist not found: {playlist_name}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting playlist songs: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get playlist songs")
+
 @app.post("/playlists", summary="Create or update playlist")
-async def create_or_update_playlist(playlist: PlaylistRequest):
-    """Create a new playlist or update an existing one."""
+async def create_or_update_playlist(playlist: PlaylistRequest, response: Response,
+                                    if_match: Optional[str] = Header(None)):
+    """Create a new playlist or update an existing one (only changed items are written)."""
+    expected_version = expected_playlist_version(if_match, playlist.version)
     try:
         conn = get_db_connection()
         if not conn:
             raise HTTPException(status_code=500, detail="Database connection failed")
         
-        cursor = conn.cursor()
-        
-        # First, delete existing songs in this playlist
-        cursor.execute("DELETE FROM user_playlists WHERE user_id = %s AND playlist_name = %s", 
-                      (playlist.user_id, playlist.playlist_name))
-
-        import json
-        if playlist.songs:
-            for song in playlist.songs:
-                song_data = json.dumps(song)
-                cursor.execute(
-                    "INSERT INTO user_playlists (user_id, playlist_name, song_data) VALUES (%s, %s, %s)",
-                    (playlist.user_id, playlist.playlist_name, song_data)
-                )
-        
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        return {"message": "Playlist saved successfully"}
+        try:
+            version = playlist_store.save_playlist(conn, playlist.user_id, playlist.playlist_name, playlist.songs,
+                                                   expected_version=expected_version)
+        finally:
+            conn.close()
+
+        response.headers["ETag"] = f'"{version}"'
+        return {"message": "Playlist saved successfully", "version": version}
+    except playlist_store.VersionConflict as e:
+        raise playlist_conflict(e)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error saving playlist: {e}")
         raise HTTPException(status_code=500, detail="Failed to save playlist")
 
+@app.patch("/playlists/{user_id}/{playlist_name}", summary="Add, remove or move songs")
+async def patch_playlist(user_id: str, playlist_name: str, patch: PlaylistPatchRequest, response: Response,
+                         if_match: Optional[str] = Header(None)):
+    """Apply add / remove / move operations in one transaction.
+
+    Indexes are 0-based and refer to the playlist as left by the previous operation.
+    Only the affected rows are written. Send the last seen version (If-Match or
+    `version`) to get 412 instead of overwriting a concurrent change.
+    """
+    expected_version = expected_playlist_version(if_match, patch.version)
+    operations = [operation.model_dump() for operation in patch.operations]
+    try:
+        conn = get_db_connection()
+        if not conn:
+            raise HTTPException(status_code=500, detail="Database connection failed")
+
+        try:
+            version, song_count = playlist_store.edit_playlist(
+                conn, user_id, playlist_name, operations, expected_version=expected_version
+            )
+        finally:
+            conn.close()
+
+        response.headers["ETag"] = f'"{version}"'
+        return {"message": "Playlist updated successfully", "version": version, "song_count": song_count}
+    except playlist_store.VersionConflict as e:
+        raise playlist_conflict(e)
+    except playlist_store.PlaylistNotFound:
+        raise HTTPException(status_code=404, detail=f"Playlist not found: {playlist_name}")
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid playlist operation: {e}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error updating playlist: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update playlist")
+
 @app.delete("/playlists/{user_id}/{playlist_name}", summary="Delete playlist")
 async def delete_playlist(user_id: str, playlist_name: str):
     """Delete a specific playlist."""
@@ -423,13 +729,10 @@ async def delete_playlist(user_id: str, playlist_name: str):
         if not conn:
             raise HTTPException(status_code=500, detail="Database connection failed")
         
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM user_playlists WHERE user_id = %s AND playlist_name = %s", 
-                      (user_id, playlist_name))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        try:
+            playlist_store.delete_playlist(conn, user_id, playlist_name)
+        finally:
+            conn.close()
         
         return {"message": "Playlist deleted successfully"}
     
@@ -437,9 +740,55 @@ async def delete_playlist(user_id: str, playlist_name: str):
         print(f"Error deleting playlist: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete playlist")
 
+@app.get("/metrics", summary="Prometheus metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Stage / request latency histograms plus cache and circuit breaker gauges, in the Prometheus text format."""
+    embed_cache = embed.cache_info()
+    playlist_cache = playlist_store.playlist_cache.stats()
+    gauges = [
+        metrics.gauge("melodymind_cache_hits", "Cache hits since start", {
+            (("cache", "embed"),): embed_cache.hits,
+            (("cache", "playlists"),): playlist_cache["hits"] + playlist_cache["shared_hits"],
+        }),
+        metrics.gauge("melodymind_cache_misses", "Cache misses since start", {
+            (("cache", "embed"),): embed_cache.misses,
+            (("cache", "playlists"),): playlist_cache["misses"],
+        }),
+        metrics.gauge("melodymind_cache_entries", "Entries currently cached", {
+            (("cache", "embed"),): embed_cache.currsize,
+            (("cache", "playlists"),): playlist_cache["size"],
+            (("cache", "search_cursors"),): len(search_cursors),
+        }),
+        metrics.gauge("melodymind_cache_evictions", "Entries evicted since start", {
+            (("cache", "playlists"),): playlist_cache["evictions"],
+            (("cache", "search_cursors"),): search_cursors.evictions,
+        }),
+        metrics.gauge("melodymind_circuit_breaker_open", "1 while a dependency's circuit is not closed", {
+            (("breaker", breaker.name),): int(breaker.state != "closed")
+            for breaker in (EMBED_BREAKER, KEYWORD_BREAKER, ES_BREAKER, MYSQL_BREAKER)
+        }),
+    ]
+    return PlainTextResponse("\n".join([metrics.render_registry(), *gauges]) + "\n",
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats", summary="Read cache statistics")
+def cache_stats():
+    return {"playlists": playlist_store.playlist_cache.stats(), "song_store": song_store.stats()}
+
+@app.post("/song-store/reload", summary="Reload the in-memory song store")
+def reload_songs():
+    """Reload the enrichment fields after a data load without waiting for the next
+    poll. Only the worker that handles the request reloads; the others pick the
+    change up within SONG_STORE_POLL_SECONDS."""
+    if not reload_song_store():
+        raise HTTPException(status_code=503, detail="Database unavailable; song store not reloaded")
+    return song_store.stats()
+
 # ──────────────────────────────────────────── Health check
 
 # ──────────────────────────────────────────── dev runner
+# (production: gunicorn -c gunicorn.conf.py main:app, see gunicorn.conf.py)
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5051"))
-    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True)
+    reload = os.getenv("UVICORN_RELOAD", "true").lower() in ("1", "true", "yes")
+    uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=reload)
@@ -0,0 +1,95 @@
+"""On-disk cache / replay store for external music API responses.
+
+Responses are stored in SQLite keyed by provider + normalized query (+ request
+params) with a TTL. fetch_song_links.py consults it before every network call,
+so rerunning the matcher after a tweak costs no API calls. In offline mode the
+store is the only source: cache misses behave like "no results", which makes a
+recorded cache usable as a fixture set for local, network-free runs.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query"""
+    return _WHITESPACE.sub(" ", str(query)).strip().casefold()
+
+
+class ResponseCache:
+    """Thread-safe SQLite response store shared by all collector workers"""
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS, offline=False):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                provider TEXT NOT NULL,
+                query_key TEXT NOT NULL,
+                body TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (provider, query_key)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(query, params=None):
+        """Normalized query plus the remaining request params in a stable order"""
+        extra = json.dumps(params, sort_keys=True, default=str) if params else ""
+        return f"{normalize_query(query)}|{extra}"
+
+    def get(self, provider, query, params=None):
+        """Return (hit, response). Expired entries are ignored unless running offline."""
+        key = self.make_key(query, params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, fetched_at FROM responses WHERE provider = ? AND query_key = ?",
+                (provider, key),
+            ).fetchone()
+            hit = bool(row) and (self.offline or time.time() - row[1] < self.ttl_seconds)
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return (True, json.loads(row[0])) if hit else (False, None)
+
+    def put(self, provider, query, response, params=None):
+        """Record a successful response (replaces an older recording)"""
+        if self.offline:
+            return
+        key = self.make_key(query, params)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (provider, query_key, body, fetched_at) VALUES (?, ?, ?, ?)",
+                (provider, key, json.dumps(response), time.time()),
+            )
+            self._conn.commit()
+
+    def prune(self):
+        """Delete entries older than the TTL; returns the number removed.
+        Offline, expired recordings are still replayed, so nothing is deleted."""
+        if self.offline:
+            return 0
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE fetched_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,158 @@
+# ───────────────────────────────────────────────────────────── imports ──
+import argparse
+import os
+import time
+import numpy as np
+from elasticsearch import Elasticsearch, helpers
+from dotenv import load_dotenv
+
+from build_songs_index import VECTOR_INDEX_TYPES, build_index_options, create_index, truncate_embedding
+
+# Load environment variables
+load_dotenv()
+
+ES_URL = os.getenv("ELASTICSEARCH_HOST", "http://elasticsearch:9200")
+ES_INDEX = os.getenv("ELASTICSEARCH_INDEX", "songs")
+
+# ───────────────────────────────────────────────────────────── CLI ──
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(
+        description="Benchmark recall@k and latency of dense_vector index configurations. "
+                    "Vectors are copied from an existing full-dimension index into temporary indices."
+    )
+    ap.add_argument("--es-url", default=ES_URL, help="Elasticsearch URL")
+    ap.add_argument("--source-index", default=ES_INDEX, help="Index holding the full 1536-dim embeddings")
+    ap.add_argument("--types", nargs="+", choices=VECTOR_INDEX_TYPES, default=["hnsw", "int8_hnsw"],
+                    help="index_options.type values to compare")
+    ap.add_argument("--dims", nargs="+", type=int, default=[1536, 768, 512, 256],
+                    help="Embedding dimensions to compare")
+    ap.add_argument("--hnsw-m", type=int, default=None, help="HNSW m for every configuration")
+    ap.add_argument("--hnsw-ef-construction", type=int, default=None, help="HNSW ef_construction for every configuration")
+    ap.add_argument("--k", type=int, default=20, help="Neighbours per query (recall@k)")
+    ap.add_argument("--num-candidates", type=int, default=100, help="kNN num_candidates")
+    ap.add_argument("--queries", type=int, default=200, help="Number of sampled query vectors")
+    ap.add_argument("--max-docs", type=int, default=None, help="Only copy the first N documents")
+    ap.add_argument("--seed", type=int, default=42, help="Random seed for query sampling")
+    ap.add_argument("--keep", action="store_true", help="Keep the benchmark indices afterwards")
+    return ap.parse_args()
+
+# ───────────────────────────────────────────────────────────── data ──
+def load_vectors(es: Elasticsearch, index_name: str, max_docs: int = None):
+    """Read song_id and embedding for every document of the source index."""
+    ids, vectors = [], []
+    query = {"_source": ["song_id", "embedding"], "query": {"exists": {"field": "embedding"}}}
+    for doc in helpers.scan(es, index=index_name, query=query, size=1000):
+        ids.append(doc["_id"])
+        vectors.append(doc["_source"]["embedding"])
+        if max_docs and len(ids) >= max_docs:
+            break
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return ids, matrix
+
+def exact_neighbours(matrix: np.ndarray, query_rows: np.ndarray, k: int) -> list:
+    """Brute-force cosine top-k at full dimension; this is the recall ground truth."""
+    scores = matrix[query_rows] @ matrix.T
+    top = np.argpartition(-scores, k, axis=1)[:, :k]
+    return [set(row) for row in top]
+
+# ─────────────────────────────────────────── benchmark ──
+def load_config_index(es: Elasticsearch, index_name: str, ids: list, matrix: np.ndarray, dims: int, index_options: dict):
+    """Create a temporary index for one configuration and bulk load the (truncated) vectors."""
+    create_index(es, index_name, dims, index_options)
+    actions = (
+        {
+            "_index": index_name,
+            "_id": song_id,
+            "_source": {"song_id": song_id, "embedding": truncate_embedding(vec.tolist(), dims)},
+        }
+        for song_id, vec in zip(ids, matrix)
+    )
+    helpers.bulk(es, actions, request_timeout=300)
+    es.indices.refresh(index=index_name)
+    # A single segment gives stable latencies that do not depend on merge timing
+    es.indices.forcemerge(index=index_name, max_num_segments=1, request_timeout=600)
+
+def run_queries(es: Elasticsearch, index_name: str, ids: list, matrix: np.ndarray, query_rows: np.ndarray,
+                truth: list, dims: int, k: int, num_candidates: int) -> dict:
+    """Run every sampled query and collect recall@k plus client and server latencies."""
+    id_to_row = {song_id: row for row, song_id in enumerate(ids)}
+    recalls, wall_ms, took_ms = [], [], []
+
+    def knn(vec):
+        return es.search(index=index_name, knn={
+            "field": "embedding",
+            "query_vector": vec,
+            "k": k,
+            "num_candidates": max(num_candidates, k),
+        }, source=False, size=k)
+
+    # Warm up the graph / page cache before timing
+    for row in query_rows[:10]:
+        knn(truncate_embedding(matrix[row].tolist(), dims))
+
+    for row, expected in zip(query_rows, truth):
+        vec = truncate_embedding(matrix[row].tolist(), dims)
+        start = time.perf_counter()
+        res = knn(vec)
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        took_ms.append(res["took"])
+        found = {id_to_row[h["_id"]] for h in res["hits"]["hits"]}
+        recalls.append(len(found & expected) / k)
+
+    size_bytes = es.indices.stats(index=index_name)["_all"]["primaries"]["store"]["size_in_bytes"]
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(wall_ms, 50)),
+        "p95_ms": float(np.percentile(wall_ms, 95)),
+        "took_p50_ms": float(np.percentile(took_ms, 50)),
+        "size_mb": size_bytes / (1024 * 1024),
+    }
+
+# ───────────────────────────────────────────────────────────── main ──
+def main():
+    args = parse_args()
+
+    es = Elasticsearch(args.es_url, request_timeout=120)
+    if not es.ping():
+        raise SystemExit(f"Failed to connect to Elasticsearch at {args.es_url}")
+
+    print(f"· Loading vectors from '{args.source_index}'")
+    ids, matrix = load_vectors(es, args.source_index, args.max_docs)
+    if len(ids) <= args.k:
+        raise SystemExit(f"Need more than k={args.k} documents, found {len(ids)}.")
+    full_dims = matrix.shape[1]
+    print(f"Loaded {len(ids)} vectors with {full_dims} dims.")
+
+    rng = np.random.default_rng(args.seed)
+    query_rows = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    truth = exact_neighbours(matrix, query_rows, args.k)
+
+    results = []
+    for index_type in args.types:
+        for dims in args.dims:
+            if dims > full_dims:
+                print(f"Skipping dims={dims}: source vectors only have {full_dims} dims.")
+                continue
+            index_options = build_index_options(index_type, args.hnsw_m, args.hnsw_ef_construction)
+            index_name = f"{args.source_index}_bench_{index_type}_{dims}"
+            print(f"· Benchmarking {index_type} @ {dims} dims ({index_name})")
+            try:
+                load_config_index(es, index_name, ids, matrix, dims, index_options)
+                stats = run_queries(es, index_name, ids, matrix, query_rows, truth,
+                                    dims, args.k, args.num_candidates)
+                results.append((index_type, dims, stats))
+            finally:
+                if not args.keep:
+                    es.options(ignore_status=[400, 404]).indices.delete(index=index_name)
+
+    print(f"\nrecall@{args.k} vs exact {full_dims}-dim cosine, num_candidates={args.num_candidates}, "
+          f"{len(query_rows)} queries")
+    print(f"{'type':<10} {'dims':>5} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'took p50':>9} {'size MB':>8}")
+    for index_type, dims, s in results:
+        print(f"{index_type:<10} {dims:>5} {s['recall']:>7.3f} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} "
+              f"{s['took_p50_ms']:>9.1f} {s['size_mb']:>8.1f}")
+
+# ────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    main()
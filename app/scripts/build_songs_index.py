@@ -1,6 +1,7 @@
 # ───────────────────────────────────────────────────────────── imports ──
 import argparse
 import os
+import numpy as np
 import pandas as pd
 import tqdm
 from elasticsearch import Elasticsearch, helpers
@@ -22,14 +23,29 @@ ES_INDEX = os.getenv("ELASTICSEARCH_INDEX", "songs")
 
 # Fixed model name and embedding dimensions (assuming embeddings were created with this)
 # This is mainly for the Elasticsearch mapping if not dynamically fetched.
-EMB_MODEL = "text-embedding-3-small" # Or your actual model
-DIMS = 1536 # Or your actual embedding dimensions
+EMB_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+DIMS = 1536 # Fallback when the embedding_manifest table has not been written yet
+
+# dense_vector index types supported by ES 8.13 (int8_* quantize floats to 1 byte per dim)
+VECTOR_INDEX_TYPES = ["hnsw", "int8_hnsw", "flat", "int8_flat"]
 
 # ───────────────────────────────────────────────────────────── CLI ──
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Build Elasticsearch index from MySQL database.")
     ap.add_argument("--es-url", default=ES_URL, help="Elasticsearch URL")
     ap.add_argument("--es-index", default=ES_INDEX, help="Elasticsearch index name")
+    # kNN tuning: quantization and HNSW graph parameters
+    ap.add_argument("--vector-index-type", choices=VECTOR_INDEX_TYPES,
+                    default=os.getenv("ES_VECTOR_INDEX_TYPE", "hnsw"),
+                    help="dense_vector index_options.type (int8_* uses ~4x less memory)")
+    ap.add_argument("--hnsw-m", type=int, default=None,
+                    help="HNSW max connections per node (ES default: 16)")
+    ap.add_argument("--hnsw-ef-construction", type=int, default=None,
+                    help="HNSW candidates tracked while building the graph (ES default: 100)")
+    ap.add_argument("--dims", type=int, default=int(os.getenv("EMBEDDING_DIMS")) if os.getenv("EMBEDDING_DIMS") else None,
+                    help="Index the first N embedding dimensions (text-embedding-3 vectors can be "
+                         "shortened); must match EMBEDDING_DIMS used by the API. "
+                         "Defaults to the dims recorded in embedding_manifest")
     # DB connection args can be added if needed, or rely on .env
     return ap.parse_args()
 
@@ -95,8 +111,67 @@ def load_data_from_db() -> pd.DataFrame:
             conn.close()
             print("Database connection closed.")
 
+def truncate_embedding(vec, dims: int):
+    """Shorten a text-embedding-3 vector to `dims` and re-normalize it to unit length.
+
+    This is equivalent to requesting `dimensions=dims` from the embeddings API,
+    so stored 1536-dim vectors can be indexed at a reduced size.
+    """
+    if vec is None or len(vec) == dims:
+        return vec
+    if len(vec) < dims:
+        raise ValueError(f"Embedding has {len(vec)} dims, cannot index it with {dims} dims")
+    short = np.asarray(vec[:dims], dtype=np.float32)
+    norm = np.linalg.norm(short)
+    if norm > 0:
+        short /= norm
+    return short.tolist()
+
+def load_embedding_manifest() -> dict:
+    """Return the {model, dims} row written by create_embeddings.py, or None if missing."""
+    conn = None
+    try:
+        conn = mysql.connector.connect(
+            host=DB_HOST,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME
+        )
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT model, dims FROM embedding_manifest WHERE name = 'embeddings'")
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+    except mysql.connector.Error as e:
+        print(f"No embedding manifest available ({e}); assuming {EMB_MODEL} @ {DIMS} dims.")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+def resolve_dims(requested_dims: int, manifest: dict) -> int:
+    """Pick the index dimension and check it is reachable from the stored vectors."""
+    stored_dims = manifest["dims"] if manifest else DIMS
+    if manifest and manifest["model"] != EMB_MODEL:
+        raise SystemExit(f"Embeddings were generated with '{manifest['model']}' but OPENAI_EMBEDDING_MODEL "
+                         f"is '{EMB_MODEL}'. Regenerate embeddings or fix the environment.")
+    dims = requested_dims or stored_dims
+    if dims > stored_dims:
+        raise SystemExit(f"Cannot index {dims} dims: stored embeddings only have {stored_dims}.")
+    return dims
+
 # ─────────────────────────────────────────── Elasticsearch index ──
-def create_index(es: Elasticsearch, index_name: str, dims: int):
+def build_index_options(index_type: str = "hnsw", m: int = None, ef_construction: int = None) -> dict:
+    """Build the dense_vector `index_options` block; HNSW params are omitted for flat types."""
+    options = {"type": index_type}
+    if index_type.endswith("hnsw"):
+        if m is not None:
+            options["m"] = m
+        if ef_construction is not None:
+            options["ef_construction"] = ef_construction
+    return options
+
+def create_index(es: Elasticsearch, index_name: str, dims: int, index_options: dict = None):
     """Create the Elasticsearch index with the required mapping."""
     if es.indices.exists(index=index_name):
         print(f"Index '{index_name}' already exists. Deleting and recreating.")
@@ -104,8 +179,22 @@ def create_index(es: Elasticsearch, index_name: str, dims: int):
     else:
         print(f"Creating index '{index_name}'.")
 
+    embedding_mapping = {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": "cosine"
+    }
+    if index_options:
+        embedding_mapping["index_options"] = index_options
+
     mapping = {
         "mappings": {
+            # Read by the API at startup to detect a model/dims mismatch with its query embeddings
+            "_meta": {
+                "embedding_model": EMB_MODEL,
+                "embedding_dims": dims,
+            },
             "properties": {
                 "song_id": {"type": "keyword"},
                 "song_name": {"type": "text", "analyzer": "standard"},
@@ -120,12 +209,7 @@ def create_index(es: Elasticsearch, index_name: str, dims: int):
                 "main_genre": {"type": "keyword"},
                 "genres": {"type": "text"}, # Can be keyword if you don't need partial match on genres string
                 "image_url": {"type": "keyword"},
-                "embedding": {
-                    "type": "dense_vector",
-                    "dims": dims,
-                    "index": True,
-                    "similarity": "cosine"
-                },
+                "embedding": embedding_mapping,
                 "energy": {"type": "float"}
                 # Add other fields from your SELECT statement as needed
                 # "explicit": {"type": "boolean"},
@@ -149,15 +233,14 @@ def create_index(es: Elasticsearch, index_name: str, dims: int):
         }
     }
     es.indices.create(index=index_name, body=mapping)
-    print(f"Index '{index_name}' created with mapping.")
+    print(f"Index '{index_name}' created with mapping (dims={dims}, index_options={index_options}).")
 
 
 # build_embeddings function is removed as embeddings are pre-generated
 
 # ─────────────────────────────────────────── bulk loader ──
-def bulk_load(es: Elasticsearch, index_name: str, df: pd.DataFrame):
-    """Bulk load data into Elasticsearch."""
-    actions = []
+def generate_actions(index_name: str, df: pd.DataFrame, dims: int = DIMS):
+    """Yield one bulk index action per song that has an embedding."""
     for r in df.itertuples(index=False): # index=False to avoid _0, _1 etc. as field names
         if r.embedding is None: # Skip if embedding is missing
             print(f"Skipping song_id {r.song_id} due to missing embedding.")
@@ -179,7 +262,7 @@ def bulk_load(es: Elasticsearch, index_name: str, df: pd.DataFrame):
             "genres": r.genres,
             "image_url": r.image_url,
             "spotify_url": r.spotify_url,
-            "embedding": r.embedding,
+            "embedding": truncate_embedding(r.embedding, dims),
             "energy": None if pd.isna(r.energy) else float(r.energy),
         }
         # Clean NaN/None for text fields to avoid issues with ES
@@ -187,12 +270,15 @@ def bulk_load(es: Elasticsearch, index_name: str, df: pd.DataFrame):
             if pd.isna(source_doc.get(key)):
                 source_doc[key] = None # Or "" if you prefer empty string
 
-        actions.append({
+        yield {
             "_index": index_name,
             "_id": str(r.song_id),
             "_source": source_doc
-        })
+        }
 
+def bulk_load(es: Elasticsearch, index_name: str, df: pd.DataFrame, dims: int = DIMS):
+    """Bulk load data into Elasticsearch."""
+    actions = list(generate_actions(index_name, df, dims))
     if not actions:
         print("No actions to perform for bulk load.")
         return
@@ -221,6 +307,8 @@ def main():
         raise SystemExit(f"Failed to connect to Elasticsearch at {args.es_url}")
     print(f"Successfully connected to Elasticsearch at {args.es_url}")
 
+    dims = resolve_dims(args.dims, load_embedding_manifest())
+    print(f"· Embedding model {EMB_MODEL}, indexing {dims} dims")
 
     print("· Loading data from database")
     df = load_data_from_db()
@@ -231,11 +319,13 @@ def main():
 
     # Embedding generation is skipped as it's pre-loaded
 
+    index_options = build_index_options(args.vector_index_type, args.hnsw_m, args.hnsw_ef_construction)
+
     print(f"· Creating Elasticsearch index '{args.es_index}'")
-    create_index(es, args.es_index, DIMS) # Pass DIMS for mapping
+    create_index(es, args.es_index, dims, index_options)
 
     print(f"· Bulk indexing to '{args.es_index}'")
-    bulk_load(es, args.es_index, df)
+    bulk_load(es, args.es_index, df, dims)
 
     print(f"Completed. Indexed {len(df)} songs into '{args.es_index}'.")
 
@@ -60,26 +60,27 @@ def setup_logger():
 
     return logger_instance
 
-logger = setup_logger()
+# Handlers are attached by setup_logger() in main(), so importing this module
+# (e.g. from benchmarks) does not create log files
+logger = logging.getLogger("embedding_script")
 
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv("OPENAI_API_KEY")
 EMB_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL")
+EMB_DIMS = os.getenv("EMBEDDING_DIMS")  # None = model default (1536 for text-embedding-3-small)
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME", "musicoset")
 
-# Log environment variables (mask API_KEY)
-masked_api_key = f"{API_KEY[:7]}...{API_KEY[-4:]}" if API_KEY and len(API_KEY) > 11 else "Not Set or Too Short"
-logger.info(f'Environment variables loaded.\nAPI_KEY: {masked_api_key}\nEMB_MODEL: {EMB_MODEL}\nDB_HOST: {DB_HOST}\nDB_USER: {DB_USER}\nDB_NAME: {DB_NAME}')
-
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Create embeddings for songs and save to MySQL database.")
     ap.add_argument("--openai-key", default=API_KEY, help="OpenAI API key")
     ap.add_argument("--batch-size", type=int, default=25, help="Approximate records per OpenAI request")
     ap.add_argument("--max-song-tokens", type=int, default=400, help="Maximum tokens kept per song before embedding")
+    ap.add_argument("--dims", type=int, default=int(EMB_DIMS) if EMB_DIMS else None,
+                    help="Embedding dimensions to request (text-embedding-3 models only, e.g. 256/512/768)")
     return ap.parse_args()
 
 def load_and_prepare_data() -> pd.DataFrame:
@@ -114,12 +115,7 @@ def load_and_prepare_data() -> pd.DataFrame:
         db_df["lyrics"] = db_df["lyrics"].fillna("")
         db_df["billboard_info"] = db_df["billboard_info"].fillna("").astype(str) # Ensure billboard_info is string and handle NULL
         
-        # Construct prompt using billboard_info and lyrics
-        # Add a separator if billboard_info is not empty
-        db_df["prompt"] = db_df.apply(
-            lambda row: f"{row['billboard_info']}\n\n{row['lyrics']}" if row['billboard_info'] else row['lyrics'],
-            axis=1
-        )
+        db_df["prompt"] = build_prompts(db_df)
         return db_df
 
     except mysql.connector.Error as e:
@@ -159,25 +155,78 @@ def create_embeddings_table():
             cursor.close()
             conn.close()
 
-def generate_embeddings(df: pd.DataFrame, client: OpenAI, model: str, batch_size: int, max_tokens_song: int) -> list:
+def save_embedding_manifest(model: str, dims: int):
+    """Record which model and dimension the 'embeddings' table was generated with.
+
+    build_songs_index.py reads this row to map the index, and the API compares the
+    index against its own settings at startup.
+    """
+    conn = None
+    try:
+        conn = mysql.connector.connect(
+            host=DB_HOST,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME
+        )
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_manifest (
+            name VARCHAR(64) NOT NULL PRIMARY KEY,
+            model VARCHAR(255) NOT NULL,
+            dims INT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB;
+        """)
+        cursor.execute("""
+        INSERT INTO embedding_manifest (name, model, dims)
+        VALUES ('embeddings', %s, %s)
+        ON DUPLICATE KEY UPDATE model = VALUES(model), dims = VALUES(dims);
+        """, (model, dims))
+        conn.commit()
+        logger.info(f"Embedding manifest updated: model={model}, dims={dims}")
+    except mysql.connector.Error as e:
+        logger.error(f"Error saving embedding manifest: {e}")
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+def build_prompts(df: pd.DataFrame) -> list:
+    """Construct prompts using billboard_info and lyrics.
+
+    A separator is added only if billboard_info is not empty.
+    """
+    return [
+        f"{billboard}\n\n{lyrics}" if billboard else lyrics
+        for billboard, lyrics in zip(df["billboard_info"], df["lyrics"])
+    ]
+
+def clip_prompts(prompts: list, enc, max_tokens: int) -> list:
+    """Clip every prompt to `max_tokens` tokens (tiktoken encodes / decodes the batch in parallel)."""
+    tokens = enc.encode_batch(prompts)
+    return enc.decode_batch([t[:max_tokens] for t in tokens])
+
+def generate_embeddings(df: pd.DataFrame, client: OpenAI, model: str, batch_size: int, max_tokens_song: int,
+                        dims: int = None) -> list:
     """Generate embeddings for the dataset."""
     enc = tiktoken.encoding_for_model(model)
     embeddings_data = []
-
-    def clip_text(text: str) -> str:
-        tokens = enc.encode(text)
-        return enc.decode(tokens[:max_tokens_song])
-
-    prepared_prompts_for_batching = []
-    for index, row in df.iterrows():
-        full_prompt = row["prompt"] # This now contains billboard_info + lyrics
-        clipped_prompt = clip_text(full_prompt)
-        prepared_prompts_for_batching.append({
-            "song_id": row["song_id"],
+    # Only send `dimensions` when requested; older models reject the parameter
+    dims_kwargs = {"dimensions": dims} if dims else {}
+
+    # "prompt" contains billboard_info + lyrics
+    clipped_prompts = clip_prompts(df["prompt"].tolist(), enc, max_tokens_song)
+    prepared_prompts_for_batching = [
+        {
+            "song_id": song_id,
             "clipped_prompt": clipped_prompt,
-            "original_billboard_info": row["billboard_info"], # Keep for logging
-            "original_lyrics": row["lyrics"] # Keep for logging
-        })
+            "original_billboard_info": billboard_info, # Keep for logging
+            "original_lyrics": lyrics # Keep for logging
+        }
+        for song_id, clipped_prompt, billboard_info, lyrics
+        in zip(df["song_id"], clipped_prompts, df["billboard_info"], df["lyrics"])
+    ]
 
     for i in tqdm.tqdm(range(0, len(prepared_prompts_for_batching), batch_size), desc="Generating Embeddings"):
         batch_data_with_ids = prepared_prompts_for_batching[i:i + batch_size]
@@ -191,7 +240,7 @@ def generate_embeddings(df: pd.DataFrame, client: OpenAI, model: str, batch_size
                     truncated_prompt_for_log = prompt_text_content[:60] + "..." if len(prompt_text_content) > 60 else prompt_text_content
                     logger.info(f"Sending to API for song_id: {current_song_id} | Full Prompt (start): {truncated_prompt_for_log}")
 
-            response = client.embeddings.create(model=model, input=batch_prompts_text_to_send)
+            response = client.embeddings.create(model=model, input=batch_prompts_text_to_send, **dims_kwargs)
             
             for idx, embedding_data_point in enumerate(response.data):
                 song_id_for_log = batch_data_with_ids[idx]["song_id"]
@@ -269,7 +318,11 @@ def save_embeddings_to_db(embeddings_data: list):
             conn.close()
 
 def main():
+    setup_logger()
     logger.info("Script execution started.")
+    # Log environment variables (mask API_KEY)
+    masked_api_key = f"{API_KEY[:7]}...{API_KEY[-4:]}" if API_KEY and len(API_KEY) > 11 else "Not Set or Too Short"
+    logger.info(f'Environment variables loaded.\nAPI_KEY: {masked_api_key}\nEMB_MODEL: {EMB_MODEL}\nEMB_DIMS: {EMB_DIMS or "model default"}\nDB_HOST: {DB_HOST}\nDB_USER: {DB_USER}\nDB_NAME: {DB_NAME}')
     args = parse_args()
     
     # Ensure API key is available for OpenAI client
@@ -293,13 +346,16 @@ def main():
         return
 
     logger.info("Generating embeddings...")
-    embeddings_list = generate_embeddings(songs_df, client, EMB_MODEL, args.batch_size, args.max_song_tokens)
+    embeddings_list = generate_embeddings(songs_df, client, EMB_MODEL, args.batch_size, args.max_song_tokens, args.dims)
 
     if not embeddings_list:
         logger.warning("No embeddings were generated. Exiting.")
         return
 
     save_embeddings_to_db(embeddings_list)
+    generated_dims = next((len(item["embedding"]) for item in embeddings_list if item["embedding"]), None)
+    if generated_dims:
+        save_embedding_manifest(EMB_MODEL, generated_dims)
     logger.info("Successfully generated and saved embeddings to the database.")
     logger.info("Script execution finished.")
 
@@ -1,14 +1,27 @@
--- Create user_playlists table for storing user playlists
-CREATE TABLE IF NOT EXISTS user_playlists (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+-- Create playlists table: one row per user playlist
+CREATE TABLE IF NOT EXISTS playlists (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
     user_id VARCHAR(255) NOT NULL,
-    playlist_name VARCHAR(255) NOT NULL,
-    song_data TEXT NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    song_count INT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    INDEX idx_user_id (user_id),
-    INDEX idx_playlist_name (playlist_name),
-    INDEX idx_user_playlist (user_id, playlist_name)
+    UNIQUE KEY uq_user_playlist (user_id, name)
+);
+
+-- Create playlist_items table: ordered song references (metadata is read from the catalog).
+-- song_data is only set for songs without a catalog song_id.
+-- Existing user_playlists rows can be copied with scripts/migrate_user_playlists.py
+CREATE TABLE IF NOT EXISTS playlist_items (
+    playlist_id BIGINT NOT NULL,
+    position BIGINT NOT NULL,
+    song_id VARCHAR(22) NULL,
+    song_data JSON NULL,
+    PRIMARY KEY (playlist_id, position),
+    INDEX idx_song_id (song_id),
+    CONSTRAINT fk_playlist_items_playlist
+        FOREIGN KEY (playlist_id) REFERENCES playlists (id) ON DELETE CASCADE
 );
 
 -- Create users table for storing user information (optional)
@@ -6,4 +6,17 @@ CREATE TABLE melodymind_song_links (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     PRIMARY KEY (song_id)
-);
\ No newline at end of file
+);
+
+-- Per-provider lookup checkpoints for fetch_song_links.py --only-missing
+-- (songs that keep failing are retried after an exponential backoff)
+CREATE TABLE IF NOT EXISTS melodymind_link_fetch_status (
+    song_id VARCHAR(22) NOT NULL,
+    provider VARCHAR(20) NOT NULL,
+    failure_count INT NOT NULL DEFAULT 0,
+    last_attempt_at TIMESTAMP NULL,
+    last_success_at TIMESTAMP NULL,
+    next_attempt_at TIMESTAMP NULL,
+    PRIMARY KEY (song_id, provider),
+    INDEX idx_next_attempt (provider, next_attempt_at)
+);
@@ -1,14 +1,19 @@
 import os
-import base64
+import argparse
 import json
+import re
+import signal
 import mysql.connector
-from requests import post, get
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 from dotenv import load_dotenv
 import time
 from urllib.parse import quote
 import logging
 from datetime import datetime
-from ytmusicapi import YTMusic
+
+from api_response_cache import DEFAULT_TTL_SECONDS, ResponseCache
+from link_matching import best_spotify_match, best_youtube_match
+from music_providers import SpotifyClient, TokenBucket, YouTubeMusicClient
 
 # For whoever runs this script, ensure you should change the path to your .env file
 load_dotenv("/Users/jiwoo/WorkSpace/MelodyMind/.env")
@@ -29,6 +34,42 @@ DB_CONFIG = {
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
+# Concurrency and rate limits (requests per second, burst size) per provider.
+# Spotify enforces a rolling 30s window and answers 429 with Retry-After;
+# YouTube Music has no published limit, so stay conservative.
+MAX_WORKERS = int(os.getenv("LINK_FETCH_WORKERS", "8"))
+SPOTIFY_RATE = float(os.getenv("SPOTIFY_RATE_PER_SEC", "5"))
+SPOTIFY_BURST = int(os.getenv("SPOTIFY_BURST", "10"))
+YOUTUBE_RATE = float(os.getenv("YOUTUBE_RATE_PER_SEC", "2"))
+YOUTUBE_BURST = int(os.getenv("YOUTUBE_BURST", "4"))
+
+# SQLite store of raw API responses, consulted before every network call
+CACHE_PATH = os.getenv("LINK_CACHE_PATH", "fetch_song_links_cache.sqlite3")
+CACHE_TTL_DAYS = float(os.getenv("LINK_CACHE_TTL_DAYS", DEFAULT_TTL_SECONDS / 86400))
+
+# Link rows are written in multi-row upserts once this many songs are buffered
+# or this many seconds have passed since the last flush
+WRITE_BATCH_SIZE = int(os.getenv("LINK_WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_SECONDS = float(os.getenv("LINK_WRITE_FLUSH_SECONDS", "10"))
+
+# Work-queue mode: songs whose lookup failed are retried after
+# FAILURE_BACKOFF_HOURS * 2^(failures - 1) hours, capped at MAX_BACKOFF_HOURS
+FAILURE_BACKOFF_HOURS = 6
+MAX_BACKOFF_HOURS = 24 * 30
+
+# musicoset song_ids are Spotify track ids, so Spotify links can be derived from them:
+#   direct   - build open.spotify.com URLs without any API call
+#   validate - confirm the ids in bulk via /v1/tracks (50 per call), search only for misses
+#   search   - always use free-text search (previous behaviour)
+SPOTIFY_ID_MODES = ["direct", "validate", "search"]
+SPOTIFY_TRACK_ID = re.compile(r"^[0-9A-Za-z]{22}$")
+
+# Provider name -> (enabled flag, URL column in melodymind_song_links)
+PROVIDERS = {
+    'spotify': (FETCH_SPOTIFY, 'spotify_url'),
+    'youtube_music': (FETCH_YOUTUBE_MUSIC, 'youtube_music_url'),
+}
+
 print("Using Spotify Client ID:", SPOTIFY_CLIENT_ID)
 print("Using Spotify Client Secret:", SPOTIFY_CLIENT_SECRET)
 
@@ -43,62 +84,172 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class LinkWriter:
+    """Buffers link and fetch-status rows and writes them in batched transactions.
+
+    Only non-None URLs overwrite existing values, exactly like the former per-song
+    upsert. Not thread-safe: use it from the thread that owns the DB connection.
+    """
+    def __init__(self, connection, batch_size=WRITE_BATCH_SIZE, flush_seconds=WRITE_FLUSH_SECONDS):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.links = {}            # song_id -> [spotify_url, youtube_music_url]
+        self.found_status = []     # (song_id, provider)
+        self.failed_status = []    # (song_id, provider)
+        self.last_flush = time.monotonic()
+        self.written = 0
+        self.failed = 0
+        self.unsaved = []          # song_ids whose rows could not be written
+
+    def add_links(self, song_id, spotify_url=None, youtube_music_url=None):
+        row = self.links.setdefault(song_id, [None, None])
+        if spotify_url is not None:
+            row[0] = spotify_url
+        if youtube_music_url is not None:
+            row[1] = youtube_music_url
+        self.maybe_flush()
+
+    def add_status(self, song_id, provider, found):
+        (self.found_status if found else self.failed_status).append((song_id, provider))
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        pending = len(self.links) + len(self.found_status) + len(self.failed_status)
+        if pending >= self.batch_size or (pending and time.monotonic() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered in one transaction.
+
+        If the batch fails, it is retried song by song (reconnecting first if the
+        connection was lost), so a bad row only loses its own song. Songs that still
+        fail are listed in `unsaved`; they get no status row, so the next
+        --only-missing run fetches them again.
+        """
+        links, found, failed = self.links, self.found_status, self.failed_status
+        self.links, self.found_status, self.failed_status = {}, [], []
+        self.last_flush = time.monotonic()
+        if not (links or found or failed):
+            return True
+
+        try:
+            self._write(links, found, failed)
+            self.written += len(links)
+            logger.info(f"Flushed {len(links)} link rows and {len(found) + len(failed)} status rows")
+            return True
+        except mysql.connector.Error as err:
+            logger.error(f"Error flushing batch of {len(links)} songs: {err}; retrying song by song")
+
+        if not self.connection.is_connected():
+            try:
+                self.connection.reconnect(attempts=3, delay=1)
+            except mysql.connector.Error as err:
+                logger.error(f"Could not reconnect to the database: {err}")
+        by_song = {}
+        for song_id, urls in links.items():
+            by_song.setdefault(song_id, ({}, [], []))[0][song_id] = urls
+        for rows, index in ((found, 1), (failed, 2)):
+            for row in rows:
+                by_song.setdefault(row[0], ({}, [], []))[index].append(row)
+        saved = True
+        for song_id, (song_links, song_found, song_failed) in by_song.items():
+            try:
+                self._write(song_links, song_found, song_failed)
+                self.written += len(song_links)
+            except mysql.connector.Error as err:
+                saved = False
+                self.failed += len(song_links)
+                self.unsaved.append(song_id)
+                logger.error(f"Error saving links of song {song_id}: {err}")
+        return saved
+
+    def _write(self, links, found, failed):
+        """Upsert the given link / status rows in one transaction (rolled back on error)"""
+        cursor = self.connection.cursor()
+        try:
+            if links:
+                rows = [(song_id, urls[0], urls[1]) for song_id, urls in links.items()]
+                cursor.execute(f"""
+                INSERT INTO melodymind_song_links (song_id, spotify_url, youtube_music_url)
+                VALUES {', '.join(['(%s, %s, %s)'] * len(rows))}
+                ON DUPLICATE KEY UPDATE
+                spotify_url = COALESCE(VALUES(spotify_url), spotify_url),
+                youtube_music_url = COALESCE(VALUES(youtube_music_url), youtube_music_url),
+                updated_at = CURRENT_TIMESTAMP
+                """, [value for row in rows for value in row])
+            if found:
+                cursor.execute(f"""
+                INSERT INTO melodymind_link_fetch_status
+                    (song_id, provider, failure_count, last_attempt_at, last_success_at, next_attempt_at)
+                VALUES {', '.join(['(%s, %s, 0, NOW(), NOW(), NULL)'] * len(found))}
+                ON DUPLICATE KEY UPDATE failure_count = 0, last_attempt_at = NOW(),
+                    last_success_at = NOW(), next_attempt_at = NULL
+                """, [value for row in found for value in row])
+            if failed:
+                cursor.execute(f"""
+                INSERT INTO melodymind_link_fetch_status
+                    (song_id, provider, failure_count, last_attempt_at, next_attempt_at)
+                VALUES {', '.join([f'(%s, %s, 1, NOW(), NOW() + INTERVAL {int(FAILURE_BACKOFF_HOURS)} HOUR)'] * len(failed))}
+                ON DUPLICATE KEY UPDATE
+                    next_attempt_at = NOW() + INTERVAL LEAST({int(FAILURE_BACKOFF_HOURS)} * POW(2, failure_count), {int(MAX_BACKOFF_HOURS)}) HOUR,
+                    failure_count = failure_count + 1,
+                    last_attempt_at = NOW()
+                """, [value for row in failed for value in row])
+            self.connection.commit()
+        except mysql.connector.Error:
+            try:
+                self.connection.rollback()
+            except mysql.connector.Error:
+                pass
+            raise
+        finally:
+            cursor.close()
+
+
 class MusicLinkCollector:
-    def __init__(self):
-        self.spotify_token = None
+    def __init__(self, max_workers=MAX_WORKERS, cache=None):
         self.db_connection = None
         self.failed_fetches = []
-        self.ytmusic = None
+        self.max_workers = max_workers
+        self.spotify = SpotifyClient(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET,
+                                     TokenBucket(SPOTIFY_RATE, SPOTIFY_BURST), pool_size=max_workers)
+        self.youtube = YouTubeMusicClient(TokenBucket(YOUTUBE_RATE, YOUTUBE_BURST))
+        self.youtube_ready = False
+        self.writer = None
+        self.cache = cache
+        # Offline: answer only from recorded responses, never touch the network
+        self.offline = bool(cache and cache.offline)
         
         # Initialize YouTube Music if enabled
-        if FETCH_YOUTUBE_MUSIC:
+        if FETCH_YOUTUBE_MUSIC and not self.offline:
             try:
-                self.ytmusic = YTMusic()
+                self.youtube.client()
+                self.youtube_ready = True
                 logger.info("YouTube Music API initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize YouTube Music API: {e}")
-                self.ytmusic = None
         
     def connect_to_database(self):
         """Connect to MySQL database"""
         try:
             self.db_connection = mysql.connector.connect(**DB_CONFIG)
+            self.writer = LinkWriter(self.db_connection)
             logger.info("Connected to database successfully")
         except mysql.connector.Error as err:
             logger.error(f"Database connection error: {err}")
             
     def get_spotify_token(self):
-        """Get Spotify API access token"""
+        """Get Spotify API access token (the client refreshes it automatically afterwards)"""
         if not FETCH_SPOTIFY:
             logger.info("Spotify fetching is disabled")
-            self.spotify_token = None # Ensure token is None if fetching is disabled
             return
-            
-        if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
-            logger.error("Spotify credentials not found in environment variables. Cannot obtain token.")
-            self.spotify_token = None # Explicitly set to None if credentials are not found
+        
+        if self.offline:
+            logger.info("Offline mode: replaying cached Spotify responses, no token needed")
             return
-            
-        auth_string = SPOTIFY_CLIENT_ID + ":" + SPOTIFY_CLIENT_SECRET
-        auth_bytes = auth_string.encode('utf-8')
-        auth_base64 = str(base64.b64encode(auth_bytes), 'utf-8')
-
-        url = "https://accounts.spotify.com/api/token"
-        headers = {
-            "Authorization": "Basic " + auth_base64,
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
-        data = {"grant_type": "client_credentials"}
         
-        try:
-            result = post(url, headers=headers, data=data)
-            result.raise_for_status()  # Raise exception for bad status codes
-            json_result = json.loads(result.content)
-            self.spotify_token = json_result["access_token"]
-            logger.info("Spotify token obtained successfully")
-        except Exception as e:
-            logger.error(f"Error getting Spotify token: {e}")
-            self.spotify_token = None
+        self.spotify.authenticate()
     
     def parse_artist_field(self, artists_field):
         """Parse the artists field from database which can be JSON string, dict, or plain string"""
@@ -167,7 +318,7 @@ class MusicLinkCollector:
             
     def search_spotify_track(self, song_name, artist_name=None, album_name=None):
         """Search for track on Spotify with improved matching including album"""
-        if not FETCH_SPOTIFY or not self.spotify_token:
+        if not FETCH_SPOTIFY or not (self.spotify.authenticated or self.offline):
             return None
         
         # Skip if song_name is None or empty
@@ -197,7 +348,6 @@ class MusicLinkCollector:
             search_queries.append(song_name)
             
         url = "https://api.spotify.com/v1/search"
-        headers = {"Authorization": f"Bearer {self.spotify_token}"}
         
         for query in search_queries:
             params = {
@@ -207,9 +357,10 @@ class MusicLinkCollector:
             }
             
             try:
-                result = get(url, headers=headers, params=params)
-                result.raise_for_status()  # Raise exception for bad status codes
-                json_result = json.loads(result.content)
+                json_result = self._spotify_get(url, params)
+                if json_result is None:
+                    logger.error("Failed to refresh Spotify token, skipping remaining Spotify searches")
+                    return None
                 
                 if "tracks" in json_result and json_result["tracks"]["items"]:
                     tracks = json_result["tracks"]["items"]
@@ -223,83 +374,87 @@ class MusicLinkCollector:
                         
             except Exception as e:
                 logger.error(f"Error searching Spotify with query '{query}': {e}")
-                # If we get rate limited, wait longer
-                if "429" in str(e) or "Too Many Requests" in str(e):
-                    logger.warning("Rate limited by Spotify, waiting 5 seconds...")
-                    time.sleep(5)  # Increased delay for rate limiting
-                # If we get an auth error, try to refresh token
-                elif "401" in str(e) or "Unauthorized" in str(e):
-                    logger.warning("Spotify token may be expired, attempting to refresh...")
-                    self.get_spotify_token()
-                    if not self.spotify_token:
-                        logger.error("Failed to refresh Spotify token, skipping remaining Spotify searches")
-                        return None
                 continue
                 
         logger.warning(f"No Spotify match found for: {song_name} by {artist_name} from album '{album_name}'")
         return None
     
-    def _find_best_spotify_match(self, tracks, song_name, artist_name=None, album_name=None):
-        """Find the best matching track from Spotify results"""
-        song_name_lower = song_name.lower().strip()
-        artist_name_lower = artist_name.lower().strip() if artist_name else None
-        album_name_lower = album_name.lower().strip() if album_name else None
-        
-        # First priority: exact matches with album
-        for track in tracks:
-            track_name_lower = track['name'].lower().strip()
-            track_artists = [artist['name'].lower().strip() for artist in track['artists']]
-            track_album_lower = track.get('album', {}).get('name', '').lower().strip()
-            
-            # Check for exact song name match
-            if song_name_lower == track_name_lower:
-                artist_match = not artist_name_lower or any(artist_name_lower in artist or artist in artist_name_lower for artist in track_artists)
-                album_match = not album_name_lower or album_name_lower in track_album_lower or track_album_lower in album_name_lower
-                
-                # Perfect match with all fields
-                if artist_match and album_match:
-                    return track
-        
-        # Second priority: partial matches with album
-        for track in tracks:
-            track_name_lower = track['name'].lower().strip()
-            track_artists = [artist['name'].lower().strip() for artist in track['artists']]
-            track_album_lower = track.get('album', {}).get('name', '').lower().strip()
-            
-            # Check for partial song name match
-            if song_name_lower in track_name_lower or track_name_lower in song_name_lower:
-                artist_match = not artist_name_lower or any(artist_name_lower in artist or artist in artist_name_lower for artist in track_artists)
-                album_match = not album_name_lower or album_name_lower in track_album_lower or track_album_lower in album_name_lower
-                
-                if artist_match and album_match:
-                    return track
-        
-        # Third priority: matches without considering album
-        for track in tracks:
-            track_name_lower = track['name'].lower().strip()
-            track_artists = [artist['name'].lower().strip() for artist in track['artists']]
-            
-            # Check for exact song name match
-            if song_name_lower == track_name_lower:
-                if not artist_name_lower:
-                    return track
-                # Check if any artist matches
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in track_artists):
-                    return track
-            
-            # Check for partial song name match (for songs with features, remixes, etc.)
-            if song_name_lower in track_name_lower or track_name_lower in song_name_lower:
-                if not artist_name_lower:
-                    return track
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in track_artists):
-                    return track
+    def resolve_spotify_ids(self, songs, mode="validate"):
+        """Resolve Spotify links straight from song_id before any free-text search.
+
+        Resolved songs are saved and marked needs_spotify=False; the rest keep going
+        through search_spotify_track as a fallback. Returns the updated song list.
+        """
+        if not FETCH_SPOTIFY or mode == "search":
+            return songs
+        pending = {}
+        for song in songs:
+            if self._should_fetch(song, 'spotify') and SPOTIFY_TRACK_ID.match(str(song['song_id'])):
+                pending.setdefault(song['song_id'], []).append(song)
+        if not pending:
+            return songs
         
-        # If no good match, return the first result (most popular)
-        return tracks[0] if tracks else None
-            
+        if mode == "direct":
+            resolved = {song_id: f"https://open.spotify.com/track/{song_id}" for song_id in pending}
+        else:
+            if not (self.spotify.authenticated or self.offline):
+                return songs
+            resolved = {}
+            ids = list(pending)
+            batch_size = SpotifyClient.TRACKS_BATCH_SIZE
+            for i in range(0, len(ids), batch_size):
+                batch = ids[i:i + batch_size]
+                try:
+                    tracks = self._cached("spotify", "tracks:" + ",".join(batch), {"url": SpotifyClient.TRACKS_URL},
+                                          lambda: self.spotify.get_tracks(batch))
+                except Exception as e:
+                    logger.error(f"Error validating Spotify ids {batch[0]}..{batch[-1]}: {e}")
+                    continue
+                for track in tracks or []:
+                    if track and track.get("id") in pending:
+                        resolved[track["id"]] = track["external_urls"]["spotify"]
+                logger.info(f"Validated Spotify ids {min(i + batch_size, len(ids))}/{len(ids)} ({len(resolved)} found)")
+        
+        for song_id, url in resolved.items():
+            self.save_fetch_status(song_id, 'spotify', True)
+            self.save_links_to_db(song_id, url, None)
+            for song in pending[song_id]:
+                song['needs_spotify'] = False
+        logger.info(f"Resolved {len(resolved)} Spotify links from song ids ({mode}); "
+                    f"{len(pending) - len(resolved)} fall back to search")
+        return songs
+
+    def _cached(self, provider, query, params, fetch):
+        """Return a cached response if present; otherwise fetch (unless offline) and record it"""
+        if not self.cache:
+            return fetch()
+        hit, response = self.cache.get(provider, query, params)
+        if hit:
+            return response
+        if self.offline:
+            return None
+        response = fetch()
+        if response is not None:
+            self.cache.put(provider, query, response, params)
+        return response
+
+    def _spotify_get(self, url, params):
+        """Spotify GET through the response cache; an offline miss looks like an empty result"""
+        query = params.get("q", "")
+        extra = {k: v for k, v in params.items() if k != "q"}
+        extra["url"] = url
+        response = self._cached("spotify", query, extra, lambda: self.spotify.get(url, params))
+        if response is None and self.offline:
+            return {}
+        return response
+
+    def _find_best_spotify_match(self, tracks, song_name, artist_name=None, album_name=None):
+        """Find the best matching track from Spotify results (single scoring pass, see link_matching)"""
+        return best_spotify_match(tracks, song_name, artist_name, album_name)
+
     def search_youtube_music(self, song_name, artist_name=None, album_name=None):
         """Search for track on YouTube Music using ytmusicapi with album info"""
-        if not FETCH_YOUTUBE_MUSIC or not self.ytmusic:
+        if not FETCH_YOUTUBE_MUSIC or not (self.youtube_ready or self.offline):
             return None
         
         # Skip if song_name is None or empty
@@ -317,7 +472,7 @@ class MusicLinkCollector:
         search_query = " ".join(search_parts)
         
         try:
-            search_results = self.ytmusic.search(search_query, filter="songs", limit=10)
+            search_results = self._youtube_search(search_query)
             
             if search_results:
                 # Find best match
@@ -335,91 +490,88 @@ class MusicLinkCollector:
         logger.warning(f"No YouTube Music match found for: {song_name} by {artist_name} from album '{album_name}'")
         return None
     
+    def _youtube_search(self, search_query):
+        """ytmusic.search through the response cache; an offline miss looks like no results"""
+        params = {"filter": "songs", "limit": 10}
+        return self._cached("youtube_music", search_query, params,
+                            lambda: self.youtube.search(search_query, **params)) or []
+
     def _find_best_youtube_match(self, results, song_name, artist_name=None, album_name=None):
-        """Find the best matching track from YouTube Music results"""
-        song_name_lower = song_name.lower().strip()
-        artist_name_lower = artist_name.lower().strip() if artist_name else None
-        album_name_lower = album_name.lower().strip() if album_name else None
-        
-        # First priority: exact matches with album consideration
-        for result in results:
-            if result.get('resultType') != 'song':
-                continue
-                
-            title_lower = result['title'].lower().strip()
-            result_artists = [artist['name'].lower().strip() for artist in result.get('artists', [])]
-            result_album_lower = result.get('album', {}).get('name', '').lower().strip() if result.get('album') else ''
-            
-            # Check for exact song name match
-            if song_name_lower == title_lower:
-                artist_match = not artist_name_lower or any(artist_name_lower in artist or artist in artist_name_lower for artist in result_artists)
-                album_match = not album_name_lower or (result_album_lower and (album_name_lower in result_album_lower or result_album_lower in album_name_lower))
-                
-                # Perfect match with available fields
-                if artist_match and (not album_name_lower or album_match):
-                    return result
-        
-        # Second priority: partial matches with album consideration
-        for result in results:
-            if result.get('resultType') != 'song':
-                continue
-                
-            title_lower = result['title'].lower().strip()
-            result_artists = [artist['name'].lower().strip() for artist in result.get('artists', [])]
-            result_album_lower = result.get('album', {}).get('name', '').lower().strip() if result.get('album') else ''
-            
-            # Check for partial match
-            if song_name_lower in title_lower or title_lower in song_name_lower:
-                artist_match = not artist_name_lower or any(artist_name_lower in artist or artist in artist_name_lower for artist in result_artists)
-                album_match = not album_name_lower or (result_album_lower and (album_name_lower in result_album_lower or result_album_lower in album_name_lower))
-                
-                if artist_match and (not album_name_lower or album_match):
-                    return result
-        
-        # Third priority: matches without album consideration (fallback)
-        for result in results:
-            if result.get('resultType') != 'song':
-                continue
-                
-            title_lower = result['title'].lower().strip()
-            result_artists = [artist['name'].lower().strip() for artist in result.get('artists', [])]
-            
-            # Check for exact song name match
-            if song_name_lower == title_lower:
-                if not artist_name_lower:
-                    return result
-                # Check if any artist matches
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in result_artists):
-                    return result
-            
-            # Check for partial match
-            if song_name_lower in title_lower or title_lower in song_name_lower:
-                if not artist_name_lower:
-                    return result
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in result_artists):
-                    return result
-        
-        # Return first result if no perfect match
-        return results[0] if results else None
-        
-    def get_songs_from_db(self, limit=None):
-        """Get songs from database with album information"""
+        """Find the best matching track from YouTube Music results (single scoring pass, see link_matching)"""
+        return best_youtube_match(results, song_name, artist_name, album_name)
+
+    def ensure_status_table(self):
+        """Create the per-provider fetch status table used by the work-queue mode"""
+        if not self.db_connection:
+            return
+        cursor = self.db_connection.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS melodymind_link_fetch_status (
+            song_id VARCHAR(22) NOT NULL,
+            provider VARCHAR(20) NOT NULL,
+            failure_count INT NOT NULL DEFAULT 0,
+            last_attempt_at TIMESTAMP NULL,
+            last_success_at TIMESTAMP NULL,
+            next_attempt_at TIMESTAMP NULL,
+            PRIMARY KEY (song_id, provider),
+            INDEX idx_next_attempt (provider, next_attempt_at)
+        )
+        """)
+        self.db_connection.commit()
+        cursor.close()
+
+    def _needs_fetch_sql(self, provider, stale_days=None):
+        """SQL condition: link for `provider` is missing (or stale) and the song is not backed off"""
+        _, url_column = PROVIDERS[provider]
+        alias = f"fs_{provider}"
+        missing = f"l.{url_column} IS NULL"
+        if stale_days:
+            # Links stored before the status table existed have no status row; fall back to their row's updated_at
+            missing += f" OR COALESCE({alias}.last_success_at, l.updated_at) < NOW() - INTERVAL {int(stale_days)} DAY"
+        due = f"{alias}.next_attempt_at IS NULL OR {alias}.next_attempt_at <= NOW()"
+        return f"(({missing}) AND ({due}))"
+
+    def get_songs_from_db(self, limit=None, only_missing=False, stale_days=None):
+        """Get songs from database with album information.
+
+        With only_missing, this is a work queue: only songs that still need a link
+        from at least one enabled provider are returned, and each row carries
+        needs_<provider> flags so already-resolved providers are not queried again.
+        """
         if not self.db_connection:
             return []
             
         cursor = self.db_connection.cursor(dictionary=True)
-        query = """
+        enabled = [name for name, (flag, _) in PROVIDERS.items() if flag]
+        needs_columns = ""
+        joins = ""
+        where = ""
+        if only_missing and enabled:
+            conditions = {name: self._needs_fetch_sql(name, stale_days) for name in enabled}
+            needs_columns = "".join(f",\n            {cond} AS needs_{name}" for name, cond in conditions.items())
+            joins = "LEFT JOIN melodymind_song_links l ON s.song_id = l.song_id\n" + "".join(
+                f"        LEFT JOIN melodymind_link_fetch_status fs_{name} "
+                f"ON fs_{name}.song_id = s.song_id AND fs_{name}.provider = '{name}'\n"
+                for name in enabled
+            )
+            where = "WHERE " + " OR ".join(conditions.values())
+        query = f"""
         SELECT 
             s.song_id, 
             s.song_name, 
             s.artists,
-            a.name as album_name
+            a.name as album_name{needs_columns}
         FROM songs s
-        LEFT JOIN tracks t ON s.song_id = t.song_id
+        -- tracks can hold several rows per song; take one album so each song is fetched once
+        LEFT JOIN (SELECT song_id, MIN(album_id) AS album_id FROM tracks GROUP BY song_id) t
+            ON s.song_id = t.song_id
         LEFT JOIN albums a ON t.album_id = a.album_id
+        {joins}
+        {where}
+        ORDER BY s.song_id
         """
         if limit:
-            query += f" LIMIT {limit}"
+            query += f" LIMIT {int(limit)}"
             
         try:
             cursor.execute(query)
@@ -432,147 +584,191 @@ class MusicLinkCollector:
             return []
             
     def save_links_to_db(self, song_id, spotify_url=None, youtube_music_url=None):
-        """Save music links to database - only update non-None values"""
-        if not self.db_connection:
+        """Queue music links for the batched writer - only non-None values are written"""
+        if not self.writer:
             return False
-            
-        cursor = self.db_connection.cursor()
-        
-        # Build dynamic query based on which URLs are provided
-        update_fields = []
-        values = [song_id]
-        
-        if spotify_url is not None:
-            update_fields.append("spotify_url = %s")
-            values.append(spotify_url)
-        
-        if youtube_music_url is not None:
-            update_fields.append("youtube_music_url = %s")
-            values.append(youtube_music_url)
         
         # If no URLs to update, skip
-        if not update_fields:
+        if spotify_url is None and youtube_music_url is None:
             logger.warning(f"No URLs to update for song_id {song_id}")
             return True
         
-        # Add updated_at to update fields
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
+        self.writer.add_links(song_id, spotify_url, youtube_music_url)
+        return True
+            
+    def save_fetch_status(self, song_id, provider, found):
+        """Checkpoint one lookup: reset on success, otherwise count the failure and back off"""
+        if self.writer:
+            self.writer.add_status(song_id, provider, found)
+
+    def _prepare_song(self, song):
+        """Parse and clean artist / album names; returns (artist_name, album_name)"""
+        artist_name = self.parse_artist_field(song['artists'])
+        album_name = song.get('album_name')
+        
+        # Clean artist name if it exists
+        if artist_name:
+            # Remove any parenthetical information like "(feat. ...)"
+            if '(' in artist_name:
+                artist_name = artist_name.split('(')[0].strip()
+            # Remove any extra whitespace
+            artist_name = artist_name.strip()
+        
+        # Clean album name if it exists
+        if album_name:
+            album_name = album_name.strip()
+        return artist_name, album_name
+
+    def _should_fetch(self, song, provider):
+        """Provider is enabled and (in work-queue mode) still needs a link for this song"""
+        enabled, _ = PROVIDERS[provider]
+        return bool(enabled and song.get(f'needs_{provider}', True))
+
+    def _lookup_song(self, song, lookup_pool):
+        """Worker task: resolve Spotify and YouTube Music links for one song in parallel"""
+        artist_name, album_name = self._prepare_song(song)
         
-        query = f"""
-        INSERT INTO melodymind_song_links (song_id, spotify_url, youtube_music_url)
-        VALUES (%s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        {', '.join(update_fields)}
-        """
+        spotify_future = None
+        if self._should_fetch(song, 'spotify'):
+            spotify_future = lookup_pool.submit(self.search_spotify_track, song['song_name'], artist_name, album_name)
         
-        # For INSERT part, we need all values (song_id, spotify_url, youtube_music_url)
-        insert_values = [song_id, spotify_url, youtube_music_url]
-        final_values = insert_values + values[1:]  # Skip song_id from update values
+        youtube_music_url = None
+        if self._should_fetch(song, 'youtube_music'):
+            youtube_music_url = self.search_youtube_music(song['song_name'], artist_name, album_name)
         
-        try:
-            cursor.execute(query, final_values)
-            self.db_connection.commit()
-            cursor.close()
-            return True
-        except mysql.connector.Error as err:
-            logger.error(f"Error saving links for song_id {song_id}: {err}")
-            return False
-            
-    def process_songs(self, limit=None):
-        """Process songs and collect links"""
-        songs = self.get_songs_from_db(limit)
+        spotify_url = spotify_future.result() if spotify_future else None
+        return song, artist_name, album_name, spotify_url, youtube_music_url
+
+    def _record_result(self, song, artist_name, album_name, spotify_url, youtube_music_url):
+        """Runs on the main thread: log failures and save links (the DB connection is not thread-safe)"""
+        fetch_spotify = self._should_fetch(song, 'spotify')
+        fetch_youtube = self._should_fetch(song, 'youtube_music')
+        for fetched, url, provider, service in ((fetch_spotify, spotify_url, 'spotify', 'Spotify'),
+                                                (fetch_youtube, youtube_music_url, 'youtube_music', 'YouTube Music')):
+            if not fetched:
+                continue
+            self.save_fetch_status(song['song_id'], provider, bool(url))
+            if not url:
+                self.failed_fetches.append({
+                    'song_id': song['song_id'],
+                    'song_name': song['song_name'],
+                    'artist': artist_name,
+                    'album': album_name,
+                    'service': service,
+                    'timestamp': datetime.now()
+                })
+        
+        # Save to database - only pass URLs for providers looked up in this run
+        save_spotify = spotify_url if fetch_spotify else None
+        save_youtube = youtube_music_url if fetch_youtube else None
+        
+        success = self.save_links_to_db(song['song_id'], save_spotify, save_youtube)
+        
+        if success:
+            links_found = []
+            if fetch_spotify and spotify_url:
+                links_found.append("Spotify")
+            if fetch_youtube and youtube_music_url:
+                links_found.append("YouTube Music")
+            
+            logger.info(f"✓ Saved {song['song_name']} ({', '.join(links_found) if links_found else 'No links found'})")
+        else:
+            logger.error(f"✗ Failed to save links for: {song['song_name']}")
+        return success
+
+    def process_songs(self, limit=None, only_missing=False, stale_days=None, spotify_id_mode="validate"):
+        """Process songs concurrently and collect links.
+
+        Songs are fanned out to a worker pool; pacing comes from the per-provider
+        token buckets instead of a fixed sleep. At most 2 x max_workers songs are
+        in flight so an interrupt stops quickly. Every finished lookup is
+        checkpointed in melodymind_link_fetch_status, so an only_missing rerun
+        resumes where a killed run stopped.
+        """
+        self.ensure_status_table()
+        songs = self.get_songs_from_db(limit, only_missing, stale_days)
+        songs = self.resolve_spotify_ids(songs, spotify_id_mode)
         total_songs = len(songs)
         
-        logger.info(f"Processing {total_songs} songs...")
+        logger.info(f"Processing {total_songs} songs with {self.max_workers} workers...")
         logger.info(f"Fetch settings - Spotify: {FETCH_SPOTIFY}, YouTube Music: {FETCH_YOUTUBE_MUSIC}")
+        if self.cache:
+            logger.info(f"Response cache: {self.cache.path} ({'offline replay' if self.offline else 'read-through'})")
+            logger.info(f"Pruned {self.cache.prune()} expired cached responses")
         
         success_count = 0
         failed_count = 0
-        
-        for i, song in enumerate(songs, 1):
-            # Skip songs with no song_name or None values
-            if not song.get('song_name') or song['song_name'] == 'None':
-                logger.warning(f"Skipping song {i}/{total_songs}: song_name is None or 'None' | {song.get('song_id', 'Unknown ID')}")
-                continue
-                
-            # Parse artist name and album name properly
-            artist_name = self.parse_artist_field(song['artists'])
-            album_name = song.get('album_name')
-            
-            # Clean artist name if it exists
-            if artist_name:
-                # Remove any parenthetical information like "(feat. ...)"
-                if '(' in artist_name:
-                    artist_name = artist_name.split('(')[0].strip()
-                # Remove any extra whitespace
-                artist_name = artist_name.strip()
-            
-            # Clean album name if it exists
-            if album_name:
-                album_name = album_name.strip()
-            
-            # Initialize URLs - only initialize URLs for enabled services
-            spotify_url = None if FETCH_SPOTIFY else "SKIP"
-            youtube_music_url = None if FETCH_YOUTUBE_MUSIC else "SKIP"
-            
-            # Create display info
-            album_info = f" from '{album_name}'" if album_name else ""
-            logger.info(f"Processing {i}/{total_songs} : {song['song_name']} by {artist_name}{album_info} | {song['song_id']} ")
-            
-            # Search Spotify if enabled
-            if FETCH_SPOTIFY:
-                spotify_url = self.search_spotify_track(song['song_name'], artist_name, album_name)
-                if not spotify_url:
-                    self.failed_fetches.append({
-                        'song_id': song['song_id'],
-                        'song_name': song['song_name'],
-                        'artist': artist_name,
-                        'album': album_name,
-                        'service': 'Spotify',
-                        'timestamp': datetime.now()
-                    })
-            
-            # Search YouTube Music if enabled
-            if FETCH_YOUTUBE_MUSIC:
-                youtube_music_url = self.search_youtube_music(song['song_name'], artist_name, album_name)
-                if not youtube_music_url:
-                    self.failed_fetches.append({
-                        'song_id': song['song_id'],
-                        'song_name': song['song_name'],
-                        'artist': artist_name,
-                        'album': album_name,
-                        'service': 'YouTube Music',
-                        'timestamp': datetime.now()
-                    })
-            
-            # Save to database - only pass URLs for enabled services
-            save_spotify = spotify_url if FETCH_SPOTIFY else None
-            save_youtube = youtube_music_url if FETCH_YOUTUBE_MUSIC else None
-            
-            success = self.save_links_to_db(song['song_id'], save_spotify, save_youtube)
+        done_count = 0
+        started = time.monotonic()
+        
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix="song") as song_pool, \
+             ThreadPoolExecutor(self.max_workers, thread_name_prefix="spotify") as lookup_pool:
+            in_flight = set()
+            
+            def drain(block_until):
+                nonlocal success_count, failed_count, done_count
+                finished, pending = wait(in_flight, return_when=block_until)
+                for future in finished:
+                    done_count += 1
+                    try:
+                        ok = self._record_result(*future.result())
+                    except Exception as e:
+                        logger.error(f"Error processing song: {e}")
+                        ok = False
+                    if ok:
+                        success_count += 1
+                    else:
+                        failed_count += 1
+                    if done_count % 100 == 0:
+                        rate = done_count / (time.monotonic() - started)
+                        logger.info(f"Progress {done_count}/{total_songs} ({rate:.1f} songs/s)")
+                        self._log_provider_metrics()
+                return pending
             
-            if success:
-                success_count += 1
-                links_found = []
-                if FETCH_SPOTIFY and spotify_url:
-                    links_found.append("Spotify")
-                if FETCH_YOUTUBE_MUSIC and youtube_music_url:
-                    links_found.append("YouTube Music")
-                
-                logger.info(f"✓ Saved ({', '.join(links_found) if links_found else 'No links found'})")
-            else:
-                failed_count += 1
-                logger.error(f"✗ Failed to save links for: {song['song_name']}")
+            try:
+                for i, song in enumerate(songs, 1):
+                    # Skip songs with no song_name or None values
+                    if not song.get('song_name') or song['song_name'] == 'None':
+                        logger.warning(f"Skipping song {i}/{total_songs}: song_name is None or 'None' | {song.get('song_id', 'Unknown ID')}")
+                        continue
+                    # Nothing left to look up (e.g. Spotify resolved from the id, YouTube disabled)
+                    if not any(self._should_fetch(song, provider) for provider in PROVIDERS):
+                        continue
+                    
+                    logger.info(f"Queueing {i}/{total_songs} : {song['song_name']} | {song['song_id']} ")
+                    in_flight.add(song_pool.submit(self._lookup_song, song, lookup_pool))
+                    if len(in_flight) >= self.max_workers * 2:
+                        in_flight = drain(FIRST_COMPLETED)
                 
-            # Add delay to respect API rate limits
-            time.sleep(1)  # Increased delay for rate limiting
+                while in_flight:
+                    in_flight = drain(FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                # Drop queued work; lookups already running finish and are saved
+                for future in in_flight:
+                    future.cancel()
+                in_flight = {f for f in in_flight if not f.cancelled()}
+                if in_flight:
+                    drain(ALL_COMPLETED)
+                raise
+            finally:
+                if self.writer:
+                    self.writer.flush()
+                if self.cache:
+                    # Keep the cache file bounded across runs (entries expiring during this run)
+                    self.cache.prune()
         
         # Log summary
         logger.info(f"\n=== PROCESSING COMPLETE ===")
         logger.info(f"Total processed: {total_songs}")
         logger.info(f"Successful saves: {success_count}")
-        logger.info(f"Failed saves: {failed_count}")
+        logger.info(f"Failed saves: {failed_count + (self.writer.failed if self.writer else 0)}")
         logger.info(f"Failed fetches: {len(self.failed_fetches)}")
+        if self.writer and self.writer.unsaved:
+            logger.warning(f"Links of {len(self.writer.unsaved)} songs could not be saved and will be fetched again "
+                           f"by the next --only-missing run: {', '.join(self.writer.unsaved[:20])}")
+        if self.cache:
+            logger.info(f"Response cache hits: {self.cache.hits}, misses: {self.cache.misses}")
+        self._log_provider_metrics()
         
         # Log failed fetches
         if self.failed_fetches:
@@ -581,26 +777,68 @@ class MusicLinkCollector:
                 album_info = f" from '{failure['album']}'" if failure.get('album') else ""
                 logger.warning(f"Failed to fetch {failure['service']} link for: {failure['song_name']} by {failure['artist']}{album_info} (ID: {failure['song_id']})")
             
+    def _log_provider_metrics(self):
+        """Log latency / error histograms of the enabled providers"""
+        for enabled, client in ((FETCH_SPOTIFY, self.spotify), (FETCH_YOUTUBE_MUSIC, self.youtube)):
+            if enabled and client.metrics.count:
+                logger.info(client.metrics.summary())
+
     def close_connections(self):
-        """Close database connection"""
+        """Flush buffered links and close database connection and HTTP sessions"""
+        if self.writer:
+            self.writer.flush()
         if self.db_connection:
             self.db_connection.close()
             logger.info("Database connection closed")
+        if self.cache:
+            self.cache.close()
+        self.spotify.close()
+        self.youtube.close()
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Collect Spotify / YouTube Music links for songs.")
+    ap.add_argument("--limit", type=int, default=None, help="Only process the first N songs (for testing)")
+    ap.add_argument("--workers", type=int, default=MAX_WORKERS, help="Number of songs looked up concurrently")
+    ap.add_argument("--only-missing", action="store_true",
+                    help="Work-queue mode: only look up songs without a link for an enabled provider, "
+                         "skipping songs that are backed off after repeated failures")
+    ap.add_argument("--stale-days", type=int, default=None,
+                    help="With --only-missing, also refresh links resolved more than N days ago")
+    ap.add_argument("--spotify-id-mode", choices=SPOTIFY_ID_MODES, default="validate",
+                    help="How to use song_id (a Spotify track id) before falling back to search")
+    ap.add_argument("--cache", default=CACHE_PATH, help="SQLite response cache path")
+    ap.add_argument("--no-cache", action="store_true", help="Always call the APIs and record nothing")
+    ap.add_argument("--cache-ttl-days", type=float, default=CACHE_TTL_DAYS, help="Reuse cached responses younger than this")
+    ap.add_argument("--offline", action="store_true",
+                    help="Replay recorded responses only (no network); uncached queries return no results")
+    return ap.parse_args()
+
+def stop_on_sigterm(signum, frame):
+    """docker stop / a k8s eviction send SIGTERM: stop like Ctrl-C so in-flight
+    lookups drain and buffered links / status rows are flushed"""
+    raise KeyboardInterrupt
 
 def main():
-    collector = MusicLinkCollector()
+    args = parse_args()
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache, ttl_seconds=args.cache_ttl_days * 86400, offline=args.offline)
+    elif args.offline:
+        raise SystemExit("--offline needs the response cache; drop --no-cache")
+    collector = MusicLinkCollector(max_workers=args.workers, cache=cache)
     
     try:
         # Initialize connections
         collector.connect_to_database()
         collector.get_spotify_token()
         
-        # Process songs (start with a small batch for testing)
-        # collector.process_songs(limit=10)  # Remove limit for all songs
-        collector.process_songs()  # Remove limit for all songs
+        # Process songs (start with a small batch for testing, e.g. --limit 10)
+        collector.process_songs(limit=args.limit, only_missing=args.only_missing, stale_days=args.stale_days,
+                                 spotify_id_mode=args.spotify_id_mode)
         
     except KeyboardInterrupt:
-        logger.info("\n\nProcess interrupted by user")
+        logger.info("\n\nProcess interrupted (Ctrl-C or SIGTERM)")
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
@@ -0,0 +1,158 @@
+"""Candidate matching shared by the Spotify / YouTube Music link collectors.
+
+Titles, artists and albums are normalized once (unicode folding, lowercase,
+"feat." / remaster / "Theme from" decorations removed) and every candidate of a
+result page is scored in a single pass:
+
+    score = 0.6 * title + 0.3 * best artist + 0.1 * album
+
+where each part is a similarity in [0, 1]. When the song has no artist or album,
+the remaining weights are rescaled. Ties keep the provider's ranking.
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+TITLE_WEIGHT = 0.6
+ARTIST_WEIGHT = 0.3
+ALBUM_WEIGHT = 0.1
+
+# Similarity given when one normalized string contains the other ("Song" vs "Song Live")
+CONTAINMENT_SCORE = 0.85
+# Pairs below this are scored 0 without running the full SequenceMatcher
+MIN_SIMILARITY = 0.5
+
+# Decorations that differ between catalogs but not between recordings
+_DECORATIONS = [
+    # (feat. X) / [ft. X] / - featuring X
+    re.compile(r"[\(\[]\s*(feat|ft|featuring|with)\.?\s[^\)\]]*[\)\]]"),
+    re.compile(r"\s-?\s*(feat|ft|featuring)\.?\s.*$"),
+    # (Remastered 2011) / - 2011 Remaster / [Remastered Version]
+    re.compile(r"[\(\[][^\)\]]*remaster[^\)\]]*[\)\]]"),
+    re.compile(r"\s-\s[^-]*remaster.*$"),
+    # (Theme from "Friends") / - Theme From ...
+    re.compile(r"[\(\[]\s*(theme|love theme|main theme)\s+from\s[^\)\]]*[\)\]]"),
+    re.compile(r"\s-\s(theme|love theme|main theme)\s+from\s.*$"),
+    # - Single Version / (Radio Edit) / - Mono
+    re.compile(r"[\(\[]\s*(single|album|radio|original)\s+(version|edit|mix)\s*[\)\]]"),
+    re.compile(r"\s-\s(single|album|radio|original)\s+(version|edit|mix)$"),
+    re.compile(r"\s-\s(mono|stereo)(\s+version)?$"),
+]
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=65536)
+def fold(text):
+    """Lowercase and strip accents / compatibility characters ("Beyoncé" -> "beyonce")"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+@lru_cache(maxsize=65536)
+def normalize_title(title):
+    """Folded title without feat./remaster/"Theme from" decorations and punctuation"""
+    text = fold(title)
+    for pattern in _DECORATIONS:
+        text = pattern.sub("", text)
+    text = _PUNCTUATION.sub(" ", text.replace("&", " and "))
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=65536)
+def normalize_name(name):
+    """Folded artist / album name; a leading "the" and punctuation are dropped"""
+    text = _PUNCTUATION.sub(" ", fold(name).replace("&", " and "))
+    text = _WHITESPACE.sub(" ", text).strip()
+    return text[4:] if text.startswith("the ") else text
+
+
+def similarity(a, b):
+    """Similarity of two normalized strings in [0, 1]"""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    # quick_ratio is a cheap upper bound of ratio
+    score = matcher.ratio() if matcher.quick_ratio() >= MIN_SIMILARITY else 0.0
+    if a in b or b in a:
+        score = max(score, CONTAINMENT_SCORE)
+    return score
+
+
+class MatchTarget:
+    """The song being looked up, normalized once and reused for every candidate"""
+    __slots__ = ("title", "artist", "album", "weights")
+
+    def __init__(self, song_name, artist_name=None, album_name=None):
+        self.title = normalize_title(song_name)
+        self.artist = normalize_name(artist_name) if artist_name else ""
+        self.album = normalize_title(album_name) if album_name else ""
+        weights = [TITLE_WEIGHT, ARTIST_WEIGHT if self.artist else 0.0, ALBUM_WEIGHT if self.album else 0.0]
+        total = sum(weights)
+        self.weights = [w / total for w in weights]
+
+    def score(self, title, artists=(), album=None):
+        """Weighted similarity of one candidate (title, list of artist names, album name)"""
+        title_w, artist_w, album_w = self.weights
+        total = title_w * similarity(self.title, normalize_title(title))
+        if artist_w:
+            total += artist_w * max((similarity(self.artist, normalize_name(a)) for a in artists), default=0.0)
+        if album_w and album:
+            total += album_w * similarity(self.album, normalize_title(album))
+        return total
+
+    def best(self, candidates, fields, min_score=0.0):
+        """Return (candidate, score) with the highest score, or (None, 0.0).
+
+        `fields(candidate)` must return (title, artist_names, album_name).
+        """
+        best, best_score = None, -1.0
+        for candidate in candidates:
+            score = self.score(*fields(candidate))
+            if score > best_score:
+                best, best_score = candidate, score
+                if score >= 1.0:
+                    break
+        if best is None or best_score < min_score:
+            return None, 0.0
+        return best, best_score
+
+
+def spotify_fields(track):
+    """(title, artists, album) of a Spotify /v1/search track item"""
+    return (
+        track.get("name", ""),
+        [artist.get("name", "") for artist in track.get("artists", [])],
+        (track.get("album") or {}).get("name", ""),
+    )
+
+
+def youtube_fields(result):
+    """(title, artists, album) of a ytmusicapi search result"""
+    return (
+        result.get("title", ""),
+        [artist.get("name", "") for artist in result.get("artists") or []],
+        (result.get("album") or {}).get("name", ""),
+    )
+
+
+def best_spotify_match(tracks, song_name, artist_name=None, album_name=None, min_score=0.0):
+    """Best Spotify track for the song, falling back to the top result like the old matcher"""
+    if not tracks:
+        return None
+    best, _ = MatchTarget(song_name, artist_name, album_name).best(tracks, spotify_fields, min_score)
+    return best if best is not None or min_score > 0 else tracks[0]
+
+
+def best_youtube_match(results, song_name, artist_name=None, album_name=None, min_score=0.0):
+    """Best YouTube Music song result (videos etc. are ignored unless nothing else was found)"""
+    if not results:
+        return None
+    songs = [r for r in results if r.get("resultType") == "song"]
+    best, _ = MatchTarget(song_name, artist_name, album_name).best(songs, youtube_fields, min_score)
+    return best if best is not None or min_score > 0 else results[0]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Make the app's services package importable when run as scripts/migrate_user_playlists.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.db import get_db_connection
+from services.playlists import count_unresolved_items, create_playlist_tables, migrate_legacy_playlists
+
+def migrate():
+    """Copy playlists from the legacy user_playlists table into playlists / playlist_items."""
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed")
+        return
+
+    try:
+        cursor = conn.cursor()
+        create_playlist_tables(cursor)
+        conn.commit()
+        cursor.close()
+
+        migrated = migrate_legacy_playlists(conn)
+        print(f"✅ Migrated {migrated} playlists. user_playlists was left untouched; drop it once verified.")
+
+        unresolved = count_unresolved_items(conn)
+        print(f"ℹ️ {unresolved['snapshot']} playlist items are not in the song catalog and were kept as snapshots.")
+        if unresolved["dangling"]:
+            # Left by earlier runs that stored unverified Spotify track ids without a snapshot;
+            # delete those playlists and re-run this script to restore them from user_playlists
+            print(f"⚠️ {unresolved['dangling']} playlist items reference unknown song_ids and have no snapshot.")
+    except Exception as e:
+        print(f"❌ Error migrating playlists: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
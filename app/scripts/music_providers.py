@@ -0,0 +1,280 @@
+"""HTTP client layer for the external music APIs used by fetch_song_links.py.
+
+Each provider client owns a pooled keep-alive session, a shared rate limiter,
+retry/backoff handling and a latency/error histogram. SpotifyClient also manages
+the client-credentials token: it is refreshed shortly before `expires_in` runs
+out and re-requested automatically after a 401.
+"""
+import base64
+import bisect
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+from requests.adapters import HTTPAdapter
+from ytmusicapi import YTMusic
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 4
+REQUEST_TIMEOUT = 15
+# Refresh the Spotify token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter shared by all workers of one provider"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Stop every worker for `seconds` (e.g. after a 429 with Retry-After)"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry `attempt` (0-based): Retry-After if given, else exponential with jitter"""
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+    return min(2 ** attempt, 30) + random.uniform(0, 1)
+
+
+class LatencyHistogram:
+    """Per-provider request latency histogram and error counts (thread-safe)"""
+    def __init__(self, name):
+        self.name = name
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.errors = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, seconds, error=None):
+        """Record one request; `error` is an HTTP status or exception name for failed requests"""
+        ms = seconds * 1000
+        with self.lock:
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            if error is not None:
+                self.errors[str(error)] += 1
+
+    def quantile(self, q):
+        """Upper bucket bound containing quantile q (in ms)"""
+        with self.lock:
+            target = q * self.count
+            seen = 0
+            for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+                seen += n
+                if n and seen >= target:
+                    return bound
+        return 0.0
+
+    def summary(self):
+        if not self.count:
+            return f"{self.name}: no requests"
+        mean = self.total_ms / self.count
+        errors = ", ".join(f"{k}: {v}" for k, v in self.errors.most_common()) or "none"
+        return (f"{self.name}: {self.count} requests, mean {mean:.0f}ms, "
+                f"p50 <= {self.quantile(0.5):g}ms, p95 <= {self.quantile(0.95):g}ms, "
+                f"p99 <= {self.quantile(0.99):g}ms, errors: {errors}")
+
+
+def pooled_session(pool_size):
+    """requests.Session that keeps up to `pool_size` connections per host alive"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class SpotifyClient:
+    """Spotify Web API client (client-credentials flow)"""
+    TOKEN_URL = "https://accounts.spotify.com/api/token"
+    TRACKS_URL = "https://api.spotify.com/v1/tracks"
+    # Maximum ids accepted by GET /v1/tracks
+    TRACKS_BATCH_SIZE = 50
+
+    def __init__(self, client_id, client_secret, limiter, pool_size=10):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.limiter = limiter
+        self.session = pooled_session(pool_size)
+        self.metrics = LatencyHistogram("spotify")
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def authenticated(self):
+        return self._token is not None
+
+    def authenticate(self):
+        """Request a new access token; returns True on success"""
+        if not self.client_id or not self.client_secret:
+            logger.error("Spotify credentials not found in environment variables. Cannot obtain token.")
+            return False
+        auth = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode("utf-8")).decode("utf-8")
+        try:
+            result = self.session.post(
+                self.TOKEN_URL,
+                headers={"Authorization": "Basic " + auth, "Content-Type": "application/x-www-form-urlencoded"},
+                data={"grant_type": "client_credentials"},
+                timeout=REQUEST_TIMEOUT,
+            )
+            result.raise_for_status()
+            body = result.json()
+            self._token = body["access_token"]
+            self._expires_at = time.monotonic() + int(body.get("expires_in", 3600))
+            logger.info(f"Spotify token obtained successfully (expires in {body.get('expires_in', 3600)}s)")
+            return True
+        except Exception as e:
+            logger.error(f"Error getting Spotify token: {e}")
+            self._token = None
+            return False
+
+    def token(self):
+        """Current token, refreshed proactively before it expires"""
+        if self._token and time.monotonic() < self._expires_at - TOKEN_REFRESH_MARGIN:
+            return self._token
+        with self._lock:
+            if not self._token or time.monotonic() >= self._expires_at - TOKEN_REFRESH_MARGIN:
+                self.authenticate()
+            return self._token
+
+    def _invalidate(self, stale_token):
+        """Force a refresh, once, even if several workers got 401 with the same token"""
+        with self._lock:
+            if self._token == stale_token:
+                self._expires_at = 0.0
+
+    def get(self, url, params=None):
+        """Rate-limited GET; honors Retry-After on 429, re-authenticates once on 401, retries 5xx.
+
+        Returns the decoded JSON, or None if no valid token could be obtained.
+        """
+        reauthenticated = False
+        for attempt in range(MAX_RETRIES + 1):
+            token = self.token()
+            if not token:
+                return None
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = self.session.get(url, headers={"Authorization": f"Bearer {token}"},
+                                          params=params, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                self.metrics.observe(time.perf_counter() - start, type(e).__name__)
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            status = result.status_code
+            self.metrics.observe(time.perf_counter() - start, status if status >= 400 else None)
+
+            if status == 429 and attempt < MAX_RETRIES:
+                delay = backoff_delay(attempt, result.headers.get("Retry-After"))
+                logger.warning(f"Rate limited by Spotify, pausing all Spotify workers for {delay:.1f}s...")
+                self.limiter.pause(delay)
+                continue
+            if status == 401 and not reauthenticated:
+                logger.warning("Spotify token rejected, re-authenticating...")
+                self._invalidate(token)
+                reauthenticated = True
+                continue
+            if status >= 500 and attempt < MAX_RETRIES:
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            result.raise_for_status()  # Raise exception for bad status codes
+            return result.json()
+
+    def get_tracks(self, track_ids):
+        """Look up to 50 track ids in one call; unknown ids come back as None (same order)"""
+        if len(track_ids) > self.TRACKS_BATCH_SIZE:
+            raise ValueError(f"At most {self.TRACKS_BATCH_SIZE} ids per request, got {len(track_ids)}")
+        body = self.get(self.TRACKS_URL, {"ids": ",".join(track_ids)})
+        return None if body is None else body.get("tracks", [])
+
+    def close(self):
+        self.session.close()
+
+
+class YouTubeMusicClient:
+    """ytmusicapi wrapper with one pooled session / YTMusic instance per worker thread"""
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.metrics = LatencyHistogram("youtube_music")
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def client(self):
+        """The calling thread's YTMusic instance (YTMusic is not safe to share across threads)"""
+        if not hasattr(self._local, "ytmusic"):
+            session = pooled_session(2)
+            with self._lock:
+                self._sessions.append(session)
+            self._local.ytmusic = YTMusic(requests_session=session)
+        return self._local.ytmusic
+
+    def search(self, query, filter="songs", limit=10):
+        """Rate-limited search with exponential backoff on throttling / server errors"""
+        ytmusic = self.client()
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                results = ytmusic.search(query, filter=filter, limit=limit)
+                self.metrics.observe(time.perf_counter() - start)
+                return results
+            except Exception as e:
+                # ytmusicapi surfaces HTTP errors only in the exception message
+                status = next((code for code in ("429", "500", "502", "503", "504") if code in str(e)), None)
+                self.metrics.observe(time.perf_counter() - start, status or type(e).__name__)
+                if status is None or attempt == MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"YouTube Music throttled ({e}), pausing YouTube workers for {delay:.1f}s...")
+                self.limiter.pause(delay)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
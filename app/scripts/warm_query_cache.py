@@ -0,0 +1,116 @@
+"""Precompute query embeddings and keyword expansions for the API's warm cache.
+
+Takes the most frequent prompts from a file (plain text, one prompt per line,
+or JSONL with a "prompt" field, e.g. a request log; repeated prompts count as
+more frequent) plus the genre vocabulary of the index (distinct `main_genre`
+values and the entries of `genres`), embeds all of them in one batched
+embeddings call and expands their keywords, then writes the file the API loads
+at startup (services.search.load_warm_cache). Rerun after changing the
+embedding model / dimensions or the prompt list.
+
+Usage (inside the fastapi container, from /app):
+    python scripts/warm_query_cache.py --prompts top_prompts.txt --top 500
+"""
+# ───────────────────────────────────────────────────────────── imports ──
+import argparse
+import ast
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from elasticsearch import helpers
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv()
+
+from services.clients import get_es
+from services.search import ES_INDEX, QUERY_WARM_CACHE_PATH, _keyword_expand, embed_many, write_warm_cache
+
+# The embeddings endpoint accepts at most 2048 inputs per request
+MAX_EMBEDDING_INPUTS = 2048
+
+# ───────────────────────────────────────────────────────────── CLI ──
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Build the warm query cache (embeddings + keywords) loaded by the API")
+    ap.add_argument("--prompts", help="Prompt file: one prompt per line, or JSONL with a 'prompt' field")
+    ap.add_argument("--top", type=int, default=500, help="Keep the N most frequent prompts of --prompts")
+    ap.add_argument("--no-genres", action="store_true", help="Do not add the genre vocabulary of the index")
+    ap.add_argument("--es-index", default=ES_INDEX, help="Index to read main_genre / genres from")
+    ap.add_argument("--workers", type=int, default=8, help="Parallel keyword expansion requests")
+    ap.add_argument("--output", default=QUERY_WARM_CACHE_PATH, help="Warm cache file the API loads")
+    return ap.parse_args()
+
+# ───────────────────────────────────────────────────────────── inputs ──
+def read_prompts(path: str, top: int) -> list:
+    """The `top` most frequent prompts of the file, most frequent first."""
+    counts = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                line = str(json.loads(line).get("prompt") or "").strip()
+            if line:
+                counts[line] += 1
+    return [prompt for prompt, _ in counts.most_common(top)]
+
+def parse_genres(value) -> list:
+    """`genres` is stored as the text of a Python list, e.g. "['pop', 'dance pop']"."""
+    if isinstance(value, list):
+        return [str(g) for g in value]
+    try:
+        parsed = ast.literal_eval(value or "[]")
+    except (ValueError, SyntaxError):
+        return []
+    return [str(g) for g in parsed] if isinstance(parsed, (list, tuple)) else []
+
+def genre_vocabulary(index: str) -> list:
+    """Distinct main_genre values (terms aggregation) and genres entries (scan) of the index."""
+    res = get_es().search(index=index, size=0, aggs={"main_genres": {"terms": {"field": "main_genre", "size": 10000}}})
+    vocabulary = {bucket["key"] for bucket in res["aggregations"]["main_genres"]["buckets"]}
+    # genres is a text field (not aggregatable), so read it from _source
+    query = {"_source": ["genres"], "query": {"exists": {"field": "genres"}}}
+    for doc in helpers.scan(get_es(), index=index, query=query, size=1000):
+        vocabulary.update(parse_genres(doc["_source"].get("genres")))
+    return sorted(g.strip() for g in vocabulary if g and g.strip())
+
+# ───────────────────────────────────────────────────────────── main ──
+def main() -> None:
+    args = parse_args()
+    prompts = read_prompts(args.prompts, args.top) if args.prompts else []
+    print(f"[Warmup] {len(prompts)} prompts from {args.prompts or '(none)'}")
+    if not args.no_genres:
+        genres = genre_vocabulary(args.es_index)
+        print(f"[Warmup] {len(genres)} genres from index '{args.es_index}'")
+        prompts += genres
+    texts = list(dict.fromkeys(prompts))
+    if not texts:
+        sys.exit("Nothing to warm: pass --prompts and/or drop --no-genres")
+
+    start = time.time()
+    vectors = []
+    for i in range(0, len(texts), MAX_EMBEDDING_INPUTS):
+        vectors += embed_many(texts[i:i + MAX_EMBEDDING_INPUTS])
+    print(f"[Warmup] Embedded {len(texts)} texts in {time.time() - start:.1f}s")
+
+    # One chat call per prompt, with the exact request the API makes, so cached
+    # keywords are the ones a live request would get
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        keywords = list(pool.map(_keyword_expand, texts))
+    print(f"[Warmup] Expanded keywords for {len(texts)} texts in {time.time() - start:.1f}s")
+
+    write_warm_cache(
+        {text: {"embedding": vec, "keywords": kws} for text, vec, kws in zip(texts, vectors, keywords)},
+        args.output,
+    )
+    print(f"✅ Warm cache with {len(texts)} entries written to {args.output}")
+
+if __name__ == "__main__":
+    main()
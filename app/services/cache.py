@@ -0,0 +1,255 @@
+"""Read caches for API responses.
+
+LRUCache is a bounded in-process cache. UserScopedCache groups entries by user
+so a write can drop everything cached for that user at once. When a Redis URL
+is given (and the `redis` package is installed) entries are also shared between
+API workers, and invalidation bumps a per-user generation in Redis so every
+worker stops serving the old entries. SharedTTLCache holds short-lived state
+that any worker may need to read back (e.g. search cursors), in Redis when one
+is configured. SingleFlight deduplicates identical calls that are in progress at
+the same time.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from services.metrics import Counter
+
+try:
+    import redis
+except ImportError:  # optional: only needed for a shared cache
+    redis = None
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            if key not in self._data:
+                return False, None
+            self._data.move_to_end(key)
+            return True, self._data[key]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SharedTTLCache:
+    """JSON values that expire after `ttl_seconds`; stored in Redis when a URL is
+    given (so every API worker sees them), otherwise in an in-process LRU."""
+
+    def __init__(self, name: str, maxsize: int = 1024, redis_url: Optional[str] = None,
+                 ttl_seconds: int = 300):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(maxsize)
+        self.shared = None
+        if redis_url:
+            if redis is None:
+                print(f"[Cache] {name}: redis package not installed, using the in-process cache only")
+            else:
+                self.shared = redis.Redis.from_url(redis_url)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(f"{self.name}:{key}")
+            except redis.RedisError as e:
+                print(f"[Cache] {self.name}: Redis unavailable ({e})")
+                return False, None
+            return (True, json.loads(raw)) if raw is not None else (False, None)
+        hit, entry = self.local.get(key)
+        if not hit or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        if self.shared is not None:
+            try:
+                self.shared.set(f"{self.name}:{key}", json.dumps(value, default=str), ex=self.ttl_seconds)
+            except redis.RedisError as e:
+                print(f"[Cache] {self.name}: failed to store {key} in Redis ({e})")
+            return
+        self.local.set(key, (time.monotonic() + self.ttl_seconds, value))
+
+    @property
+    def evictions(self) -> int:
+        return self.local.evictions
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+
+COALESCED_CALLS = Counter(
+    "melodymind_coalesced_calls_total", "Calls served by joining an identical in-flight call", ["operation"]
+)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving while it runs
+    wait for it and get the same result (or exception)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            COALESCED_CALLS.inc(self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class UserScopedCache:
+    """LRU cache of JSON-serializable values keyed by (user_id, *key)."""
+
+    def __init__(self, name: str, maxsize: int = 1024, redis_url: Optional[str] = None,
+                 ttl_seconds: int = 3600):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.local = LRUCache(maxsize)
+        self.shared = None
+        if redis_url:
+            if redis is None:
+                print(f"[Cache] {name}: redis package not installed, using the in-process cache only")
+            else:
+                self.shared = redis.Redis.from_url(redis_url)
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        # user_id -> local invalidation counter (a load that overlaps an
+        # invalidation must not store its possibly stale result)
+        self._local_generations: Dict[str, int] = {}
+        self._generation_lock = threading.Lock()
+
+    def _local_generation(self, user_id: str) -> int:
+        with self._generation_lock:
+            return self._local_generations.get(user_id, 0)
+
+    def _generation(self, user_id: str) -> Optional[int]:
+        """Shared invalidation counter of a user (0 without a shared store, None if it is unreachable)."""
+        if self.shared is None:
+            return 0
+        try:
+            return int(self.shared.get(f"{self.name}:gen:{user_id}") or 0)
+        except redis.RedisError as e:
+            print(f"[Cache] {self.name}: Redis unavailable ({e})")
+            return None
+
+    def get_or_load(self, user_id: str, key: tuple, loader: Callable[[], Any]) -> Any:
+        """Cached value for (user_id, *key); calls loader() and stores the result on a miss."""
+        local_generation = self._local_generation(user_id)
+        generation = self._generation(user_id)
+        if generation is None:
+            self.misses += 1
+            return loader()
+        full_key = (user_id, generation, local_generation) + tuple(key)
+
+        hit, value = self.local.get(full_key)
+        if hit:
+            self.hits += 1
+            return value
+
+        shared_key = f"{self.name}:{json.dumps((user_id, generation) + tuple(key), default=str)}"
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(shared_key)
+            except redis.RedisError:
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(full_key, value)
+                self.shared_hits += 1
+                return value
+
+        self.misses += 1
+        value = loader()
+        # Invalidated while loading: the value may predate the write, so do not cache it
+        if self._local_generation(user_id) != local_generation or self._generation(user_id) != generation:
+            return value
+        self.local.set(full_key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(shared_key, json.dumps(value, default=str), ex=self.ttl_seconds)
+            except redis.RedisError:
+                pass
+        return value
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop every entry of a user (write-through: call after the write commits)."""
+        with self._generation_lock:
+            self._local_generations[user_id] = self._local_generations.get(user_id, 0) + 1
+        self.local.delete_where(lambda key: key[0] == user_id)
+        if self.shared is not None:
+            try:
+                self.shared.incr(f"{self.name}:gen:{user_id}")
+            except redis.RedisError as e:
+                print(f"[Cache] {self.name}: failed to invalidate {user_id} in Redis ({e})")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "size": len(self.local),
+            "maxsize": self.local.maxsize,
+            "evictions": self.local.evictions,
+            "shared": self.shared is not None,
+        }
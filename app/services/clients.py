@@ -0,0 +1,47 @@
+"""Shared Elasticsearch and OpenAI clients, created on first use.
+
+Importing this module (or anything that uses it) does no network I/O, so the
+API and its workers start immediately; every caller shares the one instance of
+each client. main.py's lifespan closes them on shutdown.
+"""
+import os
+import threading
+from typing import Optional
+
+from elasticsearch import Elasticsearch
+from openai import OpenAI
+
+ES_HOST = os.getenv("ELASTICSEARCH_HOST", "http://elasticsearch:9200")
+ES_TIMEOUT_SECONDS = float(os.getenv("ES_TIMEOUT_SECONDS", "5"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "10"))
+
+_lock = threading.Lock()
+_es: Optional[Elasticsearch] = None
+_openai: Optional[OpenAI] = None
+
+
+def get_es() -> Elasticsearch:
+    global _es
+    if _es is None:
+        with _lock:
+            if _es is None:
+                _es = Elasticsearch(ES_HOST, request_timeout=ES_TIMEOUT_SECONDS)
+    return _es
+
+
+def get_openai() -> OpenAI:
+    global _openai
+    if _openai is None:
+        with _lock:
+            if _openai is None:
+                _openai = OpenAI(timeout=OPENAI_TIMEOUT_SECONDS, max_retries=1)
+    return _openai
+
+
+def close_clients() -> None:
+    global _es, _openai
+    with _lock:
+        for client in (_es, _openai):
+            if client is not None:
+                client.close()
+        _es = _openai = None
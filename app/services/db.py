@@ -0,0 +1,34 @@
+from typing import Optional
+import os
+
+import mysql.connector
+
+from services.metrics import Counter, timed
+
+DB_CONNECTIONS = Counter("melodymind_db_connections_total", "MySQL connections opened", ["result"])
+
+# MySQL database configuration
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_NAME = os.getenv("DB_NAME", "musicoset")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))  # seconds
+
+
+def get_db_connection() -> Optional[mysql.connector.MySQLConnection]:
+    """Get MySQL database connection."""
+    try:
+        with timed("mysql_connect"):
+            conn = mysql.connector.connect(
+                host=DB_HOST,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                database=DB_NAME,
+                connection_timeout=DB_CONNECT_TIMEOUT
+            )
+        DB_CONNECTIONS.inc("ok")
+        return conn
+    except mysql.connector.Error as e:
+        DB_CONNECTIONS.inc("error")
+        print(f"Error connecting to MySQL: {e}")
+        return None
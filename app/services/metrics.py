@@ -0,0 +1,135 @@
+"""Latency histograms and counters in the Prometheus text format.
+
+Hot-path stages are wrapped in `timed(stage)`, which feeds the stage histogram
+and, while a request is being handled, the per-request breakdown that
+main.py returns as a `Server-Timing` header.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+# stage -> seconds spent in it during the current request (None outside requests)
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", *self.samples()])
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}"
+                    for labels, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, seconds: float, *labels: str) -> None:
+        with self._lock:
+            values = self._values.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+            index = bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                values[index] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for labels, values in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, values):
+                    cumulative += n
+                    le = _format_labels(self.labelnames, labels, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                inf = _format_labels(self.labelnames, labels, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {values[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {values[-2]:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "melodymind_stage_seconds", "Time spent in each stage of request handling", ["stage"]
+)
+REQUEST_SECONDS = Histogram(
+    "melodymind_request_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a block into STAGE_SECONDS and the current request's Server-Timing breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """`Server-Timing` value, e.g. `embed;dur=12.3, es_search;dur=45.6`."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def gauge(name: str, help: str, samples: Dict[Tuple[Tuple[str, str], ...], float]) -> str:
+    """Render a gauge from {((label, value), ...): number} computed at scrape time."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples.items():
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+        lines.append(f"{name}{label_text} {value:g}")
+    return "\n".join(lines)
+
+
+def render_registry() -> str:
+    return "\n".join(metric.render() for metric in _registry)
@@ -0,0 +1,543 @@
+"""Playlist storage: one `playlists` row per playlist plus `playlist_items`
+holding (position, song_id) references. Song metadata is hydrated from the
+catalog on read instead of being copied into every row.
+
+Positions are sparse (multiples of POSITION_STEP) so songs can later be
+inserted between neighbours without renumbering the whole playlist. They also
+serve as the pagination cursor of the items endpoint.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import re
+
+from services.cache import UserScopedCache
+from services.songs import get_song_metadata
+
+POSITION_STEP = 1024
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Fields a client may request from the items endpoint (song_from_row keys)
+SONG_FIELDS = ("song_id", "title", "artist", "spotify_url", "youtube_music_url",
+               "popularity", "release_date", "energy")
+
+# open.spotify.com/track/<id> -> the id is the musicoset song_id
+SPOTIFY_TRACK_URL = re.compile(r"open\.spotify\.com/track/([0-9A-Za-z]{22})")
+SONG_ID_MAX_LENGTH = 22  # playlist_items.song_id / songs.song_id are VARCHAR(22)
+
+PLAYLIST_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS playlists (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        user_id VARCHAR(255) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        song_count INT NOT NULL DEFAULT 0,
+        version INT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_user_playlist (user_id, name)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS playlist_items (
+        playlist_id BIGINT NOT NULL,
+        position BIGINT NOT NULL,
+        song_id VARCHAR(22) NULL,
+        song_data JSON NULL,
+        PRIMARY KEY (playlist_id, position),
+        INDEX idx_song_id (song_id),
+        CONSTRAINT fk_playlist_items_playlist
+            FOREIGN KEY (playlist_id) REFERENCES playlists (id) ON DELETE CASCADE
+    )
+    """,
+]
+
+# (song_id, snapshot) - snapshot is only kept for songs that have no catalog id
+SongRef = Tuple[Optional[str], Optional[dict]]
+
+
+class PlaylistNotFound(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    """The playlist changed since the client read it (optimistic concurrency)."""
+    def __init__(self, current_version: int):
+        super().__init__(f"Playlist was modified (current version {current_version})")
+        self.current_version = current_version
+
+
+# Read responses (summaries, full playlists, item pages) per user. Every write
+# below invalidates the user's entries after it commits.
+playlist_cache = UserScopedCache(
+    "playlists",
+    maxsize=int(os.getenv("PLAYLIST_CACHE_SIZE", "1024")),
+    redis_url=os.getenv("PLAYLIST_CACHE_REDIS_URL"),
+    ttl_seconds=int(os.getenv("PLAYLIST_CACHE_TTL_SECONDS", "3600")),
+)
+
+
+def invalidate_user(user_id: str) -> None:
+    playlist_cache.invalidate(user_id)
+
+
+def create_playlist_tables(cursor) -> None:
+    for statement in PLAYLIST_TABLES:
+        cursor.execute(statement)
+
+
+def song_refs(cursor, songs: List[dict]) -> List[SongRef]:
+    """References for songs posted by the frontend, with one catalog lookup.
+
+    The posted song_id, or else the track id in spotify_url, is used only if it
+    is a catalog song_id (link urls often point to another release of the
+    track); every other song is kept as a snapshot so its title and artist are
+    not lost.
+    """
+    candidates = {}
+    for i, song in enumerate(songs):
+        song_id = str(song.get("song_id") or "")
+        if not song_id:
+            match = SPOTIFY_TRACK_URL.search(song.get("spotify_url") or "")
+            song_id = match.group(1) if match else ""
+        # Longer values cannot be catalog ids (and do not fit the song_id column)
+        if song_id and len(song_id) <= SONG_ID_MAX_LENGTH:
+            candidates[i] = song_id
+    known = set()
+    if candidates:
+        ids = list(set(candidates.values()))
+        cursor.execute(f"SELECT song_id FROM songs WHERE song_id IN ({','.join(['%s'] * len(ids))})", ids)
+        known = {song_id for (song_id,) in cursor.fetchall()}
+
+    return [(candidates[i], None) if candidates.get(i) in known else (None, song) for i, song in enumerate(songs)]
+
+
+def hydrate(conn, refs: List[SongRef]) -> List[dict]:
+    """Turn references into song dicts with one catalog query (snapshots fill in
+    for ids the catalog does not know)."""
+    metadata = get_song_metadata(conn, (song_id for song_id, _ in refs if song_id))
+    songs = []
+    for song_id, snapshot in refs:
+        song = (metadata.get(song_id) if song_id else None) or snapshot
+        if song is None and song_id:
+            song = {"song_id": song_id}
+        if song is not None:
+            songs.append(song)
+    return songs
+
+
+def _load_snapshot(value) -> Optional[dict]:
+    if value is None:
+        return None
+    return json.loads(value) if isinstance(value, (str, bytes, bytearray)) else value
+
+
+def get_user_playlists(conn, user_id: str) -> Dict[str, List[dict]]:
+    """All playlists of a user as {name: [song, ...]} in playlist order."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """
+            SELECT p.name, i.song_id, i.song_data
+            FROM playlists p
+            LEFT JOIN playlist_items i ON i.playlist_id = p.id
+            WHERE p.user_id = %s
+            ORDER BY p.name, i.position
+            """,
+            (user_id,),
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    refs_by_name: Dict[str, List[SongRef]] = OrderedDict()
+    for row in rows:
+        refs = refs_by_name.setdefault(row["name"], [])
+        if row["song_id"] or row["song_data"] is not None:
+            refs.append((row["song_id"], _load_snapshot(row["song_data"])))
+
+    all_refs = [ref for refs in refs_by_name.values() for ref in refs]
+    songs = iter(hydrate(conn, all_refs))
+    return {name: [next(songs) for _ in refs] for name, refs in refs_by_name.items()}
+
+
+def name_sort_key(name: str) -> Tuple[str, str]:
+    """Order of playlist names in listings and their cursors (case-insensitive, then exact)."""
+    return name.casefold(), name
+
+
+def get_playlist_summaries(conn, user_id: str) -> List[dict]:
+    """[{name, song_count, version, updated_at}, ...] ordered by name_sort_key; no items are read."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT name, song_count, version, updated_at FROM playlists WHERE user_id = %s",
+            (user_id,),
+        )
+        summaries = [
+            {**row, "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None}
+            for row in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+    # Sorted here rather than by MySQL, whose collation the name cursor could not reproduce
+    return sorted(summaries, key=lambda summary: name_sort_key(summary["name"]))
+
+
+def get_playlist_items(conn, user_id: str, name: str, after: Optional[int] = None,
+                       limit: int = DEFAULT_PAGE_SIZE, fields: Optional[List[str]] = None) -> dict:
+    """One page of a playlist, hydrated for that page only.
+
+    `after` is the position cursor returned as `next_cursor` by the previous page.
+    `fields` limits each song to those SONG_FIELDS. Raises PlaylistNotFound.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if fields:
+        unknown = set(fields) - set(SONG_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            "SELECT id, song_count, version FROM playlists WHERE user_id = %s AND name = %s",
+            (user_id, name),
+        )
+        playlist = cursor.fetchone()
+        if not playlist:
+            raise PlaylistNotFound(name)
+        # One row more than the page to know whether another page follows
+        cursor.execute(
+            """
+            SELECT position, song_id, song_data FROM playlist_items
+            WHERE playlist_id = %s AND position > %s
+            ORDER BY position
+            LIMIT %s
+            """,
+            (playlist["id"], after or 0, limit + 1),
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    page = rows[:limit]
+    songs = hydrate(conn, [(row["song_id"], _load_snapshot(row["song_data"])) for row in page])
+    if fields:
+        songs = [{field: song.get(field) for field in fields} for song in songs]
+    return {
+        "name": name,
+        "song_count": playlist["song_count"],
+        "version": playlist["version"],
+        "songs": songs,
+        "next_cursor": str(page[-1]["position"]) if len(rows) > limit else None,
+    }
+
+
+def _upsert_items(cursor, playlist_id: int, items: List[Tuple[int, SongRef]]) -> None:
+    if not items:
+        return
+    rows = [
+        (playlist_id, position, song_id, json.dumps(snapshot) if snapshot is not None else None)
+        for position, (song_id, snapshot) in items
+    ]
+    cursor.execute(
+        f"""
+        INSERT INTO playlist_items (playlist_id, position, song_id, song_data)
+        VALUES {", ".join(["(%s, %s, %s, %s)"] * len(rows))}
+        ON DUPLICATE KEY UPDATE song_id = VALUES(song_id), song_data = VALUES(song_data)
+        """,
+        [value for row in rows for value in row],
+    )
+
+
+def _delete_positions(cursor, playlist_id: int, positions: List[int]) -> None:
+    if not positions:
+        return
+    cursor.execute(
+        f"DELETE FROM playlist_items WHERE playlist_id = %s AND position IN ({', '.join(['%s'] * len(positions))})",
+        [playlist_id, *positions],
+    )
+
+
+def save_playlist(conn, user_id: str, name: str, songs: List[dict],
+                  expected_version: Optional[int] = None) -> int:
+    """Create or replace a playlist, writing only the items that changed.
+
+    Returns the new playlist version. Raises VersionConflict if expected_version
+    is given and does not match.
+    """
+    cursor = conn.cursor()
+    try:
+        # LAST_INSERT_ID(id) makes lastrowid the existing id on duplicate
+        cursor.execute(
+            """
+            INSERT INTO playlists (user_id, name) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+            """,
+            (user_id, name),
+        )
+        playlist_id = cursor.lastrowid
+        if expected_version is not None:
+            cursor.execute("SELECT version FROM playlists WHERE id = %s", (playlist_id,))
+            (current_version,) = cursor.fetchone()
+            if current_version != expected_version:
+                raise VersionConflict(current_version)
+        cursor.execute(
+            "SELECT position, song_id, song_data FROM playlist_items WHERE playlist_id = %s FOR UPDATE",
+            (playlist_id,),
+        )
+        existing = {position: (song_id, _load_snapshot(data)) for position, song_id, data in cursor.fetchall()}
+
+        wanted = {(i + 1) * POSITION_STEP: ref for i, ref in enumerate(song_refs(cursor, songs))}
+        changed = [(position, ref) for position, ref in wanted.items() if existing.get(position) != ref]
+        removed = [position for position in existing if position not in wanted]
+
+        _upsert_items(cursor, playlist_id, changed)
+        _delete_positions(cursor, playlist_id, removed)
+        cursor.execute(
+            "UPDATE playlists SET song_count = %s, version = version + 1 WHERE id = %s",
+            (len(wanted), playlist_id),
+        )
+        cursor.execute("SELECT version FROM playlists WHERE id = %s", (playlist_id,))
+        (version,) = cursor.fetchone()
+        conn.commit()
+        invalidate_user(user_id)
+        return version
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class _PlaylistEditor:
+    """Applies add / remove / move operations to a playlist, issuing writes for the
+    changed rows only.
+
+    Operations address songs by 0-based index in the playlist as it stands after
+    the previous operations. Only positions are read up front; new positions are
+    picked between the neighbours, so an insert or move touches one row. When two
+    neighbours have no free position left the playlist is renumbered.
+    """
+
+    def __init__(self, cursor, playlist_id: int, positions: List[int]):
+        self.cursor = cursor
+        self.playlist_id = playlist_id
+        self.positions = positions          # current order
+        self.inserts: Dict[int, SongRef] = {}
+        self.deletes: set = set()           # stored positions to delete
+        self.moves: Dict[int, int] = {}     # stored position -> new position
+        self.origin: Dict[int, int] = {}    # current position -> stored position (moved rows)
+
+    def _check_index(self, index: int, allow_end: bool = False) -> None:
+        upper = len(self.positions) if allow_end else len(self.positions) - 1
+        if index < 0 or index > upper:
+            raise ValueError(f"Index {index} out of range (playlist has {len(self.positions)} songs)")
+
+    def _free_positions(self, index: int, count: int) -> List[int]:
+        """`count` unused positions that sort right before the song currently at `index`."""
+        left = self.positions[index - 1] if index > 0 else 0
+        if index == len(self.positions):
+            return [left + POSITION_STEP * (i + 1) for i in range(count)]
+        right = self.positions[index]
+        if right - left <= count:
+            self._renumber()
+            return self._free_positions(index, count)
+        gap = right - left
+        return [left + gap * (i + 1) // (count + 1) for i in range(count)]
+
+    def add(self, index: Optional[int], songs: List[dict]) -> None:
+        index = len(self.positions) if index is None else index
+        self._check_index(index, allow_end=True)
+        if not songs:
+            return
+        new_positions = self._free_positions(index, len(songs))
+        for position, ref in zip(new_positions, song_refs(self.cursor, songs)):
+            self.inserts[position] = ref
+        self.positions[index:index] = new_positions
+
+    def remove(self, index: int, count: int = 1) -> None:
+        self._check_index(index)
+        if count < 1:
+            raise ValueError(f"Count must be at least 1, not {count}")
+        self._check_index(index + count - 1)
+        for position in self.positions[index:index + count]:
+            if position in self.inserts:
+                del self.inserts[position]
+            else:
+                stored = self.origin.pop(position, position)
+                self.moves.pop(stored, None)
+                self.deletes.add(stored)
+        del self.positions[index:index + count]
+
+    def move(self, from_index: int, to_index: int) -> None:
+        self._check_index(from_index)
+        self._check_index(to_index)
+        if from_index == to_index:
+            return
+        # Slot in the list that still contains the song (so a renumber includes it)
+        (new_position,) = self._free_positions(to_index + 1 if to_index > from_index else to_index, 1)
+        position = self.positions.pop(from_index)
+        if position in self.inserts:
+            self.inserts[new_position] = self.inserts.pop(position)
+        else:
+            stored = self.origin.pop(position, position)
+            self.moves[stored] = new_position
+            self.origin[new_position] = stored
+        self.positions.insert(to_index, new_position)
+
+    def _renumber(self) -> None:
+        """Write pending changes, then respace every row to multiples of POSITION_STEP."""
+        self.flush()
+        renumbered = {old: (i + 1) * POSITION_STEP for i, old in enumerate(self.positions)}
+        self.moves = {old: new for old, new in renumbered.items() if old != new}
+        self.flush()
+        self.positions = [renumbered[p] for p in self.positions]
+
+    def flush(self) -> None:
+        """Issue the SQL for everything recorded so far."""
+        _delete_positions(self.cursor, self.playlist_id, sorted(self.deletes))
+        moves = list(self.moves.items())
+        # Move to negated targets first, then flip the sign, so rows can swap places
+        # without ever colliding on the primary key
+        for i in range(0, len(moves), 500):
+            chunk = moves[i:i + 500]
+            self.cursor.execute(
+                f"""
+                UPDATE playlist_items
+                SET position = CASE position {" ".join(["WHEN %s THEN %s"] * len(chunk))} END
+                WHERE playlist_id = %s AND position IN ({", ".join(["%s"] * len(chunk))})
+                """,
+                [v for old, new in chunk for v in (old, -new)] + [self.playlist_id] + [old for old, _ in chunk],
+            )
+        if moves:
+            self.cursor.execute(
+                "UPDATE playlist_items SET position = -position WHERE playlist_id = %s AND position < 0",
+                (self.playlist_id,),
+            )
+        _upsert_items(self.cursor, self.playlist_id, sorted(self.inserts.items()))
+        self.inserts, self.deletes, self.moves, self.origin = {}, set(), {}, {}
+
+
+def edit_playlist(conn, user_id: str, name: str, operations: List[dict],
+                  expected_version: Optional[int] = None) -> Tuple[int, int]:
+    """Apply add / remove / move operations in one transaction.
+
+    Each operation is {"op": "add", "index": i | None, "songs": [...]},
+    {"op": "remove", "index": i, "count": n} or
+    {"op": "move", "from_index": i, "to_index": j}.
+    Returns (new version, song count). Raises PlaylistNotFound, VersionConflict,
+    or ValueError for invalid operations.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT id, version FROM playlists WHERE user_id = %s AND name = %s FOR UPDATE",
+            (user_id, name),
+        )
+        row = cursor.fetchone()
+        if not row:
+            raise PlaylistNotFound(name)
+        playlist_id, current_version = row
+        if expected_version is not None and expected_version != current_version:
+            raise VersionConflict(current_version)
+
+        cursor.execute(
+            "SELECT position FROM playlist_items WHERE playlist_id = %s ORDER BY position",
+            (playlist_id,),
+        )
+        editor = _PlaylistEditor(cursor, playlist_id, [position for (position,) in cursor.fetchall()])
+        for operation in operations:
+            op = operation.get("op")
+            if op == "add":
+                editor.add(operation.get("index"), operation.get("songs") or [])
+            elif op == "remove":
+                editor.remove(operation["index"], operation.get("count", 1))
+            elif op == "move":
+                editor.move(operation["from_index"], operation["to_index"])
+            else:
+                raise ValueError(f"Unknown playlist operation: {op!r}")
+        editor.flush()
+
+        song_count = len(editor.positions)
+        cursor.execute(
+            "UPDATE playlists SET song_count = %s, version = version + 1 WHERE id = %s",
+            (song_count, playlist_id),
+        )
+        conn.commit()
+        invalidate_user(user_id)
+        return current_version + 1, song_count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def delete_playlist(conn, user_id: str, name: str) -> bool:
+    """Delete a playlist and (via ON DELETE CASCADE) its items."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM playlists WHERE user_id = %s AND name = %s", (user_id, name))
+        conn.commit()
+        invalidate_user(user_id)
+        return cursor.rowcount > 0
+    finally:
+        cursor.close()
+
+
+def migrate_legacy_playlists(conn) -> int:
+    """Copy playlists from the old one-row-per-song `user_playlists` table.
+
+    Playlists that already exist in the new tables are skipped, so this can be
+    re-run safely. Returns the number of playlists migrated.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """
+            SELECT up.user_id, up.playlist_name, up.song_data
+            FROM user_playlists up
+            LEFT JOIN playlists p ON p.user_id = up.user_id AND p.name = up.playlist_name
+            WHERE p.id IS NULL
+            ORDER BY up.user_id, up.playlist_name, up.id
+            """
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    legacy: Dict[Tuple[str, str], List[dict]] = OrderedDict()
+    for row in rows:
+        songs = legacy.setdefault((row["user_id"], row["playlist_name"]), [])
+        if row["song_data"]:
+            songs.append(json.loads(row["song_data"]))
+
+    for (user_id, name), songs in legacy.items():
+        save_playlist(conn, user_id, name, songs)
+    return len(legacy)
+
+
+def count_unresolved_items(conn) -> Dict[str, int]:
+    """Playlist items that do not point at a catalog song.
+
+    `snapshot`: stored as a snapshot (no catalog id could be resolved);
+    `dangling`: a song_id that is not in `songs` and no snapshot, i.e. the
+    title and artist of the song are unknown.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT
+                SUM(pi.song_id IS NULL),
+                SUM(pi.song_id IS NOT NULL AND s.song_id IS NULL AND pi.song_data IS NULL)
+            FROM playlist_items pi
+            LEFT JOIN songs s ON s.song_id = pi.song_id
+            """
+        )
+        snapshot, dangling = cursor.fetchone()
+        return {"snapshot": int(snapshot or 0), "dangling": int(dangling or 0)}
+    finally:
+        cursor.close()
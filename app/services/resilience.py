@@ -0,0 +1,116 @@
+"""Deadlines, circuit breakers and degraded-mode bookkeeping for search dependencies.
+
+Optional dependencies (keyword expansion, query embedding, MySQL enrichment) are
+called through `run_with_deadline` and a `CircuitBreaker`; when they are slow,
+failing or their breaker is open the caller falls back to a degraded mode and
+records it with `degrade(mode)`. main.py reports the modes of a request in the
+`X-Degraded` header.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional, Tuple
+
+from services.metrics import Counter
+
+DEGRADED_REQUESTS = Counter(
+    "melodymind_degraded_total", "Requests served in a degraded mode", ["mode"]
+)
+BREAKER_TRANSITIONS = Counter(
+    "melodymind_circuit_breaker_transitions_total", "Circuit breaker state changes", ["breaker", "state"]
+)
+
+# Degraded modes of the current request (None outside requests)
+request_degradations: ContextVar[Optional[List[str]]] = ContextVar("request_degradations", default=None)
+
+# Calls with a deadline run here so the request thread can give up on them;
+# a call that overruns keeps its pool thread until the client's own timeout
+_deadline_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="deadline")
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def run_with_deadline(fn: Callable[[], Any], seconds: float) -> Any:
+    """fn() or DeadlineExceeded after `seconds` (request context such as timings is kept)."""
+    context = contextvars.copy_context()
+    future = _deadline_pool.submit(context.run, fn)
+    try:
+        return future.result(timeout=seconds)
+    except FutureTimeout:
+        raise DeadlineExceeded(f"no result after {seconds}s")
+
+
+def degrade(mode: str, reason: Exception = None) -> None:
+    DEGRADED_REQUESTS.inc(mode)
+    modes = request_degradations.get()
+    if modes is not None and mode not in modes:
+        modes.append(mode)
+    print(f"[Degraded] {mode}: {type(reason).__name__ if reason else 'unavailable'} {reason or ''}".rstrip())
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets a single trial call through (half-open)
+    and closes again if it succeeds. Exceptions listed in `ignored_errors` are
+    answers from a healthy dependency (e.g. a 404) and do not count as failures."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 ignored_errors: Tuple[type, ...] = ()):
+        self.name = name
+        self.ignored_errors = ignored_errors
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(self.name, state)
+            print(f"[Breaker] {self.name} -> {state}")
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set_state("half_open")
+                return True
+            return False  # open, or half-open with the trial call still running
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._set_state("closed")
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def call(self, fn: Callable[[], Any], deadline: Optional[float] = None) -> Any:
+        """fn() through the breaker (and a deadline, if given); raises CircuitOpenError when open."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = run_with_deadline(fn, deadline) if deadline else fn()
+        except self.ignored_errors:
+            self.record_success()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
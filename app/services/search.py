@@ -1,29 +1,208 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from functools import lru_cache
-from typing import List, Optional
-import os, json
+from typing import Dict, List, Optional, Sequence, Tuple
+import os, json, secrets, time
 
-from elasticsearch import Elasticsearch
-from openai import OpenAI
+import numpy as np
 
-ES = Elasticsearch(os.getenv("ELASTICSEARCH_HOST", "http://elasticsearch:9200"))
-EMB_MODEL = "text-embedding-3-small"  # 1536-dimensional embedding
+from elasticsearch import NotFoundError
 
-CLIENT = OpenAI()
+from services.cache import SharedTTLCache, SingleFlight
+from services.clients import get_es, get_openai
+from services.metrics import request_timings, timed
+from services.resilience import CircuitBreaker, degrade, request_degradations
 
-# Generate 1536-dimensional embedding (cached)
+# Per-dependency deadlines (seconds). Embedding and keyword expansion are optional:
+# when they are slow or failing the search runs without them instead of erroring.
+# (Client-level timeouts are set in services/clients.py.)
+EMBED_DEADLINE_SECONDS = float(os.getenv("EMBED_DEADLINE_SECONDS", "3"))
+KEYWORD_DEADLINE_SECONDS = float(os.getenv("KEYWORD_DEADLINE_SECONDS", "2"))
+
+ES_INDEX = os.getenv("ELASTICSEARCH_INDEX", "songs")
+EMB_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# Must match the dims the index was built with (build_songs_index.py --dims);
+# text-embedding-3 vectors can be shortened to e.g. 256/512/768. Unset = model
+# default (1536 for text-embedding-3-small), like create_embeddings.py
+EMB_DIMS = int(os.getenv("EMBEDDING_DIMS")) if os.getenv("EMBEDDING_DIMS") else None
+# Only send `dimensions` when set; older models reject the parameter
+EMB_DIMS_KWARGS = {"dimensions": EMB_DIMS} if EMB_DIMS else {}
+# kNN candidates per shard; higher = better recall, slower queries
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "100"))
+
+# Deep pagination (search_page): vector hits are computed once per query, up to this depth
+SEARCH_VECTOR_DEPTH = int(os.getenv("SEARCH_VECTOR_DEPTH", "1000"))
+SEARCH_CURSOR_TTL_SECONDS = int(os.getenv("SEARCH_CURSOR_TTL_SECONDS", "300"))
+
+KEYWORD_MODEL = "gpt-4o-mini"
+
+# Precomputed embeddings / keywords for frequent prompts and the genre vocabulary,
+# written by scripts/warm_query_cache.py and loaded at startup (load_warm_cache)
+QUERY_WARM_CACHE_PATH = os.getenv(
+    "QUERY_WARM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "query_warm_cache.json"),
+)
+# (prompt -> row, float32 matrix); the matrix is a read-only memory map shared by all workers
+warm_embeddings: Tuple[Dict[str, int], Optional[np.ndarray]] = ({}, None)
+warm_keywords: Dict[str, List[str]] = {}
+
+
+def warm_embedding(text: str) -> Optional[List[float]]:
+    rows, vectors = warm_embeddings
+    row = rows.get(text)
+    return vectors[row].tolist() if row is not None else None
+
+EMBED_BREAKER = CircuitBreaker("openai_embeddings")
+KEYWORD_BREAKER = CircuitBreaker("openai_keywords")
+ES_BREAKER = CircuitBreaker("elasticsearch", ignored_errors=(NotFoundError,))
+
+# cursor -> paging state (query, point-in-time id, search_after). With several API
+# workers it must live in Redis, since the next page may be served by another worker.
+cursor_store = SharedTTLCache(
+    "search_cursor",
+    maxsize=int(os.getenv("SEARCH_CURSOR_CACHE_SIZE", "1024")),
+    redis_url=os.getenv("SEARCH_CURSOR_REDIS_URL", os.getenv("PLAYLIST_CACHE_REDIS_URL")),
+    ttl_seconds=SEARCH_CURSOR_TTL_SECONDS,
+)
+
+
+# Identical concurrent calls share one execution (a trending prompt costs one
+# embedding / expansion / ES query however many requests arrive at once)
+search_flights = SingleFlight("search")
+embed_flights = SingleFlight("embed")
+expand_flights = SingleFlight("keyword_expand")
+
+
+class CursorExpired(Exception):
+    pass
+
+# Generate EMB_DIMS-dimensional embedding (cached)
 @lru_cache(maxsize=256)
 def embed(text: str) -> List[float]:
-    return CLIENT.embeddings.create(model=EMB_MODEL, input=text).data[0].embedding
+    vec = warm_embedding(text)
+    if vec is not None:
+        return vec
+    # lru_cache does not block concurrent misses; the flight does
+    return embed_flights.do(
+        text, lambda: get_openai().embeddings.create(model=EMB_MODEL, input=text, **EMB_DIMS_KWARGS).data[0].embedding
+    )
+
+
+def embed_many(texts: Sequence[str]) -> List[List[float]]:
+    """Embed several texts with one API call (duplicates and warm-cached texts are not sent)."""
+    vectors = {text: warm_embedding(text) for text in texts if text in warm_embeddings[0]}
+    unique = [text for text in dict.fromkeys(texts) if text not in vectors]
+    if unique:
+        data = get_openai().embeddings.create(model=EMB_MODEL, input=unique, **EMB_DIMS_KWARGS).data
+        vectors.update((text, item.embedding) for text, item in zip(unique, sorted(data, key=lambda d: d.index)))
+    return [vectors[text] for text in texts]
+
+
+def warm_vectors_path(path: str) -> str:
+    """The embeddings of a warm cache live next to it as a float32 .npy matrix."""
+    return os.path.splitext(path)[0] + ".npy"
+
+
+def write_warm_cache(entries: Dict[str, dict], path: str = QUERY_WARM_CACHE_PATH) -> None:
+    """Write {prompt: {"embedding": [...], "keywords": [...]}} for load_warm_cache."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    matrix = np.asarray([entry["embedding"] for entry in entries.values()], dtype=np.float32)
+    payload = {
+        "embedding_model": EMB_MODEL,
+        "embedding_dims": EMB_DIMS,
+        "keyword_model": KEYWORD_MODEL,
+        "created_at": int(time.time()),
+        "entries": {
+            prompt: {"row": row, "keywords": entry["keywords"]}
+            for row, (prompt, entry) in enumerate(entries.items())
+        },
+    }
+    # Write both files under temporary names first so readers never see a half-written cache
+    vectors_path = warm_vectors_path(path)
+    with open(f"{vectors_path}.tmp", "wb") as f:
+        np.save(f, matrix)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(f"{vectors_path}.tmp", vectors_path)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_warm_cache(path: str = QUERY_WARM_CACHE_PATH) -> int:
+    """Load a cache written by write_warm_cache into warm_embeddings / warm_keywords.
+
+    The embeddings matrix is memory-mapped read-only, so every worker process
+    shares the same page-cache copy instead of holding its own. Embeddings from a
+    different model or dimension are skipped (they would not match the index);
+    keywords from a different chat model are skipped too. Returns the number of
+    prompts loaded.
+    """
+    global warm_embeddings, warm_keywords
+    try:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        vectors = np.load(warm_vectors_path(path), mmap_mode="r")
+    except FileNotFoundError:
+        print(f"[Search] No warm query cache at {path}; first requests go to OpenAI.")
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"[Search] Could not read warm query cache {path}: {e}")
+        return 0
+
+    entries = payload.get("entries", {})
+    use_embeddings = (payload.get("embedding_model"), payload.get("embedding_dims")) == (EMB_MODEL, EMB_DIMS) \
+        and vectors.ndim == 2 and vectors.shape[0] == len(entries) and vectors.shape[1] == (EMB_DIMS or vectors.shape[1])
+    use_keywords = payload.get("keyword_model") == KEYWORD_MODEL
+    if not use_embeddings:
+        print(f"[Search] Warm cache embeddings are {payload.get('embedding_model')} @ "
+              f"{payload.get('embedding_dims')} dims, not {EMB_MODEL} @ {EMB_DIMS or 'default'}; skipping them.")
+    # Build new tables and swap them in, so concurrent lookups see either the old or the new cache
+    rows = {prompt: entry["row"] for prompt, entry in entries.items()} if use_embeddings else {}
+    keywords = {prompt: list(entry["keywords"]) for prompt, entry in entries.items()
+                if use_keywords and entry.get("keywords") is not None}
+    warm_embeddings, warm_keywords = (rows, vectors if use_embeddings else None), keywords
+    print(f"[Search] Warm query cache: {len(entries)} prompts loaded from {path}")
+    return len(entries)
+
+
+def check_index_manifest(index: str = ES_INDEX) -> None:
+    """Raise if the index was built for a different embedding model or dimension.
+
+    build_songs_index.py records the model in the mapping's `_meta`; the vector
+    dims come from the `embedding` field itself. A missing index is not an error
+    (the data loader may still be running).
+    """
+    try:
+        mappings = next(iter(get_es().indices.get_mapping(index=index).values()))["mappings"]
+    except NotFoundError:
+        print(f"[Search] Index '{index}' not found; skipping embedding manifest check.")
+        return
+
+    index_model = mappings.get("_meta", {}).get("embedding_model")
+    index_dims = mappings.get("properties", {}).get("embedding", {}).get("dims")
+    problems = []
+    if index_model and index_model != EMB_MODEL:
+        problems.append(f"model '{index_model}' != OPENAI_EMBEDDING_MODEL '{EMB_MODEL}'")
+    if index_dims and EMB_DIMS and index_dims != EMB_DIMS:
+        problems.append(f"dims {index_dims} != EMBEDDING_DIMS {EMB_DIMS}")
+    if problems:
+        raise RuntimeError(f"Index '{index}' does not match query embeddings: {'; '.join(problems)}")
+    print(f"[Search] Index '{index}' matches {EMB_MODEL} @ {EMB_DIMS or 'default'} dims.")
 
 
 def keyword_expand(prompt: str) -> List[str]:
+    if prompt in warm_keywords:
+        return list(warm_keywords[prompt])
+    return expand_flights.do(prompt, lambda: _keyword_expand(prompt))
+
+
+def _keyword_expand(prompt: str) -> List[str]:
     sys = (
         "You are a music assistant. "
         "Extract up to 10 concise English keywords that best describe the prompt. "
         "Return exactly: {\"keywords\": [ ... ]}"
     )
-    rsp = CLIENT.chat.completions.create(
-        model="gpt-4o-mini",
+    rsp = get_openai().chat.completions.create(
+        model=KEYWORD_MODEL,
         messages=[{"role": "system", "content": sys},
                   {"role": "user", "content": prompt}],
         temperature=0
@@ -36,20 +215,29 @@ def keyword_expand(prompt: str) -> List[str]:
     return [str(k).strip() for k in raw if str(k).strip()]
 
 
-def search(prompt: str, size: int = 20, filters: Optional[List] = None):
-    vec = embed(prompt)
-    kws = keyword_expand(prompt)
+def query_vector(prompt: str) -> Optional[List[float]]:
+    """Embedding of the prompt, or None (BM25-only search) when OpenAI is slow or failing."""
+    try:
+        with timed("embed"):
+            return EMBED_BREAKER.call(lambda: embed(prompt), deadline=EMBED_DEADLINE_SECONDS)
+    except Exception as e:
+        degrade("no_vector", e)
+        return None
 
-    # Build the main query
-    should_queries = [
-        {
-            "knn": {
-                "field": "embedding",
-                "query_vector": vec,
-                "num_candidates": 100,
-                "_name": "vector_search"
-            }
-        },
+
+def query_keywords(prompt: str) -> List[str]:
+    """Expanded keywords, or [] (search with the prompt only) when OpenAI is slow or failing."""
+    try:
+        with timed("keyword_expand"):
+            return KEYWORD_BREAKER.call(lambda: keyword_expand(prompt), deadline=KEYWORD_DEADLINE_SECONDS)
+    except Exception as e:
+        degrade("no_keywords", e)
+        return []
+
+
+def text_queries(prompt: str, kws: List[str]) -> list:
+    """The BM25 clauses of the hybrid query (expanded keywords and the raw prompt)."""
+    keyword_query = [
         {
             "multi_match": {
                 "query": " ".join(kws),
@@ -57,7 +245,9 @@ def search(prompt: str, size: int = 20, filters: Optional[List] = None):
                 "type": "most_fields",
                 "_name": "keyword_search"
             }
-        },
+        }
+    ] if kws else []
+    return keyword_query + [
         {
             "multi_match": {
                 "query": prompt,
@@ -69,6 +259,22 @@ def search(prompt: str, size: int = 20, filters: Optional[List] = None):
         }
     ]
 
+
+def build_query(prompt: str, vec: Optional[List[float]], kws: List[str], size: int = 20,
+                filters: Optional[List] = None) -> dict:
+    # Build the main query (without the kNN clause when no embedding is available)
+    should_queries = [
+        {
+            "knn": {
+                "field": "embedding",
+                "query_vector": vec,
+                "num_candidates": max(KNN_NUM_CANDIDATES, size),
+                "_name": "vector_search"
+            }
+        },
+    ] if vec is not None else []
+    should_queries += text_queries(prompt, kws)
+
     # Build the main bool query
     bool_query = {"should": should_queries}
     
@@ -76,12 +282,183 @@ def search(prompt: str, size: int = 20, filters: Optional[List] = None):
     if filters:
         bool_query["filter"] = filters
 
-    es_query = {
+    return {
         "size": size,
         "query": {
             "bool": bool_query
         }
     }
-    
-    res = ES.search(index="songs", body=es_query)
+
+
+def search(prompt: str, size: int = 20, filters: Optional[List] = None):
+    key = (prompt, size, json.dumps(filters, sort_keys=True))
+    hits, timings, degradations = search_flights.do(key, lambda: _traced(lambda: _search(prompt, size, filters)))
+    # Every caller of a coalesced search reports its stage timings and degraded modes
+    current_timings = request_timings.get()
+    if current_timings is not None:
+        for stage, seconds in timings.items():
+            current_timings[stage] = current_timings.get(stage, 0.0) + seconds
+    current_degradations = request_degradations.get()
+    if current_degradations is not None:
+        current_degradations.extend(mode for mode in degradations if mode not in current_degradations)
+    return hits
+
+
+def _traced(fn):
+    """(fn(), stage timings, degraded modes) with the timings / modes recorded by fn
+    collected separately instead of into the calling request."""
+    timings, degradations = {}, []
+    timings_token = request_timings.set(timings)
+    degradations_token = request_degradations.set(degradations)
+    try:
+        return fn(), timings, degradations
+    finally:
+        request_timings.reset(timings_token)
+        request_degradations.reset(degradations_token)
+
+
+def _search(prompt: str, size: int = 20, filters: Optional[List] = None):
+    vec = query_vector(prompt)
+    kws = query_keywords(prompt)
+    es_query = build_query(prompt, vec, kws, size, filters)
+    with timed("es_search"):
+        res = ES_BREAKER.call(lambda: get_es().search(index=ES_INDEX, body=es_query))
     return res["hits"]["hits"]
+
+
+def search_many(queries: Sequence[Tuple[str, int, Optional[List]]]) -> List[list]:
+    """Run several (prompt, size, filters) searches: one embeddings call, keyword
+    expansions in parallel, and one `_msearch` round trip. Returns hits per query
+    (empty, with a `failed_searches` degradation, for searches that failed)."""
+    if not queries:
+        return []
+    prompts = [prompt for prompt, _, _ in queries]
+    try:
+        with timed("embed"):
+            vecs = EMBED_BREAKER.call(lambda: embed_many(prompts), deadline=EMBED_DEADLINE_SECONDS)
+    except Exception as e:
+        degrade("no_vector", e)
+        vecs = [None] * len(prompts)
+    # One context copy per call so degradations are recorded on this request
+    contexts = [copy_context() for _ in prompts]
+    with ThreadPoolExecutor(max_workers=min(8, len(prompts))) as pool:
+        kws_list = list(pool.map(lambda ctx, prompt: ctx.run(query_keywords, prompt), contexts, prompts))
+
+    searches = []
+    for (prompt, size, filters), vec, kws in zip(queries, vecs, kws_list):
+        searches.append({"index": ES_INDEX})
+        searches.append(build_query(prompt, vec, kws, size, filters))
+    with timed("es_msearch"):
+        res = ES_BREAKER.call(lambda: get_es().msearch(searches=searches))
+
+    results = []
+    for i, response in enumerate(res["responses"]):
+        if "error" in response:
+            # The other searches of the batch are still answered; this one comes back empty
+            degrade("failed_searches", RuntimeError(f"msearch item {i} failed: {response['error']}"))
+            results.append([])
+        else:
+            results.append(response["hits"]["hits"])
+    return results
+
+
+def vector_candidates(vec: List[float], depth: int = SEARCH_VECTOR_DEPTH,
+                      filters: Optional[List] = None) -> Dict[str, float]:
+    """song_id -> similarity score of the `depth` nearest songs that match `filters`."""
+    knn = {"field": "embedding", "query_vector": vec, "k": depth,
+           "num_candidates": max(KNN_NUM_CANDIDATES, depth)}
+    if filters:
+        # Pre-filter like the knn query of build_query (filtered by its bool filter), so
+        # selective filters still get `depth` matching candidates
+        knn["filter"] = filters
+    res = ES_BREAKER.call(lambda: get_es().search(
+        index=ES_INDEX,
+        knn=knn,
+        size=depth,
+        source=["song_id"],
+    ))
+    return {h["_source"]["song_id"]: h["_score"] for h in res["hits"]["hits"]}
+
+
+def paged_query(prompt: str, kws: List[str], candidates: Dict[str, float],
+                filters: Optional[List] = None) -> dict:
+    """Hybrid query whose vector clause replays precomputed kNN scores, so later
+    pages score documents exactly like the first one without another kNN search."""
+    should_queries = []
+    if candidates:
+        should_queries.append({
+            "script_score": {
+                "query": {"terms": {"song_id": list(candidates)}},
+                "script": {"source": "params.scores[doc['song_id'].value]", "params": {"scores": candidates}},
+                "_name": "vector_search"
+            }
+        })
+    should_queries += text_queries(prompt, kws)
+    bool_query = {"should": should_queries}
+    if filters:
+        bool_query["filter"] = filters
+    return {"bool": bool_query}
+
+
+def search_page(prompt: Optional[str] = None, size: int = 20, filters: Optional[List] = None,
+                cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    """One page of hybrid search results and the cursor of the next page (None at the end).
+
+    The first call (no cursor) embeds and expands the prompt, fetches the vector
+    candidates and opens a point-in-time; later pages reuse all of that and only
+    run the lexical query with search_after. Raises CursorExpired for unknown or
+    expired cursors and ValueError if a cursor is sent with different filters.
+    """
+    filters_key = json.dumps(filters or [], sort_keys=True)
+    if cursor:
+        found, state = cursor_store.get(cursor)
+        if not found:
+            raise CursorExpired(cursor)
+        # Filters may be omitted on later pages; the cursor keeps those of the first page
+        if filters and state["filters"] != filters_key:
+            raise ValueError("Filters differ from the ones the cursor was created with")
+    else:
+        kws = query_keywords(prompt)
+        vec = query_vector(prompt)
+        candidates = {}
+        if vec is not None:
+            with timed("es_knn"):
+                candidates = vector_candidates(vec, filters=filters)
+        with timed("es_open_pit"):
+            pit = ES_BREAKER.call(
+                lambda: get_es().open_point_in_time(index=ES_INDEX, keep_alive=f"{SEARCH_CURSOR_TTL_SECONDS}s")
+            )
+        state = {"query": paged_query(prompt, kws, candidates, filters), "filters": filters_key,
+                 "pit": pit["id"], "search_after": None}
+
+    body = {
+        "size": size,
+        "query": state["query"],
+        "pit": {"id": state["pit"], "keep_alive": f"{SEARCH_CURSOR_TTL_SECONDS}s"},
+        "sort": [{"_score": "desc"}, {"_shard_doc": "asc"}],
+        "track_total_hits": False,
+    }
+    if state["search_after"]:
+        body["search_after"] = state["search_after"]
+    try:
+        with timed("es_search"):
+            res = ES_BREAKER.call(lambda: get_es().search(body=body))
+    except NotFoundError:
+        raise CursorExpired(cursor)
+    hits = res["hits"]["hits"]
+
+    if len(hits) < size:
+        try:
+            get_es().close_point_in_time(id=res.get("pit_id", state["pit"]))
+        except NotFoundError:
+            pass
+        return hits, None
+
+    next_cursor = secrets.token_urlsafe(16)
+    cursor_store.set(next_cursor, {
+        "query": state["query"],
+        "filters": state["filters"],
+        "pit": res.get("pit_id", state["pit"]),
+        "search_after": hits[-1]["sort"],
+    })
+    return hits, next_cursor
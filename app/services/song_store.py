@@ -0,0 +1,91 @@
+"""In-memory copy of the search enrichment fields for the whole catalog.
+
+release_date, youtube_music_url and energy only change when the catalog is
+reloaded or song links are fetched, so instead of a MySQL query per search
+they are loaded once into columnar arrays (one row per song, indexed by a
+song_id -> row dict) and looked up in memory. The store is reloaded when
+get_enrichment_version() changes (main.py polls it) or on request.
+"""
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from services.songs import get_all_song_enrichment, get_enrichment_version
+
+
+class _Snapshot:
+    """One immutable load of the store; replaced as a whole on reload."""
+    __slots__ = ("rows", "release_date", "youtube_music_url", "energy", "version", "loaded_at")
+
+    def __init__(self, enrichment: Dict[str, dict], version: tuple):
+        self.rows = {song_id: row for row, song_id in enumerate(enrichment)}
+        values = list(enrichment.values())
+        # Fixed-width unicode / float arrays: a few flat buffers instead of
+        # one Python object per value ("" / NaN mark missing values)
+        self.release_date = np.array([v["release_date"] or "" for v in values] or [""], dtype=str)
+        self.youtube_music_url = np.array([v["youtube_music_url"] or "" for v in values] or [""], dtype=str)
+        self.energy = np.array([np.nan if v["energy"] is None else v["energy"] for v in values], dtype=np.float64)
+        self.version = version
+        self.loaded_at = time.time()
+
+
+class SongStore:
+    def __init__(self):
+        self._snapshot: Optional[_Snapshot] = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def load(self, conn) -> int:
+        """(Re)load every song; lookups keep using the previous snapshot until this returns."""
+        with self._reload_lock:
+            start = time.perf_counter()
+            version = get_enrichment_version(conn)
+            snapshot = _Snapshot(get_all_song_enrichment(conn), version)
+            self._snapshot = snapshot
+        print(f"[SongStore] Loaded {len(snapshot.rows)} songs in {time.perf_counter() - start:.2f}s")
+        return len(snapshot.rows)
+
+    def refresh_if_changed(self, conn) -> bool:
+        """Reload when the enrichment version differs from the loaded one."""
+        snapshot = self._snapshot
+        if snapshot is not None and get_enrichment_version(conn) == snapshot.version:
+            return False
+        self.load(conn)
+        return True
+
+    def lookup(self, song_ids: Iterable[str]) -> Dict[str, dict]:
+        """Same result as songs.get_song_enrichment, from memory (unknown ids are left out)."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {}
+        enrichment = {}
+        for song_id in song_ids:
+            row = snapshot.rows.get(song_id)
+            if row is None:
+                continue
+            energy = snapshot.energy[row]
+            enrichment[song_id] = {
+                "release_date": str(snapshot.release_date[row]) or None,
+                "youtube_music_url": str(snapshot.youtube_music_url[row]) or None,
+                "energy": None if np.isnan(energy) else float(energy),
+            }
+        return enrichment
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "songs": len(snapshot.rows),
+            "array_bytes": snapshot.release_date.nbytes + snapshot.youtube_music_url.nbytes + snapshot.energy.nbytes,
+            "loaded_at": snapshot.loaded_at,
+        }
+
+
+song_store = SongStore()
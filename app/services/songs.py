@@ -0,0 +1,131 @@
+from typing import Dict, Iterable, Optional
+
+# One row per song with the fields the frontend shows for a SongResult.
+# The artist join mirrors build_songs_index.py (first artist of songs.artists).
+SONG_METADATA_QUERY = """
+SELECT
+    s.song_id,
+    s.song_name,
+    s.popularity,
+    ar.name AS name_artists,
+    t.release_date,
+    m.spotify_url,
+    m.youtube_music_url,
+    af.energy
+FROM songs s
+LEFT JOIN artists ar
+    ON ar.artist_id = TRIM(BOTH "'" FROM SUBSTRING_INDEX(SUBSTRING_INDEX(s.artists, "'", 2), "'", -1))
+LEFT JOIN tracks t ON s.song_id = t.song_id
+LEFT JOIN melodymind_song_links m ON s.song_id = m.song_id
+LEFT JOIN acoustic_features af ON s.song_id = af.song_id
+WHERE s.song_id IN ({placeholders})
+"""
+
+
+# Fields api_search adds to the ES hits; one query instead of one per table
+ALL_SONG_ENRICHMENT_QUERY = """
+SELECT {hint}s.song_id, t.release_date, m.youtube_music_url, af.energy
+FROM songs s
+LEFT JOIN tracks t ON s.song_id = t.song_id
+LEFT JOIN melodymind_song_links m ON s.song_id = m.song_id
+LEFT JOIN acoustic_features af ON s.song_id = af.song_id
+"""
+SONG_ENRICHMENT_QUERY = ALL_SONG_ENRICHMENT_QUERY + """WHERE s.song_id IN ({placeholders})
+"""
+
+# Changes whenever songs are (re)loaded, song links are fetched or a release_date /
+# energy value changes; polled by the song store. tracks and acoustic_features
+# have no updated_at, so their enrichment columns are fingerprinted with a checksum.
+ENRICHMENT_VERSION_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM songs) AS songs,
+    (SELECT COUNT(*) FROM melodymind_song_links) AS links,
+    (SELECT MAX(updated_at) FROM melodymind_song_links) AS links_updated_at,
+    (SELECT BIT_XOR(CRC32(CONCAT_WS('|', song_id, release_date))) FROM tracks) AS tracks_checksum,
+    (SELECT BIT_XOR(CRC32(CONCAT_WS('|', song_id, energy))) FROM acoustic_features) AS features_checksum
+"""
+
+
+def song_from_row(row: dict) -> dict:
+    """Catalog row -> dict with the SongResult field names."""
+    return {
+        "song_id": row["song_id"],
+        "title": row.get("song_name") or "Unknown Title",
+        "artist": row.get("name_artists") or "Unknown Artist",
+        "spotify_url": row.get("spotify_url"),
+        "youtube_music_url": row.get("youtube_music_url"),
+        "popularity": int(row["popularity"]) if row.get("popularity") is not None else None,
+        "release_date": str(row["release_date"]) if row.get("release_date") else None,
+        "energy": float(row["energy"]) if row.get("energy") is not None else None,
+    }
+
+
+def get_song_metadata(conn, song_ids: Iterable[str]) -> Dict[str, dict]:
+    """Hydrate song references from the catalog with a single query."""
+    ids = list(dict.fromkeys(i for i in song_ids if i))
+    if not ids:
+        return {}
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(SONG_METADATA_QUERY.format(placeholders=",".join(["%s"] * len(ids))), ids)
+        songs = {}
+        for row in cursor.fetchall():
+            # tracks may hold several rows per song; keep the first
+            songs.setdefault(row["song_id"], song_from_row(row))
+        return songs
+    finally:
+        cursor.close()
+
+
+def get_song_enrichment(conn, song_ids: Iterable[str], timeout_ms: Optional[int] = None) -> Dict[str, dict]:
+    """release_date / youtube_music_url / energy for search hits, with a single query.
+
+    With timeout_ms the server aborts the query after that long (MAX_EXECUTION_TIME hint).
+    """
+    ids = list(dict.fromkeys(i for i in song_ids if i))
+    if not ids:
+        return {}
+    cursor = conn.cursor(dictionary=True)
+    try:
+        hint = f"/*+ MAX_EXECUTION_TIME({int(timeout_ms)}) */ " if timeout_ms else ""
+        cursor.execute(SONG_ENRICHMENT_QUERY.format(hint=hint, placeholders=",".join(["%s"] * len(ids))), ids)
+        enrichment = {}
+        for row in cursor.fetchall():
+            # tracks may hold several rows per song; keep the first
+            enrichment.setdefault(row["song_id"], enrichment_from_row(row))
+        return enrichment
+    finally:
+        cursor.close()
+
+
+def enrichment_from_row(row: dict) -> dict:
+    return {
+        "release_date": str(row["release_date"]) if row["release_date"] else None,
+        "youtube_music_url": row["youtube_music_url"],
+        "energy": float(row["energy"]) if row["energy"] else None,
+    }
+
+
+def get_all_song_enrichment(conn) -> Dict[str, dict]:
+    """get_song_enrichment for the whole catalog (loads the in-memory song store)."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(ALL_SONG_ENRICHMENT_QUERY.format(hint=""))
+        enrichment = {}
+        for row in cursor.fetchall():
+            enrichment.setdefault(row["song_id"], enrichment_from_row(row))
+        return enrichment
+    finally:
+        cursor.close()
+
+
+def get_enrichment_version(conn) -> tuple:
+    """Fingerprint of the enrichment data; differs after a data load or link update."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(ENRICHMENT_VERSION_QUERY)
+        row = cursor.fetchone() or {}
+        return (row.get("songs"), row.get("links"), str(row.get("links_updated_at")),
+                row.get("tracks_checksum"), row.get("features_checksum"))
+    finally:
+        cursor.close()
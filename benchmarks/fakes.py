@@ -0,0 +1,353 @@
+"""Deterministic local stand-ins for OpenAI, Elasticsearch and MySQL.
+
+`install()` patches the client constructors (openai.OpenAI,
+elasticsearch.Elasticsearch, mysql.connector.connect) before the app is
+imported, so services.clients / services.db build fakes instead of real
+clients and no network, API key or database is needed. Every fake sleeps for a
+configurable latency so the numbers resemble the real services, and all data is
+generated from fixed seeds so runs are comparable.
+
+The fake Elasticsearch understands the queries the app sends: bool queries
+with knn / multi_match / script_score should-clauses and range / match filters,
+_msearch, point-in-time + search_after, and the mapping read by
+check_index_manifest.
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+
+VOCABULARY = (
+    "love night heart dance summer rain fire dream baby girl time light road home "
+    "blue moon star city river sky party lonely happy sad chill energy drive morning "
+    "midnight ocean wild young forever gold broken memory freedom sunset storm"
+).split()
+ARTISTS = [f"Artist {i}" for i in range(500)]
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokens(text):
+    return _TOKEN.findall(str(text or "").lower())
+
+
+def seeded_vector(text, dims):
+    """Unit vector derived only from `text` (same text -> same vector)."""
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    vec = rng.standard_normal(dims).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+class Latency:
+    """Simulated service latencies in seconds."""
+    def __init__(self, embed=0.08, chat=0.3, es=0.02, mysql=0.005):
+        self.embed = embed
+        self.chat = chat
+        self.es = es
+        self.mysql = mysql
+
+
+LATENCY = Latency()
+
+
+# ──────────────────────────────────────────── synthetic catalog
+class Catalog:
+    """Synthetic songs shared by the fake Elasticsearch and MySQL."""
+
+    def __init__(self, size=5000, dims=1536, seed=42):
+        rng = np.random.default_rng(seed)
+        self.dims = dims
+        self.songs = []
+        for i in range(size):
+            words = rng.choice(VOCABULARY, size=40)
+            self.songs.append({
+                "song_id": f"{i:022d}",
+                "song_name": " ".join(words[:3]).title(),
+                "name_artists": ARTISTS[int(rng.integers(len(ARTISTS)))],
+                "lyrics": " ".join(words),
+                "popularity": int(rng.integers(0, 100)),
+                "energy": round(float(rng.random()), 3),
+                "release_date": f"{int(rng.integers(1960, 2020))}-01-01",
+                "spotify_url": f"https://open.spotify.com/track/{i:022d}",
+                "youtube_music_url": f"https://music.youtube.com/watch?v={i:011d}",
+            })
+        vectors = rng.standard_normal((size, dims)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.by_id = {song["song_id"]: i for i, song in enumerate(self.songs)}
+
+        # field -> token -> doc indices, for BM25-like scoring
+        self.postings = {}
+        for field in ("song_name", "name_artists", "lyrics"):
+            postings = {}
+            for i, song in enumerate(self.songs):
+                for token in set(tokens(song[field])):
+                    postings.setdefault(token, []).append(i)
+            self.postings[field] = {t: np.array(ids) for t, ids in postings.items()}
+
+
+CATALOG = None
+
+
+# ──────────────────────────────────────────── OpenAI
+class FakeOpenAI:
+    def __init__(self, *args, **kwargs):
+        self.embeddings = SimpleNamespace(create=self._embed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+
+    def close(self):
+        pass
+
+    def _embed(self, model, input, dimensions=None, **kwargs):
+        time.sleep(LATENCY.embed)
+        texts = [input] if isinstance(input, str) else list(input)
+        dims = dimensions or CATALOG.dims
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=seeded_vector(text, dims).tolist())
+            for i, text in enumerate(texts)
+        ])
+
+    def _chat(self, model, messages, **kwargs):
+        time.sleep(LATENCY.chat)
+        prompt = messages[-1]["content"]
+        rng = np.random.default_rng(zlib.crc32(prompt.encode("utf-8")))
+        keywords = list(rng.choice(VOCABULARY, size=5, replace=False))
+        content = json.dumps({"keywords": keywords})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+# ──────────────────────────────────────────── Elasticsearch
+class FakeNotFound(Exception):
+    pass
+
+
+class FakeIndices:
+    def get_mapping(self, index):
+        return {index: {"mappings": {
+            "_meta": {"embedding_model": os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+                      "embedding_dims": CATALOG.dims},
+            "properties": {"embedding": {"type": "dense_vector", "dims": CATALOG.dims}},
+        }}}
+
+
+class FakeElasticsearch:
+    def __init__(self, *args, **kwargs):
+        self.indices = FakeIndices()
+        self._pits = {}
+        self._lock = threading.Lock()
+
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+    # scoring ----------------------------------------------------------
+    def _match_scores(self, clause):
+        """most_fields multi_match: boosted count of matching query tokens per field."""
+        scores = np.zeros(len(CATALOG.songs), dtype=np.float32)
+        query_tokens = tokens(clause["query"])
+        for field_spec in clause["fields"]:
+            field, _, boost = field_spec.partition("^")
+            postings = CATALOG.postings[field]
+            for token in query_tokens:
+                ids = postings.get(token)
+                if ids is not None:
+                    scores[ids] += float(boost or 1.0)
+        return scores
+
+    def _clause_scores(self, clause):
+        if "knn" in clause:
+            knn = clause["knn"]
+            sims = CATALOG.vectors @ np.asarray(knn["query_vector"], dtype=np.float32)
+            # Like ES, the knn filter is applied while searching, not to the top k
+            sims[~self._filter_mask(knn.get("filter"))] = -np.inf
+            k = min(knn.get("num_candidates", 100), len(sims))
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.isfinite(sims[top])]
+            scores = np.zeros_like(sims)
+            scores[top] = (1 + sims[top]) / 2
+            return knn.get("_name"), scores
+        if "multi_match" in clause:
+            return clause["multi_match"].get("_name"), self._match_scores(clause["multi_match"])
+        if "script_score" in clause:
+            replay = clause["script_score"]["script"]["params"]["scores"]
+            scores = np.zeros(len(CATALOG.songs), dtype=np.float32)
+            for song_id, score in replay.items():
+                scores[CATALOG.by_id[song_id]] = score
+            return clause["script_score"].get("_name"), scores
+        raise ValueError(f"Unsupported clause: {list(clause)}")
+
+    def _filter_mask(self, filters):
+        mask = np.ones(len(CATALOG.songs), dtype=bool)
+        for f in filters or []:
+            if "range" in f:
+                (field, bounds), = f["range"].items()
+                values = np.array([song[field] for song in CATALOG.songs])
+                if "gte" in bounds:
+                    mask &= values >= bounds["gte"]
+                if "lte" in bounds:
+                    mask &= values <= bounds["lte"]
+            elif "match" in f:
+                (field, text), = f["match"].items()
+                wanted = set(tokens(text))
+                mask &= np.array([bool(wanted & set(tokens(song[field]))) for song in CATALOG.songs])
+        return mask
+
+    def _ranked(self, query):
+        bool_query = query["bool"]
+        total = np.zeros(len(CATALOG.songs), dtype=np.float32)
+        named = []
+        for clause in bool_query.get("should", []):
+            name, scores = self._clause_scores(clause)
+            total += scores
+            named.append((name, scores))
+        mask = self._filter_mask(bool_query.get("filter")) & (total > 0)
+        order = np.nonzero(mask)[0]
+        # score desc, doc order asc (like _shard_doc)
+        order = order[np.lexsort((order, -total[order]))]
+        return order, total, named
+
+    def _hit(self, i, total, named, with_sort=False):
+        source = {k: v for k, v in CATALOG.songs[i].items() if k not in ("release_date", "youtube_music_url")}
+        hit = {
+            "_id": source["song_id"],
+            "_score": float(total[i]),
+            "_source": source,
+            "matched_queries": [name for name, scores in named if name and scores[i] > 0],
+        }
+        if with_sort:
+            hit["sort"] = [float(total[i]), int(i)]
+        return hit
+
+    def _run(self, body):
+        order, total, named = self._ranked(body["query"])
+        size = body.get("size", 10)
+        search_after = body.get("search_after")
+        if search_after:
+            score, doc = search_after
+            keep = (total[order] < score) | ((total[order] == score) & (order > doc))
+            order = order[keep]
+        with_sort = "sort" in body
+        return {"hits": {"hits": [self._hit(i, total, named, with_sort) for i in order[:size]]}}
+
+    # API ----------------------------------------------------------------
+    def search(self, index=None, body=None, knn=None, size=None, source=None, **kwargs):
+        time.sleep(LATENCY.es)
+        if knn is not None:
+            body = {"query": {"bool": {"should": [{"knn": dict(knn, num_candidates=knn["k"])}],
+                                       "filter": knn.get("filter")}},
+                    "size": size or knn["k"]}
+        if "pit" in body:
+            with self._lock:
+                if body["pit"]["id"] not in self._pits:
+                    raise FakeNotFound(body["pit"]["id"])
+        result = self._run(body)
+        if "pit" in body:
+            result["pit_id"] = body["pit"]["id"]
+        return result
+
+    def msearch(self, searches=None, body=None, **kwargs):
+        time.sleep(LATENCY.es)
+        searches = searches or body
+        return {"responses": [self._run(query) for query in searches[1::2]]}
+
+    def open_point_in_time(self, index, keep_alive):
+        with self._lock:
+            pit = f"pit-{len(self._pits)}"
+            self._pits[pit] = index
+        return {"id": pit}
+
+    def close_point_in_time(self, id):
+        with self._lock:
+            self._pits.pop(id, None)
+        return {"succeeded": True}
+
+
+# ──────────────────────────────────────────── MySQL
+class FakeCursor:
+    def __init__(self, dictionary=False):
+        self.dictionary = dictionary
+        self.rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        time.sleep(LATENCY.mysql)
+        self.rows = []
+        if "links_updated_at" in sql:
+            # services.songs.get_enrichment_version
+            self.rows.append({
+                "songs": len(CATALOG.songs), "links": len(CATALOG.songs), "links_updated_at": None,
+                "tracks_checksum": zlib.crc32(repr([s["release_date"] for s in CATALOG.songs]).encode()),
+                "features_checksum": zlib.crc32(repr([s["energy"] for s in CATALOG.songs]).encode()),
+            })
+        elif "acoustic_features" in sql:
+            # services.songs enrichment / metadata queries (all songs without an IN list)
+            for song_id in (params if "IN (" in sql else CATALOG.by_id):
+                i = CATALOG.by_id.get(song_id)
+                if i is None:
+                    continue
+                song = CATALOG.songs[i]
+                self.rows.append({
+                    "song_id": song_id,
+                    "song_name": song["song_name"],
+                    "name_artists": song["name_artists"],
+                    "popularity": song["popularity"],
+                    "release_date": song["release_date"],
+                    "spotify_url": song["spotify_url"],
+                    "youtube_music_url": song["youtube_music_url"],
+                    "energy": song["energy"],
+                })
+        self.rowcount = len(self.rows)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows if self.dictionary else [tuple(row.values()) for row in rows]
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, dictionary=False):
+        return FakeCursor(dictionary)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_connect(**kwargs):
+    time.sleep(LATENCY.mysql)
+    return FakeConnection()
+
+
+# ──────────────────────────────────────────── wiring
+def install(catalog_size=5000, dims=1536, latency=None):
+    """Patch the client libraries; call before importing the app."""
+    global CATALOG, LATENCY
+    import elasticsearch
+    import mysql.connector
+    import openai
+
+    CATALOG = Catalog(catalog_size, dims)
+    if latency is not None:
+        LATENCY = latency
+    openai.OpenAI = FakeOpenAI
+    elasticsearch.Elasticsearch = FakeElasticsearch
+    elasticsearch.NotFoundError = FakeNotFound
+    mysql.connector.connect = fake_connect
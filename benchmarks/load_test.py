@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Replay SearchRequests against the API at fixed concurrency levels, offline.
+
+The app runs in-process under uvicorn with the deterministic fakes from
+fakes.py instead of OpenAI, Elasticsearch and MySQL, so results only reflect
+our own code plus the simulated service latencies. For every concurrency level
+the script reports throughput, p50/p95/p99 latency and the mean time per stage
+(from the Server-Timing header), and can compare the run against a saved
+baseline.
+
+Usage (from the repository root):
+    python benchmarks/load_test.py --concurrency 1,4,16 --save-baseline benchmarks/baseline.json
+    python benchmarks/load_test.py --concurrency 1,4,16 --baseline benchmarks/baseline.json
+
+Exits with status 1 when a level regresses beyond --tolerance.
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+import fakes
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+DEFAULT_REQUESTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_requests.jsonl")
+
+
+def load_requests(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port):
+    """Import the app against the fakes and serve it from a background thread."""
+    import uvicorn
+
+    sys.path.insert(0, APP_DIR)
+    import main
+
+    class Server(uvicorn.Server):
+        def install_signal_handlers(self):
+            pass  # not in the main thread
+
+    server = Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return main, server, thread
+
+
+def parse_server_timing(header):
+    """{stage: ms} from `stage;dur=12.3, other;dur=4.5`."""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.startswith("dur="):
+            stages[name] = float(params[4:])
+    return stages
+
+
+def run_level(base_url, endpoint, search_requests, concurrency, rounds):
+    local = threading.local()
+
+    def send(body):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.post(base_url + endpoint, json=body, timeout=60)
+            response.content  # read streamed bodies completely
+            ok = response.status_code == 200
+            stages = parse_server_timing(response.headers.get("Server-Timing"))
+        except requests.RequestException:
+            ok, stages = False, {}
+        return time.perf_counter() - start, ok, stages
+
+    workload = search_requests * rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, workload))
+    wall = time.perf_counter() - start
+
+    latencies = np.array([seconds for seconds, ok, _ in results if ok]) * 1000
+    stage_totals = defaultdict(float)
+    for _, ok, stages in results:
+        for stage, ms in stages.items():
+            stage_totals[stage] += ms
+    succeeded = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - succeeded,
+        "throughput_rps": round(succeeded / wall, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if succeeded else None,
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1) if succeeded else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1) if succeeded else None,
+        "stages_mean_ms": {stage: round(total / max(succeeded, 1), 2) for stage, total in sorted(stage_totals.items())},
+    }
+
+
+def compare(levels, baseline, tolerance):
+    """Regression messages for levels whose p95 or throughput is worse than the baseline."""
+    regressions = []
+    base_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in levels:
+        base = base_levels.get(level["concurrency"])
+        if not base or level["p95_ms"] is None or base.get("p95_ms") is None:
+            continue
+        c = level["concurrency"]
+        if level["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"c={c}: p95 {level['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if level["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"c={c}: throughput {level['throughput_rps']} rps vs baseline {base['throughput_rps']} rps")
+        if level["errors"] > base.get("errors", 0):
+            regressions.append(f"c={c}: {level['errors']} errors vs baseline {base.get('errors', 0)}")
+    return regressions
+
+
+def print_level(level):
+    print(f"c={level['concurrency']:>3}  {level['throughput_rps']:>8} rps  "
+          f"p50 {level['p50_ms']}ms  p95 {level['p95_ms']}ms  p99 {level['p99_ms']}ms  "
+          f"errors {level['errors']}/{level['requests']}")
+    stages = ", ".join(f"{stage} {ms}ms" for stage, ms in level["stages_mean_ms"].items())
+    print(f"       stages: {stages or 'n/a'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the search API with local fakes")
+    parser.add_argument("--requests", default=DEFAULT_REQUESTS, help="JSONL file with one SearchRequest per line")
+    parser.add_argument("--endpoint", default="/search", help="POST endpoint to call (e.g. /search, /search/stream)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=3, help="How many times the request file is replayed per level")
+    parser.add_argument("--catalog-size", type=int, default=5000, help="Songs in the fake index / database")
+    parser.add_argument("--dims", type=int, default=int(os.getenv("EMBEDDING_DIMS", "1536")))
+    parser.add_argument("--embed-ms", type=float, default=80, help="Simulated OpenAI embeddings latency")
+    parser.add_argument("--chat-ms", type=float, default=300, help="Simulated keyword expansion latency")
+    parser.add_argument("--es-ms", type=float, default=20, help="Simulated Elasticsearch latency per call")
+    parser.add_argument("--mysql-ms", type=float, default=5, help="Simulated MySQL latency per connect / query")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Compare against a results JSON saved earlier")
+    parser.add_argument("--save-baseline", help="Save this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    os.environ["SERVER_TIMING"] = "true"
+    os.environ["EMBEDDING_DIMS"] = str(args.dims)
+    os.environ.setdefault("ELASTICSEARCH_HOST", "http://fake-elasticsearch:9200")
+    fakes.install(
+        catalog_size=args.catalog_size,
+        dims=args.dims,
+        latency=fakes.Latency(args.embed_ms / 1000, args.chat_ms / 1000, args.es_ms / 1000, args.mysql_ms / 1000),
+    )
+
+    search_requests = load_requests(args.requests)
+    if not search_requests:
+        sys.exit(f"No requests in {args.requests}")
+    port = free_port()
+    app_main, server, thread = start_app(port)
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"Replaying {len(search_requests)} requests x {args.rounds} rounds against {args.endpoint} "
+          f"(catalog {args.catalog_size} songs, {args.dims} dims)")
+
+    levels = []
+    try:
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            app_main.embed.cache_clear()  # every level starts cold
+            level = run_level(base_url, args.endpoint, search_requests, concurrency, args.rounds)
+            print_level(level)
+            levels.append(level)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    report = {
+        "endpoint": args.endpoint,
+        "requests_file": os.path.basename(args.requests),
+        "rounds": args.rounds,
+        "catalog_size": args.catalog_size,
+        "dims": args.dims,
+        "latency_ms": {"embed": args.embed_ms, "chat": args.chat_ms, "es": args.es_ms, "mysql": args.mysql_ms},
+        "levels": levels,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(levels, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Regressions against baseline:")
+            for message in regressions:
+                print(f"  - {message}")
+            sys.exit(1)
+        print("✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Microbenchmarks for the offline pipelines on synthetic catalogs.
+
+Stages (each timed separately, on the code the scripts actually run):
+  prompts        create_embeddings.build_prompts
+  clip           create_embeddings.clip_prompts (tiktoken, --max-tokens)
+  json_dumps / json_loads
+                 embedding (de)serialization as stored today (JSON text)
+  binary_dumps / binary_loads
+                 the same vectors as raw float32 bytes, for comparison
+  bulk_actions   build_songs_index.generate_actions
+  matching       link_matching.best_spotify_match over 10 candidates per song
+
+Every (catalog size, stage) pair runs in a fresh process so its peak RSS can be
+reported; "delta" is the peak added by the stage on top of the catalog itself.
+The slow stages run on the first --sample-rows songs of large catalogs and say
+so in the output; rows/s is what scales.
+
+Usage (from the repository root):
+    python benchmarks/pipelines.py --sizes 10000,100000,1000000
+    python benchmarks/pipelines.py --sizes 10000 --stages clip,matching --output pipelines.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "scripts")
+
+STAGES = ["prompts", "clip", "json_dumps", "json_loads", "binary_dumps", "binary_loads", "bulk_actions", "matching"]
+# Stages limited to --sample-rows songs (the others always use the whole catalog)
+SAMPLED_STAGES = {"clip", "json_dumps", "json_loads", "binary_dumps", "binary_loads", "matching"}
+
+WORDS = (
+    "love night heart dance summer rain fire dream baby girl time light road home blue moon star "
+    "city river sky party lonely happy sad chill energy drive morning midnight ocean wild young "
+    "forever gold broken memory freedom sunset storm yeah oh hold never let go tonight world"
+).split()
+DECORATIONS = ["", " - Remastered 2011", " (feat. Someone)", " - Single Version", " (Live)", " - Radio Edit"]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_catalog(size, dims, seed=7):
+    """Synthetic songs with the columns the pipelines read (distinct strings per row)."""
+    rng = np.random.default_rng(seed)
+    lines = [" ".join(rng.choice(WORDS, size=int(n))) for n in rng.integers(6, 12, size=2000)]
+    line_ids = rng.integers(0, len(lines), size=(size, 4))
+    titles = [" ".join(rng.choice(WORDS, size=3)).title() for _ in range(5000)]
+    artists = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}" for _ in range(2000)]
+    # A pool of unit vectors shared by all rows (real catalogs hold one list per row,
+    # so the catalog's own RSS understates embedding memory)
+    vectors = rng.standard_normal((256, dims)).astype(np.float32)
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).tolist()
+
+    song_ids = [f"{i:022d}" for i in range(size)]
+    return pd.DataFrame({
+        "song_id": song_ids,
+        "song_name": [titles[i % len(titles)] for i in range(size)],
+        "name_artists": [artists[i % len(artists)] for i in range(size)],
+        "billboard_info": [f"('Chart {i % 100}', {i % 52})" if i % 3 else "" for i in range(size)],
+        "lyrics": ["\n".join(lines[j] for j in row) + f"\n{song_id}" for row, song_id in zip(line_ids, song_ids)],
+        "popularity": rng.integers(0, 100, size=size),
+        "song_type": "Solo",
+        "artist_id": [f"artist{i % len(artists)}" for i in range(size)],
+        "artist_type": "singer",
+        "main_genre": "pop",
+        "genres": "['pop', 'dance pop']",
+        "image_url": "https://i.scdn.co/image/placeholder",
+        "spotify_url": [f"https://open.spotify.com/track/{song_id}" for song_id in song_ids],
+        "energy": rng.random(size),
+        "embedding": [vectors[i % len(vectors)] for i in range(size)],
+    })
+
+
+def spotify_candidates(title, artist, fillers, rng):
+    """10 search results: decorated variants of the song plus unrelated tracks."""
+    candidates = []
+    for i, (name, other_artist) in enumerate(fillers[j] for j in rng.integers(0, len(fillers), size=10)):
+        if i % 3 == 0:
+            name, other_artist = title + DECORATIONS[i % len(DECORATIONS)], artist
+        candidates.append({"name": name, "artists": [{"name": other_artist}], "album": {"name": name}})
+    return candidates
+
+
+def run_stage(stage, df, args):
+    """Run one stage on df; returns rows processed, or (rows, seconds) when setup is excluded from the timing."""
+    if stage == "prompts":
+        from create_embeddings import build_prompts
+        return len(build_prompts(df))
+
+    if stage == "clip":
+        import tiktoken
+        from create_embeddings import build_prompts, clip_prompts
+        enc = tiktoken.encoding_for_model(args.model)
+        prompts = build_prompts(df)
+        start = time.perf_counter()
+        clip_prompts(prompts, enc, args.max_tokens)
+        return len(prompts), time.perf_counter() - start  # excludes prompt building
+
+    vectors = df["embedding"].tolist()
+    if stage == "json_dumps":
+        return len([json.dumps(v) for v in vectors])
+    if stage == "json_loads":
+        encoded = [json.dumps(v) for v in vectors]
+        start = time.perf_counter()
+        decoded = [json.loads(s) for s in encoded]
+        return len(decoded), time.perf_counter() - start
+    if stage == "binary_dumps":
+        return len([np.asarray(v, dtype=np.float32).tobytes() for v in vectors])
+    if stage == "binary_loads":
+        encoded = [np.asarray(v, dtype=np.float32).tobytes() for v in vectors]
+        start = time.perf_counter()
+        decoded = [np.frombuffer(b, dtype=np.float32) for b in encoded]
+        return len(decoded), time.perf_counter() - start
+
+    if stage == "bulk_actions":
+        from build_songs_index import generate_actions
+        return len(list(generate_actions("bench", df, args.dims)))
+
+    if stage == "matching":
+        from link_matching import best_spotify_match
+        rng = np.random.default_rng(11)
+        fillers = [(" ".join(rng.choice(WORDS, size=3)).title(), f"{rng.choice(WORDS).title()} Band")
+                   for _ in range(5000)]
+        songs = list(zip(df["song_name"], df["name_artists"]))
+        pages = [spotify_candidates(title, artist, fillers, rng) for title, artist in songs]
+        start = time.perf_counter()
+        for (title, artist), candidates in zip(songs, pages):
+            best_spotify_match(candidates, title, artist)
+        return len(songs), time.perf_counter() - start
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def stage_worker(size, stage, args, queue):
+    sys.path.insert(0, SCRIPTS_DIR)
+    df = make_catalog(size, args.dims)
+    if stage in SAMPLED_STAGES and args.sample_rows and size > args.sample_rows:
+        df = df.head(args.sample_rows)
+    base_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    result = run_stage(stage, df, args)
+    elapsed = time.perf_counter() - start
+    rows, elapsed = result if isinstance(result, tuple) else (result, elapsed)
+
+    queue.put({
+        "catalog_size": size,
+        "stage": stage,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "delta_rss_mb": round(peak_rss_mb() - base_rss, 1),
+        "sampled": rows < size,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the offline pipeline stages on synthetic catalogs")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated catalog sizes")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {STAGES}")
+    parser.add_argument("--sample-rows", type=int, default=100000,
+                        help="Row limit for the slow stages (0 = whole catalog)")
+    parser.add_argument("--dims", type=int, default=int(os.getenv("EMBEDDING_DIMS", "1536")))
+    parser.add_argument("--model", default=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+                        help="Model whose tokenizer is used for clipping")
+    parser.add_argument("--max-tokens", type=int, default=512, help="Token limit used by the clip stage")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    print(f"{'size':>9}  {'stage':<13} {'rows':>9} {'seconds':>9} {'rows/s':>12} {'peak MB':>9} {'delta MB':>9}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for stage in stages:
+            queue = ctx.Queue()
+            process = ctx.Process(target=stage_worker, args=(size, stage, args, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{size:>9}  {stage:<13} failed (exit code {process.exitcode})")
+                continue
+            r = queue.get()
+            results.append(r)
+            note = " (sampled)" if r["sampled"] else ""
+            print(f"{size:>9}  {stage:<13} {r['rows']:>9} {r['seconds']:>9} {r['rows_per_s']:>12} "
+                  f"{r['peak_rss_mb']:>9} {r['delta_rss_mb']:>9}{note}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"dims": args.dims, "max_tokens": args.max_tokens, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
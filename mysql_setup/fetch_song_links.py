@@ -1,4 +1,5 @@
 import os
+import sys
 import base64
 import json
 import mysql.connector
@@ -9,6 +10,10 @@ from urllib.parse import quote
 import logging
 from datetime import datetime
 from ytmusicapi import YTMusic
+
+# Matching logic is shared with app/scripts/fetch_song_links.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app", "scripts"))
+from link_matching import best_spotify_match, best_youtube_match
 #conda install conda-forge::ytmusicapi
 
 
@@ -139,32 +144,9 @@ class MusicLinkCollector:
         return None
     
     def _find_best_spotify_match(self, tracks, song_name, artist_name=None):
-        """Find the best matching track from Spotify results"""
-        song_name_lower = song_name.lower().strip()
-        artist_name_lower = artist_name.lower().strip() if artist_name else None
-        
-        for track in tracks:
-            track_name_lower = track['name'].lower().strip()
-            track_artists = [artist['name'].lower().strip() for artist in track['artists']]
-            
-            # Check for exact song name match
-            if song_name_lower == track_name_lower:
-                if not artist_name_lower:
-                    return track
-                # Check if any artist matches
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in track_artists):
-                    return track
-            
-            # Check for partial song name match (for songs with features, remixes, etc.)
-            if song_name_lower in track_name_lower or track_name_lower in song_name_lower:
-                if not artist_name_lower:
-                    return track
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in track_artists):
-                    return track
-        
-        # If no good match, return the first result (most popular)
-        return tracks[0] if tracks else None
-            
+        """Find the best matching track from Spotify results (single scoring pass, see link_matching)"""
+        return best_spotify_match(tracks, song_name, artist_name)
+
     def search_youtube_music(self, song_name, artist_name=None):
         """Search for track on YouTube Music using ytmusicapi"""
         if not FETCH_YOUTUBE_MUSIC or not self.ytmusic:
@@ -191,35 +173,9 @@ class MusicLinkCollector:
         return None
     
     def _find_best_youtube_match(self, results, song_name, artist_name=None):
-        """Find the best matching track from YouTube Music results"""
-        song_name_lower = song_name.lower().strip()
-        artist_name_lower = artist_name.lower().strip() if artist_name else None
-        
-        for result in results:
-            if result.get('resultType') != 'song':
-                continue
-                
-            title_lower = result['title'].lower().strip()
-            result_artists = [artist['name'].lower().strip() for artist in result.get('artists', [])]
-            
-            # Check for exact song name match
-            if song_name_lower == title_lower:
-                if not artist_name_lower:
-                    return result
-                # Check if any artist matches
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in result_artists):
-                    return result
-            
-            # Check for partial match
-            if song_name_lower in title_lower or title_lower in song_name_lower:
-                if not artist_name_lower:
-                    return result
-                if any(artist_name_lower in artist or artist in artist_name_lower for artist in result_artists):
-                    return result
-        
-        # Return first result if no perfect match
-        return results[0] if results else None
-        
+        """Find the best matching track from YouTube Music results (single scoring pass, see link_matching)"""
+        return best_youtube_match(results, song_name, artist_name)
+
     def get_songs_from_db(self, limit=None):
         """Get songs from database"""
         if not self.db_connection:
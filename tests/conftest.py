@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The services are imported the way the app imports them (run from app/);
+# fakes.py lives with the benchmarks
+sys.path.insert(0, os.path.join(ROOT, "app"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+CATALOG_SIZE = 200
+DIMS = 8
+
+
+@pytest.fixture(scope="session")
+def fakes():
+    """benchmarks/fakes.py installed in place of OpenAI, Elasticsearch and MySQL.
+    Modules that build clients (services.search, main) must be imported after this."""
+    os.environ.setdefault("ELASTICSEARCH_HOST", "http://fake-elasticsearch:9200")
+    import fakes
+    fakes.install(catalog_size=CATALOG_SIZE, dims=DIMS, latency=fakes.Latency(0, 0, 0, 0))
+    return fakes
+
+
+@pytest.fixture
+def catalog(fakes):
+    """A fresh synthetic catalog for tests that change it."""
+    fakes.CATALOG = fakes.Catalog(CATALOG_SIZE, dims=DIMS)
+    return fakes.CATALOG
@@ -0,0 +1,107 @@
+"""UserScopedCache invalidation and SingleFlight coalescing."""
+import threading
+import time
+
+from services.cache import SingleFlight, UserScopedCache
+
+
+def test_returns_cached_value_until_invalidated():
+    cache = UserScopedCache("test", maxsize=16)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return len(loads)
+
+    assert cache.get_or_load("u1", ("a",), loader) == 1
+    assert cache.get_or_load("u1", ("a",), loader) == 1
+    cache.invalidate("u1")
+    assert cache.get_or_load("u1", ("a",), loader) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_invalidation_only_drops_that_user():
+    cache = UserScopedCache("test", maxsize=16)
+    cache.get_or_load("u1", ("a",), lambda: "u1")
+    cache.get_or_load("u2", ("a",), lambda: "u2")
+    cache.invalidate("u1")
+    assert cache.get_or_load("u2", ("a",), lambda: "reloaded") == "u2"
+    assert cache.get_or_load("u1", ("a",), lambda: "reloaded") == "reloaded"
+
+
+def test_load_overlapping_an_invalidation_is_not_cached():
+    cache = UserScopedCache("test", maxsize=16)
+
+    def stale_loader():
+        # A write commits and invalidates while this read is in progress
+        cache.invalidate("u1")
+        return "stale"
+
+    assert cache.get_or_load("u1", ("a",), stale_loader) == "stale"
+    assert cache.get_or_load("u1", ("a",), lambda: "fresh") == "fresh"
+    assert cache.get_or_load("u1", ("a",), lambda: "not called") == "fresh"
+
+
+def run_concurrently(flight, key, fn, callers):
+    """Start `callers` threads calling flight.do(key, fn); returns (threads, results)."""
+    results = [None] * callers
+
+    def call(i):
+        try:
+            results[i] = flight.do(key, fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_single_flight_runs_one_call_for_concurrent_callers():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    threads, results = run_concurrently(flight, "key", fn, 5)
+    wait_for(lambda: flight.coalesced == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["result"] * 5 and len(calls) == 1
+    # Finished calls are not reused
+    assert flight.do("key", lambda: "next") == "next"
+
+
+def test_single_flight_shares_the_error():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ValueError("failed")
+
+    threads, results = run_concurrently(flight, "key", fn, 3)
+    wait_for(lambda: flight.coalesced == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_single_flight_keys_are_independent():
+    flight = SingleFlight("test")
+    assert [flight.do(key, lambda key=key: key * 2) for key in (1, 2)] == [2, 4]
+    assert flight.coalesced == 0
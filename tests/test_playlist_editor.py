@@ -0,0 +1,165 @@
+"""edit_playlist against an in-memory stand-in for the playlist tables."""
+import re
+
+import pytest
+
+from services import playlists
+from services.playlists import POSITION_STEP, VersionConflict, edit_playlist
+
+PLAYLIST_ID = 7
+CATALOG = {f"song{i:018d}" for i in range(100)}
+
+
+def song(i):
+    return f"song{i:018d}"
+
+
+class FakePlaylistDB:
+    """Runs the statements edit_playlist issues. Like MySQL, an UPDATE that moves a
+    row onto an existing primary key fails, so the negated-position swap is exercised."""
+
+    def __init__(self, positions, version=1):
+        # position -> song_id
+        self.items = {position: song(i) for i, position in enumerate(positions)}
+        self.version = version
+        self.song_count = len(self.items)
+        self.committed = None
+
+    def cursor(self):
+        return FakePlaylistCursor(self)
+
+    def commit(self):
+        self.committed = dict(self.items)
+
+    def rollback(self):
+        pass
+
+    def order(self):
+        return [self.items[p] for p in sorted(self.items)]
+
+
+class FakePlaylistCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        db, params = self.db, list(params)
+        sql = " ".join(sql.split())
+        self.rows = []
+        if sql.startswith("SELECT id, version FROM playlists"):
+            self.rows = [(PLAYLIST_ID, db.version)]
+        elif sql.startswith("SELECT position FROM playlist_items"):
+            self.rows = [(p,) for p in sorted(db.items)]
+        elif sql.startswith("SELECT song_id FROM songs"):
+            self.rows = [(song_id,) for song_id in params if song_id in CATALOG]
+        elif sql.startswith("DELETE FROM playlist_items"):
+            for position in params[1:]:
+                db.items.pop(position, None)
+        elif sql.startswith("UPDATE playlist_items SET position = CASE"):
+            pairs = len(re.findall(r"WHEN %s THEN %s", sql))
+            targets = dict(zip(params[0:2 * pairs:2], params[1:2 * pairs:2]))
+            for old in sorted(p for p in db.items if p in targets):
+                self._move(old, targets[old])
+        elif sql.startswith("UPDATE playlist_items SET position = -position"):
+            for old in sorted(p for p in db.items if p < 0):
+                self._move(old, -old)
+        elif sql.startswith("INSERT INTO playlist_items"):
+            for i in range(0, len(params), 4):
+                _, position, song_id, snapshot = params[i:i + 4]
+                db.items[position] = song_id
+        elif sql.startswith("UPDATE playlists SET song_count"):
+            db.song_count = params[0]
+            db.version += 1
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def _move(self, old, new):
+        if new in self.db.items:
+            raise AssertionError(f"Duplicate entry for position {new}")
+        self.db.items[new] = self.db.items.pop(old)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(playlists, "invalidate_user", lambda user_id: None)
+
+
+def steps(n):
+    return [(i + 1) * POSITION_STEP for i in range(n)]
+
+
+def edit(db, *operations, expected_version=None):
+    return edit_playlist(db, "user", "mix", list(operations), expected_version=expected_version)
+
+
+def test_add_at_both_ends_and_in_the_middle():
+    db = FakePlaylistDB(steps(3))
+    version, count = edit(
+        db,
+        {"op": "add", "index": 0, "songs": [{"song_id": song(10)}]},
+        {"op": "add", "index": None, "songs": [{"song_id": song(11)}]},
+        {"op": "add", "index": 2, "songs": [{"song_id": song(12)}, {"song_id": song(13)}]},
+    )
+    assert db.order() == [song(10), song(0), song(12), song(13), song(1), song(2), song(11)]
+    assert (version, count) == (2, 7) and db.song_count == 7
+
+
+def test_remove_at_both_ends():
+    db = FakePlaylistDB(steps(5))
+    edit(db, {"op": "remove", "index": 0}, {"op": "remove", "index": 2, "count": 2})
+    assert db.order() == [song(1), song(2)]
+
+
+@pytest.mark.parametrize("operation", [
+    {"op": "remove", "index": 0, "count": -1},
+    {"op": "remove", "index": 0, "count": 0},
+    {"op": "remove", "index": 2, "count": 2},
+    {"op": "remove", "index": 3},
+    {"op": "add", "index": 4, "songs": [{"song_id": song(10)}]},
+    {"op": "move", "from_index": 0, "to_index": 3},
+])
+def test_out_of_range_operations_are_rejected(operation):
+    db = FakePlaylistDB(steps(3))
+    with pytest.raises(ValueError):
+        edit(db, operation)
+    assert db.committed is None and db.version == 1
+
+
+def test_move_to_both_ends():
+    db = FakePlaylistDB(steps(4))
+    edit(db, {"op": "move", "from_index": 0, "to_index": 3}, {"op": "move", "from_index": 2, "to_index": 0})
+    assert db.order() == [song(3), song(1), song(2), song(0)]
+
+
+def test_move_of_an_added_song():
+    db = FakePlaylistDB(steps(2))
+    edit(db, {"op": "add", "index": None, "songs": [{"song_id": song(10)}]},
+         {"op": "move", "from_index": 2, "to_index": 0})
+    assert db.order() == [song(10), song(0), song(1)]
+
+
+def test_renumbers_when_positions_run_out():
+    # No free position between 1024 and 1025; respacing moves 1025 onto 2048,
+    # which is still taken, so this only works with the negated-position swap
+    db = FakePlaylistDB([POSITION_STEP, POSITION_STEP + 1, 2 * POSITION_STEP])
+    edit(db, {"op": "add", "index": 1, "songs": [{"song_id": song(10)}]})
+    assert db.order() == [song(0), song(10), song(1), song(2)]
+    assert sorted(db.items) == [POSITION_STEP, POSITION_STEP + POSITION_STEP // 2, 2 * POSITION_STEP, 3 * POSITION_STEP]
+
+
+def test_version_conflict():
+    db = FakePlaylistDB(steps(2), version=5)
+    with pytest.raises(VersionConflict):
+        edit(db, {"op": "remove", "index": 0}, expected_version=4)
+    assert db.order() == [song(0), song(1)] and db.version == 5
+    assert edit(db, {"op": "remove", "index": 0}, expected_version=5) == (6, 1)
@@ -0,0 +1,57 @@
+"""CircuitBreaker state changes."""
+import pytest
+
+from services.resilience import CircuitBreaker, CircuitOpenError
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.call(lambda: "ok") == "ok"  # a success resets the count
+    trip(breaker)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "not called")
+
+
+def test_half_open_trial_closes_on_success():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0)
+    trip(breaker)
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()  # only one trial call at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_half_open_trial_reopens_on_any_error():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0)
+    trip(breaker)
+
+    def bad_row():
+        raise TypeError("unexpected row")
+
+    with pytest.raises(TypeError):
+        breaker.call(bad_row)
+    assert breaker.state == "open"
+
+
+def test_ignored_errors_do_not_count():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60, ignored_errors=(KeyError,))
+
+    def not_found():
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        breaker.call(not_found)
+    assert breaker.state == "closed"
@@ -0,0 +1,113 @@
+"""search_page cursors and point-in-time expiry, the kNN filter, and what
+coalesced searches report, against the fake OpenAI / Elasticsearch."""
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def search(fakes, catalog, monkeypatch):
+    from services import search
+    # Cursors of earlier tests must not leak into this one
+    monkeypatch.setattr(search, "cursor_store", search.SharedTTLCache("test_cursor", ttl_seconds=300))
+    return search
+
+
+POPULAR = [{"range": {"popularity": {"gte": 50}}}]
+
+
+def all_pages(search, size, filters=None):
+    pages, cursor = [], None
+    while True:
+        hits, cursor = search.search_page("summer night drive", size=size, filters=filters, cursor=cursor)
+        pages.append(hits)
+        if cursor is None:
+            return pages
+
+
+def song_ids(hits):
+    return [hit["_source"]["song_id"] for hit in hits]
+
+
+def test_pages_cover_the_results_once(search):
+    pages = all_pages(search, size=10)
+    ids = [song_id for page in pages for song_id in song_ids(page)]
+    assert len(pages) > 2 and all(len(page) == 10 for page in pages[:-1])
+    assert len(ids) == len(set(ids))
+
+
+def test_filters_apply_to_the_vector_candidates(search, catalog):
+    vec = search.query_vector("summer night drive")
+    candidates = search.vector_candidates(vec, depth=20, filters=POPULAR)
+    assert len(candidates) == 20
+    assert all(catalog.songs[catalog.by_id[song_id]]["popularity"] >= 50 for song_id in candidates)
+
+
+def test_filtered_pages_only_return_matching_songs(search, catalog):
+    for page in all_pages(search, size=10, filters=POPULAR):
+        assert all(hit["_source"]["popularity"] >= 50 for hit in page)
+
+
+def test_later_pages_keep_or_must_match_the_filters(search):
+    _, cursor = search.search_page("summer night drive", size=5, filters=POPULAR)
+    hits, _ = search.search_page(size=5, cursor=cursor)  # filters may be omitted
+    assert all(hit["_source"]["popularity"] >= 50 for hit in hits)
+    with pytest.raises(ValueError):
+        search.search_page(size=5, filters=[{"range": {"popularity": {"lte": 10}}}], cursor=cursor)
+
+
+def test_unknown_cursor_expires(search):
+    with pytest.raises(search.CursorExpired):
+        search.search_page(size=5, cursor="unknown")
+
+
+def test_cursor_expires_after_its_ttl(search, monkeypatch):
+    monkeypatch.setattr(search.cursor_store, "ttl_seconds", -1)
+    _, cursor = search.search_page("summer night drive", size=5)
+    with pytest.raises(search.CursorExpired):
+        search.search_page(size=5, cursor=cursor)
+
+
+def test_cursor_expires_with_its_point_in_time(search):
+    _, cursor = search.search_page("summer night drive", size=5)
+    search.get_es()._pits.clear()  # keep_alive ran out in Elasticsearch
+    with pytest.raises(search.CursorExpired):
+        search.search_page(size=5, cursor=cursor)
+
+
+def test_coalesced_searches_report_the_leaders_degradations_and_timings(search, monkeypatch):
+    from services.metrics import request_timings, timed
+    from services.resilience import degrade, request_degradations
+
+    release = threading.Event()
+
+    def slow_search(prompt, size, filters):
+        with timed("embed"):
+            release.wait(5)
+        degrade("no_keywords")
+        return ["hit"]
+
+    monkeypatch.setattr(search, "_search", slow_search)
+    flight = search.SingleFlight("test_search")
+    monkeypatch.setattr(search, "search_flights", flight)
+    reports = []
+
+    def request():
+        # Each thread is one request with its own context
+        timings, degradations = {}, []
+        request_timings.set(timings)
+        request_degradations.set(degradations)
+        hits = search.search("prompt", size=5)
+        reports.append((hits, sorted(timings), degradations))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.coalesced < 2 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert reports == [(["hit"], ["embed"], ["no_keywords"])] * 3
@@ -0,0 +1,63 @@
+"""Song store against the fake MySQL: the per-search fallback before the first
+load, lookups after it, and the version poll that reloads it."""
+import pytest
+
+
+@pytest.fixture
+def main(fakes):
+    import main
+    return main
+
+
+@pytest.fixture
+def store(main, catalog, monkeypatch):
+    """A fresh, unloaded store in place of main's."""
+    from services.song_store import SongStore
+
+    store = SongStore()
+    monkeypatch.setattr(main, "song_store", store)
+    return store
+
+
+def mysql_enrichment(fakes, song_ids):
+    from services.songs import get_song_enrichment
+    return get_song_enrichment(fakes.FakeConnection(), song_ids)
+
+
+def test_falls_back_to_mysql_before_the_first_load(main, store, fakes, catalog):
+    song_ids = [song["song_id"] for song in catalog.songs[:5]]
+    assert not store.loaded
+    assert main.get_song_data(song_ids) == mysql_enrichment(fakes, song_ids)
+
+
+def test_lookup_after_load_matches_mysql(main, store, fakes, catalog):
+    assert main.reload_song_store()
+    assert store.loaded and store.stats()["songs"] == len(catalog.songs)
+    song_ids = [song["song_id"] for song in catalog.songs[::7]]
+    assert main.get_song_data(song_ids + ["unknown"]) == mysql_enrichment(fakes, song_ids)
+
+
+def test_reloads_only_when_the_version_changes(main, store, fakes, catalog):
+    assert main.reload_song_store()
+    assert not store.refresh_if_changed(fakes.FakeConnection())
+    loaded = len(catalog.songs)
+
+    # A catalog load: one more song
+    new_song = dict(catalog.songs[0], song_id="n" * 22, energy=0.5)
+    catalog.by_id[new_song["song_id"]] = len(catalog.songs)
+    catalog.songs.append(new_song)
+
+    assert store.refresh_if_changed(fakes.FakeConnection())
+    assert store.stats()["songs"] == loaded + 1
+    assert store.lookup([new_song["song_id"]])[new_song["song_id"]]["energy"] == 0.5
+    assert not store.refresh_if_changed(fakes.FakeConnection())
+
+
+@pytest.mark.parametrize("field, value", [("energy", 0.25), ("release_date", "1999-12-31")])
+def test_reloads_when_only_a_field_changes(main, store, fakes, catalog, field, value):
+    assert main.reload_song_store()
+    song = catalog.songs[1]
+    song[field] = value
+
+    assert store.refresh_if_changed(fakes.FakeConnection())
+    assert store.lookup([song["song_id"]])[song["song_id"]][field] == value